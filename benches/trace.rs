@@ -0,0 +1,110 @@
+// Tracer throughput: rays per second through a fixed, seeded scene of about a
+// hundred spheres of all three materials plus a cuboid, traced against a flat
+// HittableList (every object tested per ray) and against the Bvh, one ray at a
+// time in f64 and with camera rays in f32 packets (Camera::render_pixels_packets).
+//
+// Rays are counted once with RenderStats, then the uninstrumented renders are timed,
+// best of --runs. The packet image is compared with the f64 one as 8-bit pixels.
+// Compare the output of two checkouts to measure a change.
+//
+// Usage:
+//     cargo bench --bench trace [-- --runs 5 --width 320 --spp 16 --depth 50]
+//
+// --depth 1 stops at the first hit, timing the camera rays packets speed up on their own.
+use glam::DVec3;
+use rand::{rngs::SmallRng, Rng, SeedableRng};
+use std::{env, hint::black_box, time::Instant};
+use three_dev::renderer::{create_cuboid, Bvh, Camera, Dielectric, Hittable, HittableList, Lambertian, Metal, RenderStats, Sphere};
+
+fn scene() -> HittableList {
+    let mut world = HittableList::new();
+    let mut rng = SmallRng::seed_from_u64(7);
+    let ground = world.add_material(Lambertian::new(DVec3::splat(0.5)));
+    world.add(Sphere { center: DVec3::new(0.0, -1000.0, 0.0), radius: 1000.0, material: ground });
+
+    for a in -5..5 {
+        for b in -5..5 {
+            let center = DVec3::new(a as f64 * 2.0 + 1.6 * rng.random::<f64>(), 0.2, b as f64 * 2.0 + 1.6 * rng.random::<f64>());
+            let choice: f64 = rng.random();
+            let material = if choice < 0.7 {
+                world.add_material(Lambertian::new(DVec3::new(rng.random(), rng.random(), rng.random())))
+            } else if choice < 0.9 {
+                world.add_material(Metal::new(DVec3::new(rng.random(), rng.random(), rng.random()), rng.random_range(0.0..0.5)))
+            } else {
+                world.add_material(Dielectric { albedo: DVec3::ONE, refractive_index: 1.5 })
+            };
+            world.add(Sphere { center, radius: 0.2, material });
+        }
+    }
+
+    let glass = world.add_material(Dielectric { albedo: DVec3::ONE, refractive_index: 1.5 });
+    let brown = world.add_material(Lambertian::new(DVec3::new(0.4, 0.2, 0.1)));
+    let mirror = world.add_material(Metal::new(DVec3::new(0.7, 0.6, 0.5), 0.0));
+    let green = world.add_material(Lambertian::new(DVec3::new(0.1, 0.7, 0.1)));
+    world.add(Sphere { center: DVec3::new(0.0, 1.0, 0.0), radius: 1.0, material: glass });
+    world.add(Sphere { center: DVec3::new(-4.0, 1.0, 0.0), radius: 1.0, material: brown });
+    world.add(Sphere { center: DVec3::new(4.0, 1.0, 0.0), radius: 1.0, material: mirror });
+    create_cuboid(DVec3::new(-1.5, 0.75, 2.5), DVec3::new(1.5, 1.5, 1.5), green, &mut world);
+    world
+}
+
+// Best of `runs` timings of a render, and its pixels
+fn time(runs: u32, render: impl Fn() -> Vec<DVec3>) -> (f64, Vec<DVec3>) {
+    let mut best = f64::INFINITY;
+    let mut pixels = vec![];
+    for _ in 0..runs {
+        let start = Instant::now();
+        pixels = black_box(render());
+        best = best.min(start.elapsed().as_secs_f64());
+    }
+    (best, pixels)
+}
+
+// As Camera::render writes them: averaged, gamma 2, 8 bits
+fn display(pixels: &[DVec3], samples: u32) -> Vec<u8> {
+    pixels
+        .iter()
+        .flat_map(|color| (*color / samples as f64).to_array())
+        .map(|value| (value.sqrt().clamp(0.0, 0.999) * 256.0) as u8)
+        .collect()
+}
+
+fn measure<T: Hittable>(name: &str, world: &T, camera: &Camera, runs: u32) {
+    let mut stats = RenderStats::new(camera.max_depth());
+    camera.render_pixels(world, Some(&mut stats));
+    let rays = stats.primary_rays + stats.secondary_rays + stats.shadow_rays;
+
+    let (single, reference) = time(runs, || camera.render_pixels(world, None));
+    let (packets, packed) = time(runs, || camera.render_pixels_packets(world));
+    println!("{name:<5} {rays:>10} rays  f64 {single:7.3}s {:>6.2} Mrays/s  packets {packets:7.3}s {:>6.2} Mrays/s  {:.2}x",
+             rays as f64 / single / 1e6, rays as f64 / packets / 1e6, single / packets);
+
+    // Same random numbers on both paths, so differences are f32 choosing another primitive
+    let (a, b) = (display(&reference, camera.samples_per_pixel()), display(&packed, camera.samples_per_pixel()));
+    let differing = a.chunks(3).zip(b.chunks(3)).filter(|(a, b)| a != b).count();
+    let largest = a.iter().zip(&b).map(|(a, b)| a.abs_diff(*b)).max().unwrap_or(0);
+    let squared: f64 = a.iter().zip(&b).map(|(a, b)| (*a as f64 - *b as f64).powi(2)).sum();
+    println!("      image difference: {:.3}% of pixels, largest {largest}/255, RMS {:.3}/255",
+             100.0 * differing as f64 / (a.len() / 3) as f64, (squared / a.len() as f64).sqrt());
+}
+
+fn main() {
+    // `cargo bench` passes --bench; everything else is ours
+    let mut options = [("--runs", 5u32), ("--width", 320), ("--spp", 16), ("--depth", 50)];
+    let args: Vec<String> = env::args().skip(1).collect();
+    for pair in args.windows(2) {
+        if let Some(option) = options.iter_mut().find(|(name, _)| *name == pair[0]) {
+            option.1 = pair[1].parse().expect("options take a whole number");
+        }
+    }
+    let [(_, runs), (_, width), (_, spp), (_, depth)] = options;
+
+    let camera = Camera::new(width, 16.0 / 9.0, spp, depth, DVec3::new(13.0, 2.0, 3.0), DVec3::ZERO, DVec3::Y, 10.0, 0.1)
+        .with_seed(1);
+    measure("list", &scene(), &camera, runs);
+
+    let world = scene();
+    let mut bvh = Bvh::new((0..).zip(world.objects));
+    bvh.set_materials(world.materials);
+    measure("bvh", &bvh, &camera, runs);
+}
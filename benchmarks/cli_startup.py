@@ -0,0 +1,70 @@
+"""
+Measures how long the `three-dev render` command takes to reach the render:
+interpreter start, imports, reading the scene and the user's preferences and
+building the camera, everything --dry-run does before it would start tracing.
+
+Fails if the median exceeds the budget, or if the command pulled in Tk or PIL.
+
+Usage:
+    python benchmarks/cli_startup.py [--runs 20] [--budget-ms 100]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from three_dev import write_scene
+
+from scenes import demo_scene
+
+# Run in the child after the command: any of these means the UI stack was imported
+CHECK_MODULES = "import sys; print('ui:', *(m for m in ('tkinter', 'customtkinter', 'PIL') if m in sys.modules))"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        scene = Path(folder) / "demo.3dv"
+        write_scene(demo_scene(), scene)
+        command = [sys.executable, "-m", "three_dev", "render", str(scene), "-o", str(Path(folder) / "out.png"),
+                   "--dry-run"]
+
+        times = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            times.append((time.perf_counter() - started) * 1000)
+
+        baseline = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "import numpy"], check=True)
+            baseline.append((time.perf_counter() - started) * 1000)
+
+        imported = subprocess.run(
+            [sys.executable, "-c", f"from three_dev.cli import main; main({command[3:]!r}); {CHECK_MODULES}"],
+            check=True, capture_output=True, text=True
+        ).stdout.splitlines()[-1].split()[1:]
+
+    median = statistics.median(times)
+    print(f"three-dev render --dry-run: median {median:.1f} ms, min {min(times):.1f} ms over {args.runs} runs")
+    print(f"python -c 'import numpy':   median {statistics.median(baseline):.1f} ms")
+    failed = False
+    if imported:
+        print(f"FAIL: imported {', '.join(imported)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
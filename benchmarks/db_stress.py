@@ -0,0 +1,142 @@
+"""
+Hammers one SQLite database from many processes at once, the way the UI, the
+asset indexer and render workers share 3Dev.db, and checks that nobody sees
+"database is locked" and that concurrent writes all land.
+
+Each process mixes reads of the gallery, project and history queries with
+writes of render history, assets, render preferences and versions on one
+shared branch; every fourth process is a read-only worker. At the end the
+version chain is checked: concurrent saves on the branch must each have taken
+a different parent.
+
+Usage:
+    python benchmarks/db_stress.py [--processes 16] [--seconds 10] [--database /tmp/stress.db]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "python"))
+
+from data_management.data_manager import DataManager
+
+STATS = {"primary_rays": 1000, "secondary_rays": 500, "intersection_tests": 9000, "seconds": 0.5}
+
+def setup(path: str) -> None:
+    db = DataManager(path)
+    user_id = db.add_user("stress", "x")
+    db.add_project(user_id, "Stress", "1.0.0")
+
+def worker(path: str, index: int, seconds: float, results: "multiprocessing.Queue") -> None:
+    readonly = index % 4 == 3
+    db = DataManager(path, readonly=readonly)
+    user = db.get_user_section("stress", "security")
+    user_id = user["user_id"]
+    project = db.get_projects(user_id)[0]
+    branch_id = db.get_branches(project["project_id"])[0]["branch_id"]
+    rng = random.Random(index)
+
+    reads = writes = versions = 0
+    latencies = []
+    errors = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        choice = rng.random()
+        started = time.perf_counter()
+        try:
+            if readonly or choice < 0.6:
+                query = rng.randrange(4)
+                if query == 0:
+                    db.get_assets_page(user_id, limit=50)
+                elif query == 1:
+                    db.get_projects(user_id)
+                elif query == 2:
+                    db.get_render_history(user_id)
+                else:
+                    db.get_user_section("stress", "render")
+                reads += 1
+            else:
+                write = rng.randrange(4)
+                if write == 0:
+                    db.add_render_history(user_id, {"render_name": f"w{index}"}, STATS)
+                elif write == 1:
+                    name = f"{index}-{writes}"
+                    db.apply_asset_changes(user_id, [{
+                        "name": name, "category": "textures", "path": f"/stress/{name}.png",
+                        "byte_size": 1024, "content_hash": os.urandom(16).hex()
+                    }], [], [])
+                elif write == 2:
+                    db.update_render_preferences(user_id, samples_per_pixel=rng.randrange(1, 1000))
+                else:
+                    db.add_version(branch_id, f"{index}.{versions}")
+                    versions += 1
+                writes += 1
+        except sqlite3.Error as e:
+            errors[str(e)] = errors.get(str(e), 0) + 1
+        latencies.append(time.perf_counter() - started)
+    results.put((index, readonly, reads, writes, versions, sorted(latencies), errors))
+
+def check_versions(path: str, expected: int) -> list:
+    # Versions on the shared branch must form one chain: no two share a parent
+    with DataManager(path, readonly=True).connect() as conn:
+        rows = conn.execute("SELECT version_id, parent_id FROM versions ORDER BY version_id").fetchall()
+    problems = []
+    if len(rows) != expected + 1:
+        problems.append(f"expected {expected + 1} versions, found {len(rows)}")
+    parents = [row["parent_id"] for row in rows]
+    if len(set(parents)) != len(parents):
+        problems.append(f"{len(parents) - len(set(parents))} versions share a parent")
+    return problems
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--database", help="database file to create; a temporary one by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = args.database or os.path.join(folder, "stress.db")
+        setup(path)
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(path, index, args.seconds, results))
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        errors = {}
+        for index, readonly, reads, writes, versions, latencies, process_errors in sorted(outcomes):
+            p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+            print(f"process {index:2d} {'ro' if readonly else 'rw'}: {reads:6d} reads {writes:5d} writes  "
+                  f"p99 {p99 * 1000:7.1f} ms")
+            for message, count in process_errors.items():
+                errors[message] = errors.get(message, 0) + count
+
+        reads = sum(outcome[2] for outcome in outcomes)
+        writes = sum(outcome[3] for outcome in outcomes)
+        print(f"total: {reads / args.seconds:.0f} reads/s, {writes / args.seconds:.0f} writes/s")
+
+        problems = [f"{count} x {message}" for message, count in errors.items()]
+        problems += check_versions(path, sum(outcome[4] for outcome in outcomes))
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        if problems:
+            sys.exit(1)
+        print("OK: no lock errors, every write landed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the 100 spp default against a 16 spp render plus à-trous denoising.
+
+Both are scored against a high-spp reference by RMSE on the gamma-corrected
+image (the same sqrt gamma save_ppm applies), alongside their wall-clock time.
+
+Usage:
+    python benchmarks/denoise_benchmark.py [--width 320] [--reference-spp 1024]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from three_dev import _core
+from three_dev.denoise import denoise_framebuffer
+from three_dev.render import build_world, render
+
+from scenes import LOOK_AT, LOOK_FROM, demo_scene
+
+def display(image: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.clip(image, 0.0, 1.0))
+
+def rmse(image: np.ndarray, reference: np.ndarray) -> float:
+    return float(np.sqrt(np.mean((display(image) - display(reference)) ** 2)))
+
+def camera(width: int, samples_per_pixel: int) -> _core.Camera:
+    return _core.Camera(
+        image_width=width,
+        aspect_ratio=16 / 9,
+        samples_per_pixel=samples_per_pixel,
+        max_depth=50,
+        look_from=LOOK_FROM,
+        look_at=LOOK_AT,
+        focus_distance=10.0,
+        aperture=0.1
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--reference-spp", type=int, default=1024)
+    args = parser.parse_args()
+
+    scene = demo_scene()
+    world = build_world(scene)
+
+    print(f"Rendering {args.reference_spp} spp reference at width {args.width}...")
+    reference = render(scene, camera(args.width, args.reference_spp), world=world).mean()
+
+    start = time.perf_counter()
+    baseline = render(scene, camera(args.width, 100), world=world).mean()
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    framebuffer = render(scene, camera(args.width, 16), world=world, aux=True)
+    render_time = time.perf_counter() - start
+    start = time.perf_counter()
+    denoised = denoise_framebuffer(framebuffer)
+    denoise_time = time.perf_counter() - start
+    noisy = framebuffer.mean()
+
+    print(f"{'mode':<20}{'time (s)':>10}{'RMSE':>10}")
+    print(f"{'100 spp':<20}{baseline_time:>10.2f}{rmse(baseline, reference):>10.4f}")
+    print(f"{'16 spp':<20}{render_time:>10.2f}{rmse(noisy, reference):>10.4f}")
+    print(f"{'16 spp + denoise':<20}{render_time + denoise_time:>10.2f}{rmse(denoised, reference):>10.4f}")
+    print(f"Speed-up vs 100 spp: {baseline_time / (render_time + denoise_time):.1f}x "
+          f"(denoise {denoise_time:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Benchmark scenes built with the columnar scene API.
+"""
+from pathlib import Path
+
+from three_dev import Scene
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Camera used by src/main.rs
+LOOK_FROM = (13.0, 2.0, 3.0)
+LOOK_AT = (0.0, 0.0, 0.0)
+
+def demo_scene() -> Scene:
+    """
+    The scene rendered by src/main.rs: ground, glass, metal, textured and fuzzy
+    spheres, a background quad and a cuboid.
+    """
+    scene = Scene()
+    ground = scene.add_lambertian((0.5, 0.5, 0.5))
+    red = scene.add_lambertian((0.7, 0.1, 0.1))
+    earth = scene.add_lambertian(texture=str(ROOT / "earth.jpg"))
+    smooth = scene.add_metal((0.8, 0.8, 0.9), 0.0)
+    fuzzy = scene.add_metal((0.8, 0.6, 0.2), 0.6)
+    glass = scene.add_dielectric(1.5)
+    hollow = scene.add_dielectric(-1.5)
+    green = scene.add_lambertian((0.1, 0.7, 0.1))
+
+    scene.add_sphere((0.0, -1000.0, 0.0), 1000.0, ground)
+    scene.add_sphere((0.0, 1.0, 0.0), 1.0, smooth)
+    scene.add_sphere((-4.0, 1.0, 0.0), 1.0, glass)
+    scene.add_sphere((-4.0, 1.0, 0.0), -0.9, hollow)
+    scene.add_sphere((4.0, 1.0, 0.0), 1.0, earth)
+    scene.add_sphere((2.0, 0.5, 2.0), 0.5, fuzzy)
+    scene.add_quad((-2.0, 0.01, -3.0), (4.0, 0.0, 0.0), (0.0, 4.0, 0.0), red)
+    scene.add_cuboid((-1.5, 0.75, 2.5), (1.5, 1.5, 1.5), green)
+    return scene
@@ -0,0 +1,269 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .asset_manager import CATEGORIES, AssetManager, describe_file, make_thumbnail
+from .database import get_asset_dir
+
+# inotify(7) event bits
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+# (inode, byte_size, mtime_ns): a file whose identity is unchanged is not rehashed
+Signature = Tuple[int, int, int]
+
+class _Inotify:
+    """
+    A minimal inotify watch on a set of directories, through libc.
+    """
+
+    def __init__(self, directories: List[Path]):
+        """
+        Raises:
+            OSError: If inotify is unavailable, e.g. off Linux or out of watches.
+        """
+        name = ctypes.util.find_library("c")
+        if name is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Path] = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"inotify_add_watch failed for {directory}")
+            self.watches[wd] = directory
+
+    def wait(self, timeout: float) -> Set[Path]:
+        """
+        Waits up to `timeout` seconds for events.
+
+        Returns:
+            Set[Path]: The watched directories something happened in; all of them if
+            the kernel's event queue overflowed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return set(self.watches.values())
+                if wd in self.watches:
+                    changed.add(self.watches[wd])
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class AssetIndexer:
+    """
+    Keeps the assets table in step with files added to, removed from or renamed in
+    the user's asset folders from outside the app.
+
+    Each folder is compared against the table by (inode, size, mtime); only files
+    whose identity changed are read and hashed, and a file that reappears under a
+    new name with the same identity or contents is treated as a rename rather than
+    a removal and an import. Folders are rescanned when inotify reports a change,
+    or swept every `interval` seconds where inotify is unavailable.
+    """
+
+    def __init__(self, asset_manager: AssetManager, interval: float = 5.0,
+                 settle: float = 0.5, batch_size: int = 64):
+        """
+        Parameters:
+            asset_manager (AssetManager): The user's asset manager, whose lock imports hold.
+            interval (float): Seconds between stat sweeps without inotify.
+            settle (float): Seconds of quiet to wait for after an event, so a burst
+                of changes, e.g. a folder copied in, is indexed as one rescan.
+            batch_size (int): Files hashed and written to the table per transaction.
+        """
+        self.asset_manager = asset_manager
+        self.interval = interval
+        self.settle = settle
+        self.batch_size = batch_size
+        self.directories = {
+            get_asset_dir(asset_manager.username, category): category
+            for category in CATEGORIES.values()
+        }
+        # Incremented after each rescan that changed the table, for the UI to poll
+        self.generation = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Starts indexing in a background thread, beginning with a full rescan.
+        """
+        if self._thread is None and self.asset_manager.user_id is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        try:
+            watch = _Inotify(list(self.directories))
+        except OSError:
+            watch = None
+
+        try:
+            self.rescan()
+            while not self._stop.is_set():
+                if watch is None:
+                    self._stop.wait(self.interval)
+                    self.rescan()
+                    continue
+                # Wake at least once a second to notice stop()
+                changed = watch.wait(1.0)
+                if not changed:
+                    continue
+                while more := watch.wait(self.settle):
+                    changed |= more
+                self.rescan([self.directories[directory] for directory in changed])
+        finally:
+            if watch is not None:
+                watch.close()
+
+    def _list(self, categories: List[str]) -> Dict[str, Tuple[str, Signature]]:
+        files = {}
+        for directory, category in self.directories.items():
+            if category not in categories:
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Dot files are partial copies and editor temporaries
+                    if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    files[entry.path] = (category, (stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return files
+
+    def rescan(self, categories: Optional[List[str]] = None) -> bool:
+        """
+        Brings the table up to date with the asset folders of some categories.
+
+        Parameters:
+            categories (Optional[List[str]]): Categories to rescan; all if None.
+
+        Returns:
+            bool: Whether anything changed.
+        """
+        categories = list(CATEGORIES.values()) if categories is None else categories
+        manager = self.asset_manager
+        # The lock is held while listing and writing the table, so an import is either
+        # wholly seen or not at all, but not while hashing, so imports are not held up
+        with manager.lock:
+            files = self._list(categories)
+            known = {row['path']: row for row in manager.db.get_asset_index(manager.user_id, categories)}
+
+            gone = {path: row for path, row in known.items() if path not in files}
+            new = [path for path in files if path not in known]
+            changed = [
+                path for path in files
+                if path in known and files[path][1] != (known[path]['inode'], known[path]['byte_size'], known[path]['mtime_ns'])
+            ]
+
+            # A rename keeps the inode and mtime, so it is matched without reading the file
+            gone_by_signature = {
+                (row['inode'], row['byte_size'], row['mtime_ns']): row for row in gone.values()
+            }
+            updated: List[Dict] = []
+            unmatched = []
+            for path in new:
+                category, signature = files[path]
+                row = gone_by_signature.pop(signature, None)
+                if row is None:
+                    unmatched.append(path)
+                    continue
+                del gone[row['path']]
+                updated.append({'asset_id': row['asset_id'], **self._location(path, category)})
+
+            # Removals wait until the new files are hashed, unless there are none to hash
+            to_hash = unmatched + changed
+            removed = [] if to_hash else [row['asset_id'] for row in gone.values()]
+            if updated or removed:
+                manager.db.apply_asset_changes(manager.user_id, [], updated, removed)
+                gone = {} if removed else gone
+            applied = bool(updated or removed)
+
+        # Files imported meanwhile were not listed, and a path inserted by both is only
+        # added once, as the table's paths are unique
+        for start in range(0, len(to_hash), self.batch_size):
+            added, updated = self._describe(to_hash[start:start + self.batch_size], files, known, gone)
+            with manager.lock:
+                manager.db.apply_asset_changes(manager.user_id, added, updated, [])
+            applied = applied or bool(added or updated)
+
+        # Whatever was not matched to a new file by identity or contents was deleted
+        if gone:
+            with manager.lock:
+                manager.db.apply_asset_changes(manager.user_id, [], [], [row['asset_id'] for row in gone.values()])
+            applied = True
+
+        if applied:
+            self.generation += 1
+        return applied
+
+    def _location(self, path: str, category: str) -> Dict:
+        return {'path': path, 'name': Path(path).stem, 'category': category}
+
+    def _describe(self, paths: List[str], files: Dict[str, Tuple[str, Signature]],
+                  known: Dict[str, Dict], gone: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict]]:
+        # Hashes a batch of new or modified files; a new file with the contents of a
+        # deleted one, e.g. moved in from another file system, takes over its row
+        gone_by_hash = {row['content_hash']: row for row in gone.values()}
+        added, updated = [], []
+        for path in paths:
+            category = files[path][0]
+            try:
+                description = describe_file(Path(path))
+            except FileNotFoundError:
+                continue
+            make_thumbnail(Path(path), description['content_hash'])
+
+            if path in known:
+                updated.append({'asset_id': known[path]['asset_id'], **description})
+                continue
+            row = gone_by_hash.pop(description['content_hash'], None)
+            if row is not None:
+                del gone[row['path']]
+                updated.append({'asset_id': row['asset_id'], **self._location(path, category), **description})
+                continue
+            added.append({**self._location(path, category), **description})
+        return added, updated
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .database import get_asset_dir, get_db, get_thumbnail_dir
+
+# Gallery tab labels and the category names stored in the assets table
+CATEGORIES = {
+    "Textures": "textures",
+    "Backgrounds": "backgrounds"
+}
+
+# Bounding box of the gallery card thumbnails
+THUMBNAIL_SIZE = (320, 200)
+
+def describe_file(path: Path, content_hash: Optional[str] = None) -> Dict:
+    """
+    Reads the metadata the assets table stores for a file.
+
+    Parameters:
+        path (Path): The file to describe.
+        content_hash (Optional[str]): The file's SHA-256 if it is already known, e.g.
+            verified while the file was written, so the contents are not read again.
+
+    Returns:
+        Dict: byte_size, content_hash, inode, mtime_ns and, for images, width and height.
+    """
+    stat = path.stat()
+    if content_hash is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+
+    # Image.open only parses the header, so this does not decode the pixels
+    width = height = None
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        pass
+
+    return {
+        "byte_size": stat.st_size,
+        "content_hash": content_hash,
+        "width": width,
+        "height": height,
+        "inode": stat.st_ino,
+        "mtime_ns": stat.st_mtime_ns
+    }
+
+def thumbnail_path(content_hash: str) -> Path:
+    """
+    Returns where the thumbnail for a file with this content hash is cached.
+    """
+    return get_thumbnail_dir() / content_hash[:2] / f"{content_hash}.png"
+
+def make_thumbnail(path: Path, content_hash: str) -> Optional[Path]:
+    """
+    Caches a thumbnail of an image file, unless one for the same contents already exists.
+
+    Parameters:
+        path (Path): The image file.
+        content_hash (str): Its content hash, which names the thumbnail.
+
+    Returns:
+        Optional[Path]: The thumbnail, or None if PIL cannot read the file.
+    """
+    target = thumbnail_path(content_hash)
+    if target.exists():
+        return target
+    try:
+        with Image.open(path) as image:
+            # draft() lets JPEGs decode straight at a reduced scale
+            image.draft("RGB", THUMBNAIL_SIZE)
+            image.thumbnail(THUMBNAIL_SIZE)
+            thumbnail = image.convert("RGB")
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+    # Written under a temporary name so a reader never sees a partial thumbnail
+    target.parent.mkdir(exist_ok=True)
+    partial = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}")
+    thumbnail.save(partial, "PNG")
+    os.replace(partial, target)
+    return target
+
+class AssetManager:
+    """
+    Provides an interface for importing assets and browsing their metadata.
+    """
+
+    def __init__(self, username: str):
+        """
+        Initializes the AssetManager for a user.
+
+        Parameters:
+            username (str): The user whose assets are managed.
+        """
+        self.db = get_db()
+        self.username = username
+        user = self.db.get_user_section(username, 'security')
+        self.user_id: Optional[int] = user['user_id'] if user else None
+        # Held while files are copied in or indexed, so the indexer never sees an import half done
+        self.lock = threading.Lock()
+
+    def import_file(self, source: str, category: str) -> Optional[int]:
+        """
+        Copies a file into the user's asset folder for a category and records it.
+
+        Parameters:
+            source (str): The file to import.
+            category (str): The category to import it into, e.g. 'textures'.
+
+        Returns:
+            Optional[int]: The new asset_id, or None if the user does not exist or the file is already there.
+        """
+        if self.user_id is None:
+            return None
+        source_path = Path(source)
+        target = get_asset_dir(self.username, category) / source_path.name
+        with self.lock:
+            if target.exists():
+                return None
+            shutil.copy2(source_path, target)
+            description = describe_file(target)
+            make_thumbnail(target, description["content_hash"])
+            return self.db.add_asset(
+                self.user_id, source_path.stem, category, str(target), **description
+            )
+
+    def page(self, category: Optional[str] = None, after: Optional[Tuple[str, int]] = None,
+             limit: int = 12) -> List[Dict]:
+        """
+        Retrieves one page of the user's assets, newest first.
+
+        Parameters:
+            category (Optional[str]): Only list this category; all categories if None.
+            after (Optional[Tuple[str, int]]): The cursor of the previous page, see cursor().
+            limit (int): Page size.
+
+        Returns:
+            List[Dict]: Up to `limit` asset rows.
+        """
+        if self.user_id is None:
+            return []
+        return self.db.get_assets_page(self.user_id, category, after, limit)
+
+    @staticmethod
+    def cursor(page: List[Dict]) -> Optional[Tuple[str, int]]:
+        """
+        Returns the keyset cursor that continues after a page, or None for an empty page.
+        """
+        if not page:
+            return None
+        return page[-1]['imported_at'], page[-1]['asset_id']
@@ -0,0 +1,431 @@
+import hashlib
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .asset_manager import describe_file, make_thumbnail
+from .database import get_asset_dir, get_db, get_project_dir, safe_name
+
+# Bundle layout:
+#   MAGIC | u32 manifest length | manifest JSON | entries | u32 0
+#   entry: u32 header length | header JSON {"file", "size"} | chunks | end chunk | SHA-256 of the file
+#   chunk: u32 raw length | u32 stored length | u8 method | stored bytes; the end chunk is all zeros
+# Files are split into CHUNK_SIZE chunks that are compressed independently, so a
+# thread pool can compress or decompress several at once while the file streams.
+MAGIC = b"3DEVBDL\0"
+FORMAT = 1
+LENGTH = struct.Struct("<I")
+CHUNK = struct.Struct("<IIB")
+DIGEST_SIZE = 32
+CHUNK_SIZE = 1 << 20
+# Largest a deflated CHUNK_SIZE chunk can be (zlib's deflateBound with room to spare),
+# so a corrupt stored length is caught before it is read
+MAX_STORED_SIZE = CHUNK_SIZE + (CHUNK_SIZE >> 12) + 64
+STORED = 0
+DEFLATED = 1
+BUNDLE_EXTENSION = ".3dev"
+
+def _compress(chunk: bytes) -> Tuple[int, int, bytes]:
+    # Already compressed files (PNG, JPEG, EXR) are stored as they are
+    data = zlib.compress(chunk, 6)
+    if len(data) >= len(chunk):
+        return len(chunk), STORED, chunk
+    return len(chunk), DEFLATED, data
+
+def _decompress(chunk: Tuple[int, int, bytes]) -> bytes:
+    raw_length, method, data = chunk
+    if method == STORED:
+        if len(data) != raw_length:
+            raise ValueError("bundle chunk has the wrong length")
+        return data
+    # max_length bounds the output, so a corrupt chunk cannot expand without limit
+    decompressor = zlib.decompressobj()
+    try:
+        raw = decompressor.decompress(data, raw_length)
+    except zlib.error as e:
+        raise ValueError(f"bundle chunk is corrupt: {e}") from e
+    if len(raw) != raw_length or not decompressor.eof:
+        raise ValueError("bundle chunk is corrupt")
+    return raw
+
+def _ordered(pool: ThreadPoolExecutor, function: Callable, items: Iterable, depth: int) -> Iterator:
+    # Maps function over items on the pool, yielding results in order with at most
+    # `depth` items in flight, which bounds the memory held however large the file
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _read_exactly(source: BinaryIO, count: int) -> bytes:
+    data = source.read(count)
+    if len(data) != count:
+        raise ValueError("bundle is truncated")
+    return data
+
+def _read_header(source: BinaryIO) -> Optional[Dict]:
+    # The next entry's header, or None at the end of the bundle
+    (length,) = LENGTH.unpack(_read_exactly(source, LENGTH.size))
+    return json.loads(_read_exactly(source, length)) if length else None
+
+def _chunk_header(source: BinaryIO) -> Tuple[int, int, int]:
+    # (raw length, stored length, method) of the next chunk, checked before its bytes are read
+    raw_length, stored_length, method = CHUNK.unpack(_read_exactly(source, CHUNK.size))
+    if raw_length == 0:
+        return 0, 0, STORED
+    if raw_length > CHUNK_SIZE or method not in (STORED, DEFLATED) or stored_length > MAX_STORED_SIZE or (
+        method == STORED and stored_length != raw_length
+    ):
+        raise ValueError("bundle chunk header is corrupt")
+    return raw_length, stored_length, method
+
+def _stored_chunks(source: BinaryIO) -> Iterator[Tuple[int, int, bytes]]:
+    while True:
+        raw_length, stored_length, method = _chunk_header(source)
+        if raw_length == 0:
+            return
+        yield raw_length, method, _read_exactly(source, stored_length)
+
+def _file_hash(path: Path, known: Dict[str, Dict]) -> str:
+    # The assets table's hash when the file is unchanged since it was indexed, otherwise read it
+    row = known.get(str(path))
+    stat = path.stat()
+    if row is not None and (row['inode'], row['byte_size'], row['mtime_ns']) == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+        return row['content_hash']
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _references(path: Path) -> List[Tuple[str, str]]:
+    # (path, category) of the textures and background a scene file uses, read from its header
+    from three_dev.scene_file import read_arrays
+
+    try:
+        _, header = read_arrays(path)
+    except (ValueError, struct.error):
+        # Not a scene file, so it uses no assets
+        return []
+    references = [(texture, "textures") for texture in header.get("textures", [])]
+    if header.get("background"):
+        references.append((header["background"], "backgrounds"))
+    return references
+
+def _rewrite_references(path: Path, moved: Dict[str, str]) -> None:
+    # Points a scene file's textures and background at where the assets were imported to
+    from three_dev.scene_file import read_arrays, write_arrays
+
+    arrays, header = read_arrays(path)
+    textures = [moved.get(texture, texture) for texture in header.get("textures", [])]
+    background = moved.get(header.get("background"), header.get("background"))
+    if textures == header.get("textures", []) and background == header.get("background"):
+        return
+    header.update(textures=textures, background=background)
+    partial = path.with_name(f".{path.name}.partial")
+    write_arrays(partial, arrays, **header)
+    os.replace(partial, path)
+
+def _unused_path(path: Path) -> Path:
+    # path, or path with a counter added to the name if a file is already there
+    candidate, count = path, 1
+    while candidate.exists():
+        count += 1
+        candidate = path.with_name(f"{path.stem} ({count}){path.suffix}")
+    return candidate
+
+class ProjectBundle:
+    """
+    Moves a project, with every version's scene file and the assets they use,
+    between machines as one .3dev file.
+
+    Files are streamed through the bundle in chunks compressed on a thread pool,
+    so memory use is bounded by the pool's queue rather than the file sizes. Each
+    asset is stored once however many versions use it, and the manifest at the
+    start of the bundle names every asset by hash, so import can skip the assets
+    the user already has without reading their data. Every file is checked
+    against its SHA-256 as it is imported.
+    """
+
+    def __init__(self, username: str, workers: Optional[int] = None):
+        """
+        Parameters:
+            username (str): The user whose projects are exported or who receives imports.
+            workers (Optional[int]): Compression threads; one per CPU if None.
+        """
+        self.db = get_db()
+        self.username = username
+        user = self.db.get_user_section(username, 'security')
+        self.user_id: Optional[int] = user['user_id'] if user else None
+        self.workers = workers or os.cpu_count() or 1
+        # Chunks in flight: enough to keep every worker busy while the next one is read
+        self.depth = 2 * self.workers
+
+    def manifest(self, project_id: int, exclude_hashes: Iterable[str] = ()) -> Tuple[Dict, List[Tuple[str, Path]]]:
+        """
+        Describes what exporting a project writes.
+
+        Parameters:
+            project_id (int): The project to describe.
+            exclude_hashes (Iterable[str]): Content hashes of assets the destination
+                already has, e.g. from its assets table. They are listed but not stored.
+
+        Returns:
+            Tuple[Dict, List[Tuple[str, Path]]]: The manifest, and the (name in the bundle, file) pairs to store.
+        """
+        project = self.db.get_project(project_id)
+        if project is None or project['user_id'] != self.user_id:
+            raise ValueError(f"{self.username} has no project {project_id}")
+        versions = self.db.get_versions(project_id)
+        branches = self.db.get_branches(project_id)
+        version_index = {version['version_id']: i for i, version in enumerate(versions)}
+        branch_index = {branch['branch_id']: i for i, branch in enumerate(branches)}
+        known = {row['path']: row for row in self.db.get_asset_index(self.user_id)}
+        excluded = set(exclude_hashes)
+
+        files: List[Tuple[str, Path]] = []
+        assets: Dict[str, Dict] = {}
+        manifest_versions = []
+        for i, version in enumerate(versions):
+            path = Path(version['path']) if version['path'] else None
+            entry = {
+                'name': version['name'],
+                'branch': branch_index[version['branch_id']],
+                'parent': version_index.get(version['parent_id']),
+                'created_at': version['created_at'],
+                'file': None,
+                'assets': {}
+            }
+            if path is not None and path.is_file():
+                entry['file'] = f"versions/{i}/{path.name}"
+                files.append((entry['file'], path))
+                for reference, category in _references(path):
+                    asset_path = Path(reference)
+                    if not asset_path.is_file():
+                        continue
+                    content_hash = _file_hash(asset_path, known)
+                    entry['assets'][reference] = content_hash
+                    if content_hash in assets:
+                        continue
+                    stored = content_hash not in excluded
+                    assets[content_hash] = {
+                        'sha256': content_hash,
+                        'name': asset_path.name,
+                        'category': category,
+                        'size': asset_path.stat().st_size,
+                        'file': f"assets/{content_hash}" if stored else None
+                    }
+                    if stored:
+                        files.append((assets[content_hash]['file'], asset_path))
+            manifest_versions.append(entry)
+
+        manifest = {
+            'format': FORMAT,
+            'title': project['title'],
+            'branches': [
+                {'name': branch['name'], 'base': version_index.get(branch['base_version_id'])}
+                for branch in branches
+            ],
+            'versions': manifest_versions,
+            'assets': list(assets.values())
+        }
+        return manifest, files
+
+    def export(self, project_id: int, destination: str, exclude_hashes: Iterable[str] = ()) -> Dict:
+        """
+        Writes a project to a bundle. The bundle appears under its name only once complete.
+
+        Parameters:
+            project_id (int): The project to export.
+            destination (str): The .3dev file to write.
+            exclude_hashes (Iterable[str]): Content hashes of assets not to store, see manifest().
+
+        Returns:
+            Dict: The manifest written.
+        """
+        manifest, files = self.manifest(project_id, exclude_hashes)
+        hashes = {asset['file']: asset['sha256'] for asset in manifest['assets'] if asset['file']}
+        destination_path = Path(destination)
+        partial = destination_path.with_name(f".{destination_path.name}.partial")
+        try:
+            with open(partial, "wb") as out, ThreadPoolExecutor(self.workers) as pool:
+                encoded = json.dumps(manifest).encode()
+                out.write(MAGIC + LENGTH.pack(len(encoded)) + encoded)
+                for name, path in files:
+                    self._write_entry(out, pool, name, path, hashes.get(name))
+                out.write(LENGTH.pack(0))
+            os.replace(partial, destination_path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return manifest
+
+    def _write_entry(self, out: BinaryIO, pool: ThreadPoolExecutor, name: str, path: Path,
+                     content_hash: Optional[str]) -> None:
+        size = path.stat().st_size
+        header = json.dumps({'file': name, 'size': size}).encode()
+        out.write(LENGTH.pack(len(header)) + header)
+
+        digest = hashlib.sha256()
+        written = 0
+        with open(path, "rb") as file:
+            def chunks() -> Iterator[bytes]:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    yield chunk
+
+            for raw_length, method, data in _ordered(pool, _compress, chunks(), self.depth):
+                out.write(CHUNK.pack(raw_length, len(data), method))
+                out.write(data)
+                written += raw_length
+        out.write(CHUNK.pack(0, 0, STORED))
+        out.write(digest.digest())
+
+        if written != size or (content_hash is not None and digest.hexdigest() != content_hash):
+            raise ValueError(f"{path} changed while it was being exported")
+
+    @staticmethod
+    def read_manifest(source: BinaryIO) -> Dict:
+        """
+        Reads the manifest at the start of a bundle, leaving `source` at the first entry.
+        """
+        if source.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a 3Dev bundle")
+        (length,) = LENGTH.unpack(_read_exactly(source, LENGTH.size))
+        manifest = json.loads(_read_exactly(source, length))
+        if manifest.get('format', 0) > FORMAT:
+            raise ValueError("bundle was written by a newer version of 3Dev")
+        return manifest
+
+    def _free_title(self, title: str) -> str:
+        taken = {project['title'] for project in self.db.get_projects(self.user_id)}
+        candidate, count = title, 1
+        while candidate in taken:
+            count += 1
+            candidate = f"{title} ({count})"
+        return candidate
+
+    def import_bundle(self, source: str) -> Optional[int]:
+        """
+        Imports a bundle as a new project. Scene files go to the user's project folder
+        and new assets to their asset folders, where the gallery finds them; assets the
+        user already has, by hash, are not written again.
+
+        Parameters:
+            source (str): The .3dev file to read.
+
+        Returns:
+            Optional[int]: The new project_id, or None if the user does not exist.
+
+        Raises:
+            ValueError: If the bundle is malformed or a file does not match its hash.
+        """
+        if self.user_id is None:
+            return None
+        with open(source, "rb") as f, ThreadPoolExecutor(self.workers) as pool:
+            manifest = self.read_manifest(f)
+            assets_by_file = {asset['file']: asset for asset in manifest['assets'] if asset['file']}
+            versions_by_file = {version['file']: i for i, version in enumerate(manifest['versions']) if version['file']}
+            existing = self.db.get_assets_by_hash(self.user_id, [asset['sha256'] for asset in manifest['assets']])
+            asset_paths = {content_hash: row['path'] for content_hash, row in existing.items()}
+
+            title = self._free_title(manifest['title'])
+            project_dir = get_project_dir(self.username, title)
+            version_dirs = set()
+            version_paths: List[Optional[str]] = [None] * len(manifest['versions'])
+            new_assets: List[Tuple[Dict, Path]] = []
+
+            try:
+                while (header := _read_header(f)) is not None:
+                    name = header['file']
+                    if name in assets_by_file:
+                        asset = assets_by_file[name]
+                        if asset['sha256'] in asset_paths:
+                            self._skip_entry(f)
+                            continue
+                        target = _unused_path(get_asset_dir(self.username, asset['category']) / safe_name(asset['name']))
+                        self._read_entry(f, pool, target, header, asset['sha256'])
+                        asset_paths[asset['sha256']] = str(target)
+                        new_assets.append((asset, target))
+                    elif name in versions_by_file:
+                        index = versions_by_file[name]
+                        version = manifest['versions'][index]
+                        # README layout: <project>/<branch>/<version>/<scene file>
+                        directory = project_dir / safe_name(manifest['branches'][version['branch']]['name']) / safe_name(version['name'])
+                        while directory in version_dirs:
+                            directory = directory.with_name(f"{directory.name}_")
+                        version_dirs.add(directory)
+                        directory.mkdir(parents=True, exist_ok=True)
+                        target = directory / safe_name(Path(name).name)
+                        self._read_entry(f, pool, target, header, None)
+                        version_paths[index] = str(target)
+                    else:
+                        raise ValueError(f"bundle has an entry the manifest does not list: {name}")
+            except BaseException:
+                # Assets already imported are complete and verified, so only the scene files go
+                for path in version_paths:
+                    if path is not None:
+                        Path(path).unlink(missing_ok=True)
+                raise
+
+        for asset, target in new_assets:
+            description = describe_file(target, asset['sha256'])
+            make_thumbnail(target, asset['sha256'])
+            self.db.add_asset(self.user_id, target.stem, asset['category'], str(target), **description)
+
+        # Scene files name their assets by path on the exporting machine
+        for version, path in zip(manifest['versions'], version_paths):
+            if path is None:
+                continue
+            moved = {
+                reference: asset_paths[content_hash]
+                for reference, content_hash in version['assets'].items() if content_hash in asset_paths
+            }
+            _rewrite_references(Path(path), moved)
+
+        return self.db.import_project(
+            self.user_id, title, manifest['branches'],
+            [
+                {'name': version['name'], 'branch': version['branch'], 'parent': version['parent'], 'path': path}
+                for version, path in zip(manifest['versions'], version_paths)
+            ]
+        )
+
+    def _read_entry(self, source: BinaryIO, pool: ThreadPoolExecutor, target: Path, header: Dict,
+                    content_hash: Optional[str]) -> None:
+        # Decompresses an entry to a temporary file beside target, hashing it on the way,
+        # and moves it into place only if it matches
+        partial = target.with_name(f".{target.name}.partial")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(partial, "wb") as out:
+                for data in _ordered(pool, _decompress, _stored_chunks(source), self.depth):
+                    digest.update(data)
+                    out.write(data)
+                    size += len(data)
+            stored = _read_exactly(source, DIGEST_SIZE)
+            if size != header['size'] or digest.digest() != stored or (
+                content_hash is not None and digest.hexdigest() != content_hash
+            ):
+                raise ValueError(f"{header['file']} in the bundle does not match its hash")
+            os.replace(partial, target)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def _skip_entry(self, source: BinaryIO) -> None:
+        # Steps over an entry's chunks without decompressing them
+        while True:
+            raw_length, stored_length, _ = _chunk_header(source)
+            if raw_length == 0:
+                break
+            source.seek(stored_length, os.SEEK_CUR)
+        _read_exactly(source, DIGEST_SIZE)
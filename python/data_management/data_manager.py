@@ -1,20 +1,165 @@
+import atexit
+import functools
+import json
+import random
 import sqlite3
-from typing import Dict, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
 from datetime import datetime
 
+# The UI, the asset indexer and render worker processes share the database file, so
+# connections wait this many seconds for another's lock before reporting it busy
+BUSY_TIMEOUT = 5.0
+# Attempts at a write that still finds the database busy, and the first pause between
+# them in seconds, doubling after each attempt
+WRITE_ATTEMPTS = 5
+WRITE_BACKOFF = 0.05
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """Whether an error means another connection held the lock, rather than a real failure."""
+    return (error.sqlite_errorcode & 0xff) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+def retry_busy(method: Callable) -> Callable:
+    """
+    Retry a write that found the database locked for longer than the busy timeout,
+    backing off exponentially with jitter so competing writers spread out.
+
+    The failed transaction is rolled back when its with block exits, so running the
+    method again is safe.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                return method(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                time.sleep(WRITE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+class ClosingConnection(sqlite3.Connection):
+    """A connection that closes when its with block exits, after committing or rolling back."""
+
+    def __exit__(self, *exc_info):
+        try:
+            return super().__exit__(*exc_info)
+        finally:
+            self.close()
+
+class WriteQueue:
+    """
+    Runs writes one after another on a single background thread, so writes to hot
+    tables from this process never contend with each other for the database lock and
+    the caller, e.g. the UI thread, never waits on another process's transaction.
+
+    A write queued under the key of one still waiting replaces it, so a slider dragged
+    across its range writes its final value once rather than every value on the way.
+    """
+
+    def __init__(self):
+        self._pending: "OrderedDict[Hashable, Tuple[Callable, tuple, Dict, List[Future]]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, key: Optional[Hashable], write: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a write.
+
+        Args:
+            key (Optional[Hashable]): Identifies what the write sets, e.g. ('render', user_id, 'aperture');
+                None if it should never replace another write.
+            write (Callable): The DataManager method, or any function, to call with args and kwargs.
+
+        Returns:
+            Future: Resolves to the write's return value, or that of the write that replaced it.
+        """
+        future = Future()
+        with self._condition:
+            if key is None:
+                key = object()
+            futures = [future]
+            if key in self._pending:
+                futures += self._pending.pop(key)[3]
+            self._pending[key] = (write, args, kwargs, futures)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            self._condition.notify_all()
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the queued writes to finish.
+
+        Returns:
+            bool: False if the timeout passed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                _, (write, args, kwargs, futures) = self._pending.popitem(last=False)
+                self._running = True
+            try:
+                result = write(*args, **kwargs)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(result)
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+
 class DataManager:
-    def __init__(self, db_file: str = "3Dev.db"):
-        """Initialize database connection and create tables if they don't exist."""
+    def __init__(self, db_file: str = "3Dev.db", readonly: bool = False):
+        """
+        Initialize database connection and create tables if they don't exist.
+
+        Args:
+            db_file (str): Location of the database file.
+            readonly (bool): Open read-only connections, e.g. in a render worker process,
+                which never write and so never take the write lock; the tables must already exist.
+        """
         self.db_file = db_file
-        self.conn = None
-        self.create_tables()
+        self.readonly = readonly
+        self.writes = WriteQueue()
+        if not readonly:
+            self.create_tables()
     
-    def connect(self):
-        """Create a database connection with row factory enabled."""
-        self.conn = sqlite3.connect(self.db_file)
-        self.conn.row_factory = sqlite3.Row
-        return self.conn
+    def connect(self) -> sqlite3.Connection:
+        """
+        Create a database connection with row factory enabled, closed when its with block exits.
+
+        Writes start their transaction with BEGIN IMMEDIATE, taking the write lock up front
+        where the busy timeout can wait for it, rather than upgrading a read part way through,
+        which fails at once if another process wrote in between.
+        """
+        if self.readonly:
+            database, uri = Path(self.db_file).resolve().as_uri() + "?mode=ro", True
+        else:
+            database, uri = self.db_file, False
+        conn = sqlite3.connect(
+            database, timeout=BUSY_TIMEOUT, isolation_level="IMMEDIATE",
+            factory=ClosingConnection, uri=uri
+        )
+        conn.row_factory = sqlite3.Row
+        # With the write-ahead log, committing only syncs the log at checkpoints
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
     
+    @retry_busy
     def create_tables(self):
         """Create tables that mirror the settings menu structure."""
         # Users table - corresponds to Security section
@@ -52,6 +197,10 @@ class DataManager:
             aperture REAL DEFAULT 2.0,
             max_depth INTEGER DEFAULT 50,
             samples_per_pixel INTEGER DEFAULT 100,
+            adaptive_sampling BOOLEAN DEFAULT 0,
+            noise_threshold REAL DEFAULT 0.01,
+            min_samples INTEGER DEFAULT 16,
+            max_samples INTEGER DEFAULT 1024,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (user_id)
@@ -59,11 +208,188 @@ class DataManager:
         );
         """
         
+        # Render history - instrumentation of finished renders, next to the preferences they used
+        create_render_history_table = """
+        CREATE TABLE IF NOT EXISTS render_history (
+            render_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            render_name TEXT,
+            preferences TEXT NOT NULL,
+            primary_rays INTEGER,
+            secondary_rays INTEGER,
+            intersection_tests INTEGER,
+            seconds REAL,
+            rays_per_second REAL,
+            stats TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+                ON DELETE CASCADE
+        );
+        """
+        create_render_history_index = """
+        CREATE INDEX IF NOT EXISTS render_history_user
+            ON render_history (user_id, render_id);
+        """
+        
+        # Assets - metadata of the files shown in the asset gallery; the files live in the user's asset folders
+        create_assets_table = """
+        CREATE TABLE IF NOT EXISTS assets (
+            asset_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            path TEXT NOT NULL,
+            byte_size INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            content_hash TEXT NOT NULL,
+            inode INTEGER,
+            mtime_ns INTEGER,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+                ON DELETE CASCADE
+        );
+        """
+        # Gallery pages are read newest first along these indexes, with or without a category filter
+        create_assets_indexes = [
+            """
+            CREATE INDEX IF NOT EXISTS assets_user_page
+                ON assets (user_id, imported_at, asset_id);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS assets_user_category_page
+                ON assets (user_id, category, imported_at, asset_id);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS assets_user_hash
+                ON assets (user_id, content_hash);
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS assets_user_path
+                ON assets (user_id, path);
+            """,
+            # Thumbnails are shared by every user's copies of a file, so the
+            # garbage collector looks hashes up across users
+            """
+            CREATE INDEX IF NOT EXISTS assets_hash
+                ON assets (content_hash);
+            """
+        ]
+        
+        # Projects, their branches and the versions saved on each branch (README: projects/branch/version)
+        create_projects_table = """
+        CREATE TABLE IF NOT EXISTS projects (
+            project_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, title),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+                ON DELETE CASCADE
+        );
+        """
+        create_branches_table = """
+        CREATE TABLE IF NOT EXISTS branches (
+            branch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            base_version_id INTEGER REFERENCES versions (version_id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (project_id, name),
+            FOREIGN KEY (project_id) REFERENCES projects (project_id)
+                ON DELETE CASCADE
+        );
+        """
+        # project_id is repeated from the branch so a project's latest version is one index seek
+        create_versions_table = """
+        CREATE TABLE IF NOT EXISTS versions (
+            version_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            branch_id INTEGER NOT NULL,
+            parent_id INTEGER REFERENCES versions (version_id),
+            name TEXT NOT NULL,
+            path TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects (project_id)
+                ON DELETE CASCADE,
+            FOREIGN KEY (branch_id) REFERENCES branches (branch_id)
+                ON DELETE CASCADE
+        );
+        """
+        # Closure table: one row per (ancestor, descendant) pair including each version
+        # with itself at distance 0, so history and common ancestors are indexed lookups
+        create_version_ancestry_table = """
+        CREATE TABLE IF NOT EXISTS version_ancestry (
+            ancestor_id INTEGER NOT NULL,
+            descendant_id INTEGER NOT NULL,
+            distance INTEGER NOT NULL,
+            PRIMARY KEY (descendant_id, ancestor_id),
+            FOREIGN KEY (ancestor_id) REFERENCES versions (version_id)
+                ON DELETE CASCADE,
+            FOREIGN KEY (descendant_id) REFERENCES versions (version_id)
+                ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        """
+        create_version_indexes = [
+            """
+            CREATE INDEX IF NOT EXISTS versions_branch_latest
+                ON versions (branch_id, version_id);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS versions_project_latest
+                ON versions (project_id, version_id);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS version_ancestry_ancestor
+                ON version_ancestry (ancestor_id, distance);
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS versions_path
+                ON versions (path);
+            """
+        ]
+        
+        # Columns added after the first release, for databases created before them
+        render_preference_columns = {
+            'adaptive_sampling': 'BOOLEAN DEFAULT 0',
+            'noise_threshold': 'REAL DEFAULT 0.01',
+            'min_samples': 'INTEGER DEFAULT 16',
+            'max_samples': 'INTEGER DEFAULT 1024'
+        }
+        # File identity the asset indexer compares against, so it only rehashes files that changed
+        asset_columns = {
+            'inode': 'INTEGER',
+            'mtime_ns': 'INTEGER'
+        }
+        
         with self.connect() as conn:
+            # Readers and the writer no longer block each other, and the setting stays with the file
+            conn.execute("PRAGMA journal_mode = WAL")
             conn.execute(create_users_table)
             conn.execute(create_user_preferences_table)
             conn.execute(create_render_preferences_table)
+            conn.execute(create_render_history_table)
+            conn.execute(create_render_history_index)
+            conn.execute(create_assets_table)
+            for create_index in create_assets_indexes:
+                conn.execute(create_index)
+            conn.execute(create_projects_table)
+            conn.execute(create_branches_table)
+            conn.execute(create_versions_table)
+            conn.execute(create_version_ancestry_table)
+            for create_index in create_version_indexes:
+                conn.execute(create_index)
+            self._add_missing_columns(conn, 'render_preferences', render_preference_columns)
+            self._add_missing_columns(conn, 'assets', asset_columns)
+
+    def _add_missing_columns(self, conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+        """Add any of the given columns (name -> declaration) that an existing table lacks."""
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, declaration in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
     
+    @retry_busy
     def add_user(self, username: str, password_hash: str) -> Optional[int]:
         """Add a new user and create their default preferences."""
         sql_user = "INSERT INTO users (username, password_hash) VALUES (?, ?)"
@@ -80,6 +406,7 @@ class DataManager:
         except sqlite3.IntegrityError:
             return None
 
+    @retry_busy
     def update_security(self, user_id: int, username: Optional[str] = None, 
                        password_hash: Optional[str] = None) -> bool:
         """Update security settings (username and/or password)."""
@@ -110,6 +437,7 @@ class DataManager:
         except sqlite3.IntegrityError:
             return False
 
+    @retry_busy
     def update_user_preferences(self, user_id: int, **preferences) -> bool:
         """
         Update user interface preferences for a specific user.
@@ -145,11 +473,13 @@ class DataManager:
             cursor = conn.execute(sql, (*update_fields.values(), user_id))
             return cursor.rowcount > 0
 
+    @retry_busy
     def update_render_preferences(self, user_id: int, **preferences) -> bool:
         """Update rendering preferences."""
         valid_fields = {'render_name', 'image_width', 'aspect_ratio',
                        'focus_distance', 'aperture', 'max_depth',
-                       'samples_per_pixel'}
+                       'samples_per_pixel', 'adaptive_sampling',
+                       'noise_threshold', 'min_samples', 'max_samples'}
         update_fields = {k: v for k, v in preferences.items() if k in valid_fields}
         if not update_fields:
             return False
@@ -202,7 +532,8 @@ class DataManager:
             up.theme, up.auto_save,
             rp.render_name, rp.image_width, rp.aspect_ratio,
             rp.focus_distance, rp.aperture, rp.max_depth,
-            rp.samples_per_pixel
+            rp.samples_per_pixel, rp.adaptive_sampling, rp.noise_threshold,
+            rp.min_samples, rp.max_samples
         FROM users u
         LEFT JOIN user_preferences up ON u.user_id = up.user_id
         LEFT JOIN render_preferences rp ON u.user_id = rp.user_id
@@ -211,4 +542,578 @@ class DataManager:
         with self.connect() as conn:
             cursor = conn.execute(sql, (username,))
             row = cursor.fetchone()
-            return dict(row) if row else None
\ No newline at end of file
+            return dict(row) if row else None
+
+    @retry_busy
+    def add_render_history(self, user_id: int, preferences: Dict, stats: Dict) -> Optional[int]:
+        """
+        Record a finished render's statistics alongside the render preferences it used.
+
+        Args:
+            user_id (int): The user who ran the render.
+            preferences (Dict): The render_preferences row the render was configured from.
+            stats (Dict): Render statistics, as returned by three_dev.RenderStats.to_dict().
+
+        Returns:
+            Optional[int]: The new render_id, or None if the user does not exist.
+        """
+        rays = stats['primary_rays'] + stats['secondary_rays']
+        seconds = stats['seconds']
+        sql = """
+        INSERT INTO render_history (
+            user_id, render_name, preferences, primary_rays, secondary_rays,
+            intersection_tests, seconds, rays_per_second, stats
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        values = (
+            user_id, preferences.get('render_name'), json.dumps(preferences, default=str),
+            stats['primary_rays'], stats['secondary_rays'], stats['intersection_tests'],
+            seconds, rays / seconds if seconds > 0 else 0.0, json.dumps(stats)
+        )
+
+        try:
+            with self.connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                return conn.execute(sql, values).lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    def get_render_history(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """Retrieve a user's most recent renders, newest first, with preferences and stats decoded."""
+        sql = """
+        SELECT *
+        FROM render_history
+        WHERE user_id = ?
+        ORDER BY render_id DESC
+        LIMIT ?
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (user_id, limit)).fetchall()
+
+        history = []
+        for row in rows:
+            entry = dict(row)
+            entry['preferences'] = json.loads(entry['preferences'])
+            entry['stats'] = json.loads(entry['stats'])
+            history.append(entry)
+        return history
+
+    @retry_busy
+    def add_asset(self, user_id: int, name: str, category: str, path: str, byte_size: int,
+                  content_hash: str, width: Optional[int] = None, height: Optional[int] = None,
+                  inode: Optional[int] = None, mtime_ns: Optional[int] = None) -> Optional[int]:
+        """
+        Record an imported asset file.
+
+        Args:
+            user_id (int): The user who owns the asset.
+            name (str): Display name.
+            category (str): Gallery category, e.g. 'textures' or 'backgrounds'.
+            path (str): Location of the file.
+            byte_size (int): File size in bytes.
+            content_hash (str): SHA-256 of the file contents.
+            width (Optional[int]): Image width in pixels, if the file is an image.
+            height (Optional[int]): Image height in pixels, if the file is an image.
+            inode (Optional[int]): The file's inode number when it was described.
+            mtime_ns (Optional[int]): The file's modification time in nanoseconds when it was described.
+
+        Returns:
+            Optional[int]: The new asset_id, or None if the user does not exist or the path is already recorded.
+        """
+        sql = """
+        INSERT INTO assets (user_id, name, category, path, byte_size, width, height, content_hash, inode, mtime_ns)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        try:
+            with self.connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                return conn.execute(
+                    sql, (user_id, name, category, path, byte_size, width, height, content_hash, inode, mtime_ns)
+                ).lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    def get_assets_page(self, user_id: int, category: Optional[str] = None,
+                        after: Optional[Tuple[str, int]] = None, limit: int = 12) -> List[Dict]:
+        """
+        Retrieve one page of a user's assets, newest first, by keyset pagination.
+
+        Each page continues from the (imported_at, asset_id) of the previous page's last
+        row rather than an OFFSET, so every page is an index range scan of `limit` rows
+        however many assets the user has and however deep the page is.
+
+        Args:
+            user_id (int): The user whose assets to list.
+            category (Optional[str]): Only list this category; all categories if None.
+            after (Optional[Tuple[str, int]]): (imported_at, asset_id) of the last asset on the previous page.
+            limit (int): Page size.
+
+        Returns:
+            List[Dict]: Up to `limit` asset rows.
+        """
+        conditions = ["user_id = ?"]
+        params: List = [user_id]
+        if category is not None:
+            conditions.append("category = ?")
+            params.append(category)
+        if after is not None:
+            conditions.append("(imported_at, asset_id) < (?, ?)")
+            params.extend(after)
+
+        sql = f"""
+        SELECT *
+        FROM assets
+        WHERE {' AND '.join(conditions)}
+        ORDER BY imported_at DESC, asset_id DESC
+        LIMIT ?
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_asset_index(self, user_id: int, categories: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Retrieve the file identity of a user's assets, for comparing against the asset folders.
+
+        Args:
+            user_id (int): The user whose assets to list.
+            categories (Optional[List[str]]): Only list these categories; all categories if None.
+
+        Returns:
+            List[Dict]: asset_id, category, path, inode, byte_size, mtime_ns and content_hash of each asset.
+        """
+        sql = """
+        SELECT asset_id, category, path, inode, byte_size, mtime_ns, content_hash
+        FROM assets
+        WHERE user_id = ?
+        """
+        params: List = [user_id]
+        if categories is not None:
+            sql += f" AND category IN ({', '.join('?' * len(categories))})"
+            params.extend(categories)
+        with self.connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_assets_by_hash(self, user_id: int, content_hashes: List[str]) -> Dict[str, Dict]:
+        """
+        Find which of some file contents a user already has as assets.
+
+        Args:
+            user_id (int): The user whose assets to search.
+            content_hashes (List[str]): SHA-256 hashes to look up.
+
+        Returns:
+            Dict[str, Dict]: The asset row for each hash the user has, keyed by hash.
+        """
+        found: Dict[str, Dict] = {}
+        with self.connect() as conn:
+            # In slices, to stay under SQLite's limit on bound parameters
+            for start in range(0, len(content_hashes), 500):
+                hashes = content_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"""
+                    SELECT *
+                    FROM assets
+                    WHERE user_id = ? AND content_hash IN ({', '.join('?' * len(hashes))})
+                    """,
+                    (user_id, *hashes)
+                ).fetchall()
+                for row in rows:
+                    found.setdefault(row['content_hash'], dict(row))
+        return found
+
+    @retry_busy
+    def apply_asset_changes(self, user_id: int, added: List[Dict], updated: List[Dict],
+                            removed: List[int]) -> None:
+        """
+        Apply a batch of changes found in the asset folders in one transaction.
+
+        Args:
+            user_id (int): The user who owns the assets.
+            added (List[Dict]): New assets, each with the keyword arguments of add_asset.
+            updated (List[Dict]): Changed assets, each with an asset_id and the columns to set,
+                e.g. path, name and category for a renamed file.
+            removed (List[int]): asset_ids of assets whose files are gone.
+        """
+        columns = ('name', 'category', 'path', 'byte_size', 'width', 'height', 'content_hash', 'inode', 'mtime_ns')
+        sql_insert = f"""
+        INSERT OR IGNORE INTO assets (user_id, {', '.join(columns)})
+        VALUES (?, {', '.join('?' * len(columns))})
+        """
+        with self.connect() as conn:
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.executemany(
+                "DELETE FROM assets WHERE asset_id = ? AND user_id = ?",
+                [(asset_id, user_id) for asset_id in removed]
+            )
+            # Moved files first take a placeholder path, so files swapping names do not
+            # collide on the unique path index partway through the batch
+            conn.executemany(
+                "UPDATE assets SET path = ':moving:' || asset_id WHERE asset_id = ? AND user_id = ?",
+                [(change['asset_id'], user_id) for change in updated if 'path' in change]
+            )
+            for change in updated:
+                fields = [name for name in columns if name in change]
+                conn.execute(
+                    f"UPDATE assets SET {', '.join(f'{name} = ?' for name in fields)} "
+                    "WHERE asset_id = ? AND user_id = ?",
+                    (*(change[name] for name in fields), change['asset_id'], user_id)
+                )
+            conn.executemany(
+                sql_insert,
+                [(user_id, *(asset.get(name) for name in columns)) for asset in added]
+            )
+
+    @retry_busy
+    def add_project(self, user_id: int, title: str, version_name: str, path: Optional[str] = None) -> Optional[int]:
+        """
+        Create a project with a 'main' branch holding its first version.
+
+        Args:
+            user_id (int): The user who owns the project.
+            title (str): Project title, unique per user.
+            version_name (str): Name of the first version, e.g. '1.0.0'.
+            path (Optional[str]): Scene file of the first version.
+
+        Returns:
+            Optional[int]: The new project_id, or None if the user already has a project with this title.
+        """
+        try:
+            with self.connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                project_id = conn.execute(
+                    "INSERT INTO projects (user_id, title) VALUES (?, ?)", (user_id, title)
+                ).lastrowid
+                branch_id = conn.execute(
+                    "INSERT INTO branches (project_id, name) VALUES (?, 'main')", (project_id,)
+                ).lastrowid
+                self._insert_version(conn, project_id, branch_id, None, version_name, path)
+                return project_id
+        except sqlite3.IntegrityError:
+            return None
+
+    @retry_busy
+    def add_branch(self, project_id: int, name: str, base_version_id: int) -> Optional[int]:
+        """
+        Create a branch whose history continues from an existing version.
+
+        Args:
+            project_id (int): The project to branch.
+            name (str): Branch name, unique per project.
+            base_version_id (int): The version the branch starts from.
+
+        Returns:
+            Optional[int]: The new branch_id, or None if the name is taken.
+        """
+        try:
+            with self.connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                return conn.execute(
+                    "INSERT INTO branches (project_id, name, base_version_id) VALUES (?, ?, ?)",
+                    (project_id, name, base_version_id)
+                ).lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    @retry_busy
+    def add_version(self, branch_id: int, name: str, path: Optional[str] = None,
+                    parent_id: Optional[int] = None) -> int:
+        """
+        Save a new version on a branch.
+
+        Args:
+            branch_id (int): The branch to save to.
+            name (str): Version name, e.g. '1.1.0'.
+            path (Optional[str]): Scene file of the version.
+            parent_id (Optional[int]): The version this one was made from; by default the
+                branch's latest version, or the version the branch was made from.
+
+        Returns:
+            int: The new version_id.
+        """
+        with self.connect() as conn:
+            conn.execute("PRAGMA foreign_keys = ON")
+            # The latest version is read under the write lock, so a version saved by
+            # another process at the same time cannot take the same parent
+            conn.execute("BEGIN IMMEDIATE")
+            project_id, base_version_id, latest_id = conn.execute(
+                """
+                SELECT project_id, base_version_id,
+                       (SELECT MAX(version_id) FROM versions WHERE branch_id = branches.branch_id)
+                FROM branches
+                WHERE branch_id = ?
+                """,
+                (branch_id,)
+            ).fetchone()
+            if parent_id is None:
+                parent_id = latest_id if latest_id is not None else base_version_id
+            return self._insert_version(conn, project_id, branch_id, parent_id, name, path)
+
+    def _insert_version(self, conn: sqlite3.Connection, project_id: int, branch_id: int,
+                        parent_id: Optional[int], name: str, path: Optional[str]) -> int:
+        """Insert a version and its ancestry rows: itself, plus each ancestor of its parent one step further away."""
+        version_id = conn.execute(
+            "INSERT INTO versions (project_id, branch_id, parent_id, name, path) VALUES (?, ?, ?, ?, ?)",
+            (project_id, branch_id, parent_id, name, path)
+        ).lastrowid
+        conn.execute(
+            """
+            INSERT INTO version_ancestry (ancestor_id, descendant_id, distance)
+            SELECT ?, ?, 0
+            UNION ALL
+            SELECT ancestor_id, ?, distance + 1 FROM version_ancestry WHERE descendant_id = ?
+            """,
+            (version_id, version_id, version_id, parent_id)
+        )
+        return version_id
+
+    def get_projects(self, user_id: int) -> List[Dict]:
+        """
+        Retrieve a user's projects for the dashboard in one query, each with its latest version.
+
+        Args:
+            user_id (int): The user whose projects to list.
+
+        Returns:
+            List[Dict]: project_id, title, created_at, version_id, version (its name),
+            branch and version_created_at of each project, most recently updated first.
+        """
+        sql = """
+        SELECT p.project_id, p.title, p.created_at,
+               v.version_id, v.name AS version, b.name AS branch, v.created_at AS version_created_at
+        FROM projects p
+        JOIN versions v
+            ON v.version_id = (SELECT MAX(version_id) FROM versions WHERE project_id = p.project_id)
+        JOIN branches b ON b.branch_id = v.branch_id
+        WHERE p.user_id = ?
+        ORDER BY v.version_id DESC
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (user_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_branches(self, project_id: int) -> List[Dict]:
+        """
+        Retrieve a project's branches, each with its latest version.
+
+        Args:
+            project_id (int): The project whose branches to list.
+
+        Returns:
+            List[Dict]: branch_id, name, base_version_id, version_id and version (its name) of
+            each branch; a branch with no versions of its own reports the version it was made from.
+        """
+        sql = """
+        SELECT b.branch_id, b.name, b.base_version_id, v.version_id, v.name AS version
+        FROM branches b
+        LEFT JOIN versions v ON v.version_id = COALESCE(
+            (SELECT MAX(version_id) FROM versions WHERE branch_id = b.branch_id),
+            b.base_version_id
+        )
+        WHERE b.project_id = ?
+        ORDER BY b.branch_id
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (project_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_history(self, version_id: int, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Retrieve the history leading to a version, newest first, across the branches it came through.
+
+        Args:
+            version_id (int): The version whose history to list, e.g. a branch's latest version.
+            limit (Optional[int]): Return at most this many versions.
+
+        Returns:
+            List[Dict]: The version and its ancestors, each with its distance from version_id.
+        """
+        sql = """
+        SELECT v.*, b.name AS branch, a.distance
+        FROM version_ancestry a
+        JOIN versions v ON v.version_id = a.ancestor_id
+        JOIN branches b ON b.branch_id = v.branch_id
+        WHERE a.descendant_id = ?
+        ORDER BY a.distance
+        LIMIT ?
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (version_id, -1 if limit is None else limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_common_ancestor(self, version_a: int, version_b: int) -> Optional[int]:
+        """
+        Find the nearest version both versions descend from, e.g. where two branches diverged.
+
+        Args:
+            version_a (int): One version.
+            version_b (int): The other version.
+
+        Returns:
+            Optional[int]: The version_id of the nearest common ancestor, which may be one of
+            the two versions itself, or None if they share no history.
+        """
+        sql = """
+        SELECT a.ancestor_id
+        FROM version_ancestry a
+        JOIN version_ancestry b ON b.descendant_id = ? AND b.ancestor_id = a.ancestor_id
+        WHERE a.descendant_id = ?
+        ORDER BY a.distance
+        LIMIT 1
+        """
+        with self.connect() as conn:
+            row = conn.execute(sql, (version_b, version_a)).fetchone()
+        return row[0] if row else None
+
+    def get_project(self, project_id: int) -> Optional[Dict]:
+        """
+        Retrieve a project row.
+
+        Args:
+            project_id (int): The project to look up.
+
+        Returns:
+            Optional[Dict]: project_id, user_id, title and created_at, or None if there is no such project.
+        """
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_versions(self, project_id: int) -> List[Dict]:
+        """
+        Retrieve every version of a project, oldest first, so each comes after its parent.
+
+        Args:
+            project_id (int): The project whose versions to list.
+
+        Returns:
+            List[Dict]: The version rows, each with the name of its branch.
+        """
+        sql = """
+        SELECT v.*, b.name AS branch
+        FROM versions v
+        JOIN branches b ON b.branch_id = v.branch_id
+        WHERE v.project_id = ?
+        ORDER BY v.version_id
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (project_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    @retry_busy
+    def import_project(self, user_id: int, title: str, branches: List[Dict], versions: List[Dict]) -> Optional[int]:
+        """
+        Recreate a project's version graph, e.g. from a bundle, in one transaction.
+
+        Args:
+            user_id (int): The user who will own the project.
+            title (str): Project title, unique per user.
+            branches (List[Dict]): name and base (index into versions, or None) of each branch.
+            versions (List[Dict]): name, branch (index into branches), parent (index into
+                versions, or None) and path of each version, each after its parent.
+
+        Returns:
+            Optional[int]: The new project_id, or None if the user already has a project with this title.
+        """
+        try:
+            with self.connect() as conn:
+                conn.execute("PRAGMA foreign_keys = ON")
+                project_id = conn.execute(
+                    "INSERT INTO projects (user_id, title) VALUES (?, ?)", (user_id, title)
+                ).lastrowid
+                # Branches are created as their first version or base needs them
+                branch_ids: Dict[int, int] = {}
+                version_ids: List[int] = []
+
+                def branch_id(index: int) -> int:
+                    if index not in branch_ids:
+                        base = branches[index]['base']
+                        branch_ids[index] = conn.execute(
+                            "INSERT INTO branches (project_id, name, base_version_id) VALUES (?, ?, ?)",
+                            (project_id, branches[index]['name'], None if base is None else version_ids[base])
+                        ).lastrowid
+                    return branch_ids[index]
+
+                for version in versions:
+                    parent = version['parent']
+                    version_ids.append(self._insert_version(
+                        conn, project_id, branch_id(version['branch']),
+                        None if parent is None else version_ids[parent], version['name'], version['path']
+                    ))
+                for index in range(len(branches)):
+                    branch_id(index)
+                return project_id
+        except sqlite3.IntegrityError:
+            return None
+
+    def get_version_paths(self, user_id: int, after: int = 0, limit: int = 500) -> List[Tuple[int, str]]:
+        """
+        Retrieve a batch of the scene files a user's versions are stored in, by keyset pagination.
+
+        Args:
+            user_id (int): The user whose versions to list.
+            after (int): The version_id of the last row of the previous batch, 0 for the first.
+            limit (int): Batch size.
+
+        Returns:
+            List[Tuple[int, str]]: (version_id, path) of up to `limit` versions with a file.
+        """
+        sql = """
+        SELECT v.version_id, v.path
+        FROM versions v
+        JOIN projects p ON p.project_id = v.project_id
+        WHERE p.user_id = ? AND v.version_id > ? AND v.path IS NOT NULL
+        ORDER BY v.version_id
+        LIMIT ?
+        """
+        with self.connect() as conn:
+            rows = conn.execute(sql, (user_id, after, limit)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_content_hashes(self, after: int = 0, limit: int = 500) -> List[Tuple[int, str]]:
+        """
+        Retrieve a batch of the content hashes of every user's assets, by keyset pagination.
+
+        Args:
+            after (int): The asset_id of the last row of the previous batch, 0 for the first.
+            limit (int): Batch size.
+
+        Returns:
+            List[Tuple[int, str]]: (asset_id, content_hash) of up to `limit` assets.
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT asset_id, content_hash FROM assets WHERE asset_id > ? ORDER BY asset_id LIMIT ?",
+                (after, limit)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_referenced(self, paths: List[str], content_hashes: List[str]) -> Tuple[Set[str], Set[str]]:
+        """
+        Find which files are still referenced, to check garbage just before it is deleted.
+
+        Args:
+            paths (List[str]): Scene files to look for among every version's path.
+            content_hashes (List[str]): Hashes to look for among every user's assets.
+
+        Returns:
+            Tuple[Set[str], Set[str]]: The paths and the hashes that are referenced.
+        """
+        found_paths: Set[str] = set()
+        found_hashes: Set[str] = set()
+        with self.connect() as conn:
+            # In slices, to stay under SQLite's limit on bound parameters
+            for start in range(0, len(paths), 500):
+                batch = paths[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT path FROM versions WHERE path IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                found_paths.update(row[0] for row in rows)
+            for start in range(0, len(content_hashes), 500):
+                batch = content_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT content_hash FROM assets WHERE content_hash IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                found_hashes.update(row[0] for row in rows)
+        return found_paths, found_hashes
@@ -27,8 +27,7 @@ class DatabaseSingleton:
         Creates necessary directories and establishes the database connection.
         """
         if self._db_manager is None:
-            project_root = Path(__file__).parent.parent
-            db_path = project_root / "data" / "3Dev.db"
+            db_path = get_db_path()
             db_path.parent.mkdir(parents=True, exist_ok=True)
             self._db_manager = DataManager(str(db_path))
 
@@ -49,4 +48,86 @@ def get_db():
     Returns:
         DataManager: The database manager instance from the DatabaseSingleton.
     """
-    return DatabaseSingleton().db
\ No newline at end of file
+    return DatabaseSingleton().db
+
+def get_db_path() -> Path:
+    """
+    A helper function to locate the database file shared by the app's processes.
+
+    Returns:
+        Path: data/3Dev.db under the python folder.
+    """
+    return Path(__file__).parent.parent / "data" / "3Dev.db"
+
+def open_readonly_db() -> DataManager:
+    """
+    A helper function for worker processes that only read, e.g. render workers looking up
+    preferences. Their connections never take the write lock, so they cannot hold up the UI.
+
+    Returns:
+        DataManager: A new read-only database manager; the app must have created the database.
+    """
+    return DataManager(str(get_db_path()), readonly=True)
+
+def get_asset_dir(username: str, category: str) -> Path:
+    """
+    A helper function to locate a user's asset folder, e.g. "backgrounds", creating it if needed.
+
+    Returns:
+        Path: data/assets/<username>/<category> under the project root.
+    """
+    asset_dir = Path(__file__).parent.parent / "data" / "assets" / username / category
+    asset_dir.mkdir(parents=True, exist_ok=True)
+    return asset_dir
+
+def get_thumbnail_dir() -> Path:
+    """
+    A helper function to locate the thumbnail cache, creating it if needed.
+
+    Returns:
+        Path: data/thumbnails under the project root. Thumbnails are named by content hash,
+        so every copy of the same file shares one.
+    """
+    thumbnail_dir = Path(__file__).parent.parent / "data" / "thumbnails"
+    thumbnail_dir.mkdir(parents=True, exist_ok=True)
+    return thumbnail_dir
+
+def get_projects_root(username: str) -> Path:
+    """
+    A helper function to locate the folder holding all of a user's project folders, creating it if needed.
+
+    Returns:
+        Path: data/projects/<username> under the project root.
+    """
+    projects_root = Path(__file__).parent.parent / "data" / "projects" / username
+    projects_root.mkdir(parents=True, exist_ok=True)
+    return projects_root
+
+def get_project_dir(username: str, title: str) -> Path:
+    """
+    A helper function to locate the folder a user's project files are kept in, creating it if needed.
+
+    Returns:
+        Path: data/projects/<username>/<title> under the project root.
+    """
+    project_dir = get_projects_root(username) / safe_name(title)
+    project_dir.mkdir(parents=True, exist_ok=True)
+    return project_dir
+
+def get_gc_state_path(username: str) -> Path:
+    """
+    A helper function to locate where the garbage collector keeps a user's progress between runs.
+
+    Returns:
+        Path: data/gc/<username>.json under the project root.
+    """
+    gc_dir = Path(__file__).parent.parent / "data" / "gc"
+    gc_dir.mkdir(parents=True, exist_ok=True)
+    return gc_dir / f"{safe_name(username)}.json"
+
+def safe_name(name: str) -> str:
+    """
+    A helper function to turn a user-chosen name, e.g. a project title or version name, into a single path component.
+    """
+    cleaned = "".join("_" if char in '<>:"/\\|?*' or ord(char) < 32 else char for char in name).strip(" .")
+    return cleaned or "_"
@@ -0,0 +1,281 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .asset_manager import CATEGORIES
+from .database import get_asset_dir, get_db, get_gc_state_path, get_projects_root, get_thumbnail_dir
+
+# Kinds of garbage, as reported by GarbageCollector.report()
+SCENE = "scene"          # a file in the projects folder that no version refers to
+THUMBNAIL = "thumbnail"  # a cached thumbnail of contents no asset has any more
+PARTIAL = "partial"      # a temporary file left by an interrupted write
+
+# Temporary names the app writes before renaming a file into place: .<name>.partial,
+# or .<name>.<pid> with the writing thread's id after it
+PARTIAL_NAME = re.compile(r"\..+\.(partial|\d+(\.\d+)?)")
+
+# Files beside a scene file that belong to it (autosave journal and snapshot)
+SIDECAR_SUFFIXES = (".journal", ".autosave")
+
+# Directory entries handled between checks of the time budget
+ENTRY_BATCH = 64
+# Rows read from the tables per mark step
+MARK_BATCH = 500
+# Seconds between saves of the sweep's progress; saving writes every candidate,
+# so doing it every slice would make slices grow with the garbage found
+SAVE_INTERVAL = 5.0
+
+class GarbageCollector:
+    """
+    Finds and deletes files in the app's data folders that nothing refers to any
+    more: scene files of deleted versions, thumbnails of deleted assets and
+    temporary files of interrupted writes.
+
+    Collection is mark and sweep. Marking reads the live scene paths from the
+    versions table and the live content hashes from the assets table; sweeping
+    walks the user's projects folder, asset folders and the thumbnail cache,
+    keeping anything marked. Both work in slices of at most a given time, so
+    they can run from the UI's idle loop, and the sweep's progress and findings
+    are saved so it continues where it stopped the next time the app runs.
+
+    Nothing is deleted until collect() is called, and each file is checked
+    against the tables again just before it goes, since the app may have started
+    using it since the sweep. Files modified within `grace` seconds are never
+    garbage, so a write in progress is not mistaken for one left behind. Files
+    in the asset folders are never garbage: those the assets table lacks are the
+    indexer's to add, and hidden ones are the user's.
+    """
+
+    def __init__(self, username: str, grace: float = 24 * 60 * 60):
+        """
+        Parameters:
+            username (str): The user whose folders are collected.
+            grace (float): Seconds since its last modification before a file can be garbage.
+        """
+        self.db = get_db()
+        self.username = username
+        user = self.db.get_user_section(username, 'security')
+        self.user_id: Optional[int] = user['user_id'] if user else None
+        self.grace = grace
+        self.state_path = get_gc_state_path(username)
+        self.projects_root = get_projects_root(username)
+        self.thumbnail_dir = get_thumbnail_dir()
+        self.roots = [
+            self.projects_root,
+            get_asset_dir(username, next(iter(CATEGORIES.values()))).parent,
+            self.thumbnail_dir
+        ]
+
+        # Marks are rebuilt on every run, as the tables may have changed in between
+        self.live_paths: Set[str] = set()
+        self.live_hashes: Set[str] = set()
+        self._version_cursor = 0
+        self._asset_cursor = 0
+        self.marked = False
+
+        # Directory being listed, kept open between slices of this run
+        self._directory: Optional[str] = None
+        self._entries: Optional[Iterator[os.DirEntry]] = None
+        self._changed = False
+        self._saved_at = time.monotonic()
+        self._load()
+
+    def _load(self) -> None:
+        # Saved sweep progress: directories still to list and the garbage found so far
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        self.pending: List[str] = state.get('pending', [str(root) for root in self.roots])
+        self.candidates: Dict[str, Tuple[str, int, int]] = {
+            path: tuple(entry) for path, entry in state.get('candidates', {}).items()
+        }
+
+    def _save(self, force: bool = False) -> None:
+        if not self._changed or not (force or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+            return
+        partial = self.state_path.with_name(f".{self.state_path.name}.partial")
+        partial.write_text(json.dumps({
+            'pending': self.pending,
+            'candidates': {path: list(entry) for path, entry in self.candidates.items()}
+        }))
+        os.replace(partial, self.state_path)
+        self._changed = False
+        self._saved_at = time.monotonic()
+
+    @property
+    def done(self) -> bool:
+        """Whether the sweep has finished, so report() covers every folder."""
+        return self.marked and not self.pending
+
+    def report(self) -> Dict:
+        """
+        Summarises the garbage found so far.
+
+        Returns:
+            Dict: files and bytes in total, and per kind under 'kinds'.
+        """
+        kinds: Dict[str, Dict[str, int]] = {}
+        for kind, size, _ in self.candidates.values():
+            totals = kinds.setdefault(kind, {'files': 0, 'bytes': 0})
+            totals['files'] += 1
+            totals['bytes'] += size
+        return {
+            'files': sum(totals['files'] for totals in kinds.values()),
+            'bytes': sum(totals['bytes'] for totals in kinds.values()),
+            'kinds': kinds
+        }
+
+    def restart(self) -> None:
+        """
+        Starts a new sweep of every folder, e.g. a while after the last one finished.
+        """
+        self.pending = [str(root) for root in self.roots]
+        self.candidates = {}
+        self._directory = self._entries = None
+        self.live_paths, self.live_hashes = set(), set()
+        self._version_cursor = self._asset_cursor = 0
+        self.marked = False
+        self._changed = True
+        self._save(force=True)
+
+    def step(self, budget: float = 0.01) -> bool:
+        """
+        Marks or sweeps for up to about `budget` seconds.
+
+        Returns:
+            bool: Whether the sweep has finished.
+        """
+        if self.user_id is None:
+            return True
+        deadline = time.monotonic() + budget
+        while not self.done and time.monotonic() < deadline:
+            if not self.marked:
+                self._mark()
+            else:
+                self._sweep()
+        self._save(force=self.done)
+        return self.done
+
+    def _mark(self) -> None:
+        rows = self.db.get_version_paths(self.user_id, self._version_cursor, MARK_BATCH)
+        if rows:
+            self._version_cursor = rows[-1][0]
+            for _, path in rows:
+                self.live_paths.add(path)
+                self.live_paths.update(path + suffix for suffix in SIDECAR_SUFFIXES)
+            return
+        rows = self.db.get_content_hashes(self._asset_cursor, MARK_BATCH)
+        if rows:
+            self._asset_cursor = rows[-1][0]
+            self.live_hashes.update(content_hash for _, content_hash in rows)
+            return
+        self.marked = True
+
+    def _sweep(self) -> None:
+        # Lists up to ENTRY_BATCH entries of the directory at the top of the stack; the
+        # directory stays on the stack until it is fully listed, so a run that stops
+        # part way through lists it again next time
+        if self._entries is None:
+            self._directory = self.pending[-1]
+            try:
+                self._entries = os.scandir(self._directory)
+            except (FileNotFoundError, NotADirectoryError):
+                self._entries = iter(())
+
+        now = time.time()
+        for _ in range(ENTRY_BATCH):
+            entry = next(self._entries, None)
+            if entry is None:
+                if hasattr(self._entries, "close"):
+                    self._entries.close()
+                self.pending.remove(self._directory)
+                self._directory = self._entries = None
+                self._changed = True
+                return
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    self.pending.insert(len(self.pending) - 1, entry.path)
+                    self._changed = True
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.grace:
+                continue
+            kind = self._classify(Path(entry.path))
+            if kind is not None and entry.path not in self.candidates:
+                self.candidates[entry.path] = (kind, stat.st_size, stat.st_mtime_ns)
+                self._changed = True
+
+    def _classify(self, path: Path) -> Optional[str]:
+        # The kind of garbage a file is, or None if it is live
+        if self.projects_root in path.parents:
+            root, live = SCENE, str(path) in self.live_paths
+        elif self.thumbnail_dir in path.parents:
+            root, live = THUMBNAIL, path.stem in self.live_hashes
+        else:
+            # Files in the asset folders belong to the user's library
+            return None
+        if path.name.startswith("."):
+            # Temporaries are renamed into place when complete, so one older than the grace
+            # period was abandoned; other hidden files are left alone
+            return PARTIAL if PARTIAL_NAME.fullmatch(path.name) else None
+        return None if live else root
+
+    def collect(self, budget: float = 0.01) -> bool:
+        """
+        Deletes found garbage for up to about `budget` seconds, checking first that each
+        file is unchanged and still unreferenced.
+
+        Returns:
+            bool: Whether every file found so far has been dealt with.
+        """
+        deadline = time.monotonic() + budget
+        while self.candidates and time.monotonic() < deadline:
+            batch = list(self.candidates.items())[:ENTRY_BATCH]
+            scenes = [path for path, (kind, _, _) in batch if kind == SCENE]
+            hashes = [Path(path).stem for path, (kind, _, _) in batch if kind == THUMBNAIL]
+            live_paths, live_hashes = self.db.get_referenced(
+                scenes + [path[:-len(suffix)] for path in scenes for suffix in SIDECAR_SUFFIXES if path.endswith(suffix)],
+                hashes
+            )
+
+            for path, (kind, size, mtime_ns) in batch:
+                del self.candidates[path]
+                self._changed = True
+                if kind == SCENE and (path in live_paths or any(
+                    path.endswith(suffix) and path[:-len(suffix)] in live_paths for suffix in SIDECAR_SUFFIXES
+                )):
+                    continue
+                if kind == THUMBNAIL and Path(path).stem in live_hashes:
+                    continue
+                try:
+                    stat = os.stat(path, follow_symlinks=False)
+                    if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                        continue
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                self._remove_empty_parents(Path(path))
+                if time.monotonic() >= deadline:
+                    break
+        self._save(force=not self.candidates)
+        return not self.candidates
+
+    def _remove_empty_parents(self, path: Path) -> None:
+        # Version folders emptied by the deletion go too, up to the projects folder
+        if self.projects_root not in path.parents:
+            return
+        for parent in path.parents:
+            if parent == self.projects_root:
+                return
+            try:
+                parent.rmdir()
+            except OSError:
+                return
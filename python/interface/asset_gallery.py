@@ -1,12 +1,35 @@
 # External imports
 import customtkinter as ctk
-from typing import List
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
+from tkinter import filedialog
+from typing import Dict, List, Optional, Tuple
 
 # Internal imports
 from utilities.UI import *
+from data_management.asset_indexer import AssetIndexer
+from data_management.asset_manager import CATEGORIES, AssetManager, thumbnail_path
+
+# Cards per gallery page: four rows of three
+PAGE_SIZE = 12
+
+# How often the gallery checks whether the indexer found changes, in milliseconds
+INDEX_POLL_INTERVAL = 1000
+
+def format_size(byte_size: int) -> str:
+    """
+    * Formats a byte count for display, e.g. "2.4 MB".
+    """
+    size = float(byte_size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
 
 class AssetCard(ctk.CTkFrame):
-    def __init__(self, master, title: str, size: str, import_date: str, **kwargs):
+    def __init__(self, master, title: str, size: str, import_date: str,
+                 thumbnail: Optional[Path] = None, **kwargs):
         super().__init__(master, fg_color=LIGHTER_BLUE, **kwargs)
 
         # Configure grid weights
@@ -34,6 +57,12 @@ class AssetCard(ctk.CTkFrame):
             fg_color=IMAGE_COLOUR,
             height=200
         )
+        if thumbnail is not None and thumbnail.exists():
+            with Image.open(thumbnail) as image:
+                image.load()
+                self.thumbnail = ctk.CTkImage(image, size=image.size)
+            self.image_label = ctk.CTkLabel(self.image_frame, image=self.thumbnail, text="")
+            self.image_label.place(relx=0.5, rely=0.5, anchor="center")
         
         # Import date
         self.date_label = ctk.CTkLabel(
@@ -50,9 +79,29 @@ class AssetCard(ctk.CTkFrame):
         self.date_label.grid(row=2, column=0, sticky="w", padx=10, pady=(5, 10))
 
 class AssetGallery(ctk.CTkFrame):
-    def __init__(self, master, **kwargs):
+    def __init__(self, master, username: str, **kwargs):
+        """
+        * Shows the user's assets a page at a time, filtered by category, and imports new ones.
+
+        Parameters:
+        username (str): The signed-in user, whose assets are shown.
+        """
         super().__init__(master, fg_color=DARK_BLUE, **kwargs)
 
+        self.asset_manager = AssetManager(username)
+        self.category = CATEGORIES["Textures"]
+        self.selected_file: Optional[str] = None
+
+        # Keyset cursors: where each page visited so far starts, so Previous can go back
+        self.page_starts: List[Optional[Tuple[str, int]]] = [None]
+        self.has_next_page = False
+        self.cards: List[AssetCard] = []
+        self.page_rows: List[Dict] = []
+
+        # Picks up files added to the asset folders outside the app
+        self.indexer = AssetIndexer(self.asset_manager)
+        self.indexed_generation = 0
+
         # Configure grid weights
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(3, weight=1)  # Make asset grid expandable
@@ -71,12 +120,14 @@ class AssetGallery(ctk.CTkFrame):
         
         # Category tabs
         self.category_frame = ctk.CTkFrame(self, fg_color="transparent")
-        self.categories = ["Textures", "Backgrounds"]
+        self.categories = list(CATEGORIES)
         self.category_buttons: List[ctk.CTkButton] = []
 
         def category_button_command(index):
             for i, btn in enumerate(self.category_buttons):
                 btn.configure(fg_color=BUTTON_COLOUR if i == index else "transparent")
+            self.category = CATEGORIES[self.categories[index]]
+            self.load_page(reset=True)
 
         for i, category in enumerate(self.categories):
             btn = ctk.CTkButton(
@@ -128,28 +179,40 @@ class AssetGallery(ctk.CTkFrame):
             self.button_frame,
             text="Select File",
             fg_color="#1e222e",
-            width=100
+            width=100,
+            command=self.select_file
         )
         self.import_btn = ctk.CTkButton(
             self.button_frame,
             text="Import Asset",
             fg_color=BUTTON_COLOUR,
-            width=100
+            width=100,
+            command=self.import_file
         )
 
         # Asset grid
         self.asset_grid = ctk.CTkFrame(self, fg_color="transparent")
         self.asset_grid.grid_columnconfigure((0, 1, 2), weight=1)
         
-        # Sample assets
-        self.assets = [
-            ("Metal Surface", "2.4 MB", "15-10-2024"),
-            ("Brick Pattern", "1.8 MB", "20-10-2024"),
-            ("Wood Grain", "2.2 MB", "22-10-2024"),
-            ("Marble Texture", "4.1 MB", "25-10-2024"),
-            ("Concrete Surface", "2.7 MB", "26-10-2024"),
-            ("Fabric Pattern", "3.5 MB", "26-10-2024")
-        ]
+        # Page controls
+        self.page_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.page_frame.grid_columnconfigure(1, weight=1)
+
+        self.prev_btn = ctk.CTkButton(
+            self.page_frame,
+            text="Previous",
+            fg_color=BUTTON_COLOUR,
+            width=100,
+            command=self.previous_page
+        )
+        self.page_label = ctk.CTkLabel(self.page_frame, text="", text_color="gray")
+        self.next_btn = ctk.CTkButton(
+            self.page_frame,
+            text="Next",
+            fg_color=BUTTON_COLOUR,
+            width=100,
+            command=self.next_page
+        )
 
         # Layout
         # Search bar
@@ -174,14 +237,96 @@ class AssetGallery(ctk.CTkFrame):
         # Asset grid
         self.asset_grid.grid(row=3, column=0, sticky="nsew", padx=20, pady=10)
         
-        # Create and layout asset cards
-        for i, (title, size, date) in enumerate(self.assets):
-            row = i // 3
-            col = i % 3
-            card = AssetCard(
-                self.asset_grid,
-                title=title,
-                size=size,
-                import_date=date
-            )
-            card.grid(row=row, column=col, padx=10, pady=10, sticky="nsew")
\ No newline at end of file
+        # Page controls
+        self.page_frame.grid(row=4, column=0, sticky="ew", padx=20, pady=(0, 20))
+        self.prev_btn.grid(row=0, column=0)
+        self.page_label.grid(row=0, column=1)
+        self.next_btn.grid(row=0, column=2)
+
+        self.load_page(reset=True)
+        self.indexer.start()
+        self.after(INDEX_POLL_INTERVAL, self._poll_indexer)
+
+    def _poll_indexer(self) -> None:
+        # Tk is not thread-safe, so the page is reloaded here rather than from the indexer thread
+        if self.indexer.generation != self.indexed_generation:
+            self.indexed_generation = self.indexer.generation
+            self.load_page()
+        self.after(INDEX_POLL_INTERVAL, self._poll_indexer)
+
+    def destroy(self) -> None:
+        self.indexer.stop()
+        super().destroy()
+
+    def load_page(self, reset: bool = False) -> None:
+        """
+        * Shows the page starting at the last cursor in self.page_starts, building cards for that page only.
+
+        Parameters:
+        reset (bool): Go back to the first page, e.g. after changing category.
+        """
+        if reset:
+            self.page_starts = [None]
+
+        # One extra row tells whether there is a next page without counting the table
+        rows = self.asset_manager.page(self.category, self.page_starts[-1], PAGE_SIZE + 1)
+        self.has_next_page = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
+
+        for card in self.cards:
+            card.destroy()
+        self.cards = [self._create_card(row) for row in rows]
+        for i, card in enumerate(self.cards):
+            card.grid(row=i // 3, column=i % 3, padx=10, pady=10, sticky="nsew")
+
+        self.page_label.configure(text=f"Page {len(self.page_starts)}" if rows else "No assets yet")
+        self.prev_btn.configure(state="normal" if len(self.page_starts) > 1 else "disabled")
+        self.next_btn.configure(state="normal" if self.has_next_page else "disabled")
+        self.page_rows = rows
+
+    def _create_card(self, asset: Dict) -> "AssetCard":
+        imported = datetime.strptime(asset["imported_at"], "%Y-%m-%d %H:%M:%S")
+        return AssetCard(
+            self.asset_grid,
+            title=asset["name"],
+            size=format_size(asset["byte_size"]),
+            import_date=imported.strftime("%d-%m-%Y"),
+            thumbnail=thumbnail_path(asset["content_hash"])
+        )
+
+    def next_page(self) -> None:
+        if self.has_next_page:
+            self.page_starts.append(AssetManager.cursor(self.page_rows))
+            self.load_page()
+
+    def previous_page(self) -> None:
+        if len(self.page_starts) > 1:
+            self.page_starts.pop()
+            self.load_page()
+
+    def select_file(self) -> None:
+        """
+        * Chooses the file the Import Asset button will import.
+        """
+        path = filedialog.askopenfilename(title="Select Asset")
+        if path:
+            self.selected_file = path
+            self.drop_text_label.configure(text=path)
+
+    def import_file(self) -> None:
+        """
+        * Imports the selected file into the current category and shows it on the first page.
+        """
+        if self.selected_file is None:
+            self.drop_text_label.configure(text="Select a file to import first")
+            return
+        try:
+            asset_id = self.asset_manager.import_file(self.selected_file, self.category)
+        except OSError as e:
+            self.drop_text_label.configure(text=f"Could not import: {e}")
+            return
+        self.drop_text_label.configure(
+            text="Imported" if asset_id is not None else "An asset with that name already exists"
+        )
+        self.selected_file = None
+        self.load_page(reset=True)
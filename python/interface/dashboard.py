@@ -7,6 +7,7 @@ from utilities.UI import *
 from interface.version_control import VersionControl
 from interface.asset_gallery import AssetGallery
 from interface.settings import Settings
+from interface.render_view import RenderView
 
 class TopMenuFrame(ctk.CTkFrame):
     def __init__(
@@ -18,16 +19,17 @@ class TopMenuFrame(ctk.CTkFrame):
         super().__init__(master, fg_color=DARK_BLUE, **kwargs)
 
         # Configure grid weights
-        self.grid_columnconfigure(3, weight=1)  # Make the middle space expand
+        self.grid_columnconfigure(4, weight=1)  # Make the middle space expand
         self.grid_rowconfigure(1, weight=1)
 
         # Initialize frames dictionary to store menu frames
         self.frames: Dict[str, ctk.CTkFrame] = {}
         
         # Create and store menu frames
-        self.frames["version_control"] = VersionControl(self)
-        self.frames["asset_gallery"] = AssetGallery(self)
-        self.frames["settings"] = Settings(self)
+        self.frames["version_control"] = VersionControl(self, username)
+        self.frames["asset_gallery"] = AssetGallery(self, username)
+        self.frames["render"] = RenderView(self, username)
+        self.frames["settings"] = Settings(self, username)
 
         # Create buttons
         self.version_control_btn = ctk.CTkButton(
@@ -48,6 +50,15 @@ class TopMenuFrame(ctk.CTkFrame):
             height=BUTTON_HEIGHT
         )
         
+        self.render_btn = ctk.CTkButton(
+            self,
+            text="Render",
+            fg_color="transparent",
+            command=lambda: self.show_menu("render"),
+            width=175,
+            height=BUTTON_HEIGHT
+        )
+        
         self.settings_btn = ctk.CTkButton(
             self,
             text="Settings",
@@ -61,6 +72,7 @@ class TopMenuFrame(ctk.CTkFrame):
         self.buttons = {
             "version_control": self.version_control_btn,
             "asset_gallery": self.asset_gallery_btn,
+            "render": self.render_btn,
             "settings": self.settings_btn
         }
 
@@ -76,12 +88,13 @@ class TopMenuFrame(ctk.CTkFrame):
         ypad = (25, 15)
         self.version_control_btn.grid(row=0, column=0, padx=(20, 10), pady=ypad)
         self.asset_gallery_btn.grid(row=0, column=1, padx=10, pady=ypad)
-        self.settings_btn.grid(row=0, column=2, padx=10, pady=ypad)
-        self.username_label.grid(row=0, column=3, padx=20, pady=ypad, sticky="e")
+        self.render_btn.grid(row=0, column=2, padx=10, pady=ypad)
+        self.settings_btn.grid(row=0, column=3, padx=10, pady=ypad)
+        self.username_label.grid(row=0, column=4, padx=20, pady=ypad, sticky="e")
 
         # Grid all frames in the same position
         for frame in self.frames.values():
-            frame.grid(row=1, column=0, columnspan=4, sticky="nsew")
+            frame.grid(row=1, column=0, columnspan=5, sticky="nsew")
 
         # Show initial frame
         self.show_menu("version_control")
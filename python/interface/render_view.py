@@ -0,0 +1,595 @@
+# External imports
+import math
+import os
+import threading
+import time
+from tkinter import filedialog
+from typing import Callable, Dict, List, Optional, Tuple
+
+import customtkinter as ctk
+from PIL import Image, ImageTk
+
+# Internal imports
+from utilities.UI import *
+from data_management.database import get_asset_dir, get_db
+
+# Used until the user saves render preferences; mirrors the render_preferences table defaults
+DEFAULT_PREFERENCES = {
+    "image_width": 800,
+    "aspect_ratio": 1.778,
+    "focus_distance": 10.0,
+    "aperture": 0.1,
+    "max_depth": 50,
+    "samples_per_pixel": 100,
+    "adaptive_sampling": 0,
+    "noise_threshold": 0.01,
+    "min_samples": 16,
+    "max_samples": 1024
+}
+
+# Environment map formats the renderer can decode
+BACKGROUND_EXTENSIONS = {".hdr", ".exr", ".png", ".jpg", ".jpeg"}
+SKY = "Sky"
+
+# The camera used by src/main.rs
+LOOK_FROM = (13.0, 2.0, 3.0)
+LOOK_AT = (0.0, 0.0, 0.0)
+
+# How often edits to the open scene are journalled when autosave is on, in milliseconds
+AUTOSAVE_INTERVAL = 2000
+
+class RenderView(ctk.CTkFrame):
+    def __init__(self, master, username: str, **kwargs):
+        """
+        * Shows the current render and lets the user drag a rectangle over it to re-render or refine just that region.
+
+        Parameters:
+        username (str): The signed-in user, whose render preferences configure the camera.
+        """
+        super().__init__(master, fg_color=DARK_BLUE, **kwargs)
+
+        self.username = username
+        self.scene = None
+        self.world = None
+        self.camera = None
+        self.framebuffer = None
+        self.seed: Optional[int] = None
+        self.busy = False
+        # Journals edits to the open scene when the user has autosave on
+        self.autosave = None
+
+        # Camera placement, applied on top of the render preferences
+        self.camera_overrides: Dict = {"look_from": list(LOOK_FROM), "look_at": list(LOOK_AT)}
+        self.preview = None
+        self._preview_job: Optional[str] = None
+
+        # Canvas state: the displayed image, its scale relative to the framebuffer and the drag rectangle
+        self._photo: Optional[ImageTk.PhotoImage] = None
+        self._scale = 1.0
+        self._drag_start: Optional[Tuple[int, int]] = None
+        self._selection: Optional[int] = None
+
+        # Shared 8-bit display image the renderer writes tiles into; each tile is its own canvas item
+        self.display = None
+        self._display_image: Optional[Image.Image] = None
+        self._tile_items: Dict[Tuple[int, int, int, int], Tuple[int, ImageTk.PhotoImage]] = {}
+        self._tile_scale = 0.0
+
+        # Configure grid weights
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+
+        # Toolbar
+        self.toolbar = ctk.CTkFrame(self, fg_color="transparent")
+        self.toolbar.grid_columnconfigure(5, weight=1)
+
+        self.open_btn = ctk.CTkButton(
+            self.toolbar,
+            text="Open Scene",
+            fg_color=BUTTON_COLOUR,
+            command=self.open_scene,
+            height=30
+        )
+        self.render_btn = ctk.CTkButton(
+            self.toolbar,
+            text="Render",
+            fg_color=BUTTON_COLOUR,
+            command=self.render_frame,
+            height=30
+        )
+
+        # What dragging a rectangle does to the cached render
+        self.region_mode = ctk.CTkSegmentedButton(
+            self.toolbar,
+            values=["Re-render", "Refine"],
+            height=30
+        )
+        self.region_mode.set("Refine")
+
+        self.preview_switch = ctk.CTkSwitch(
+            self.toolbar,
+            text="Preview",
+            command=self.toggle_preview
+        )
+
+        # Full renders with statistics are added to the user's render history
+        self.stats_switch = ctk.CTkSwitch(
+            self.toolbar,
+            text="Stats"
+        )
+
+        self.status_label = ctk.CTkLabel(
+            self.toolbar,
+            text="Open a scene to render",
+            text_color="gray",
+            anchor="e"
+        )
+
+        # Lens controls, used by both the preview and full renders
+        self.lens_frame = ctk.CTkFrame(self, fg_color="transparent")
+        preferences = self._preferences()
+
+        self.focus_label = ctk.CTkLabel(self.lens_frame, text="Focus Distance")
+        self.focus_slider = ctk.CTkSlider(
+            self.lens_frame,
+            from_=0.5,
+            to=50.0,
+            command=lambda value: self.move_camera(focus_distance=float(value))
+        )
+        self.focus_slider.set(float(preferences["focus_distance"]))
+
+        self.aperture_label = ctk.CTkLabel(self.lens_frame, text="Aperture")
+        self.aperture_slider = ctk.CTkSlider(
+            self.lens_frame,
+            from_=0.0,
+            to=2.0,
+            command=lambda value: self.move_camera(aperture=float(value))
+        )
+        self.aperture_slider.set(float(preferences["aperture"]))
+
+        # Display controls: applied to the finished framebuffer without re-rendering
+        self.exposure_label = ctk.CTkLabel(self.lens_frame, text="Exposure")
+        self.exposure_slider = ctk.CTkSlider(
+            self.lens_frame,
+            from_=-4.0,
+            to=4.0,
+            command=lambda _: self.update_tonemap()
+        )
+        self.exposure_slider.set(0.0)
+
+        self.operator_menu = ctk.CTkOptionMenu(
+            self.lens_frame,
+            values=["clamp", "reinhard", "aces"],
+            fg_color=BUTTON_COLOUR,
+            command=lambda _: self.update_tonemap()
+        )
+
+        self.background_menu = ctk.CTkOptionMenu(
+            self.lens_frame,
+            values=[SKY, *self._backgrounds()],
+            fg_color=BUTTON_COLOUR,
+            command=self.set_background
+        )
+
+        self.canvas = ctk.CTkCanvas(self, bg=DARKER_BLUE, highlightthickness=0)
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+        self.canvas.bind("<Configure>", lambda _: self.show_framebuffer())
+        # Mouse wheel: delta on Windows/macOS, buttons 4/5 on X11
+        self.canvas.bind("<MouseWheel>", lambda event: self._dolly(0.9 if event.delta > 0 else 1.1))
+        self.canvas.bind("<Button-4>", lambda _: self._dolly(0.9))
+        self.canvas.bind("<Button-5>", lambda _: self._dolly(1.1))
+
+        # Layout
+        self.toolbar.grid(row=0, column=0, sticky="ew", padx=25, pady=(25, 10))
+        self.open_btn.grid(row=0, column=0, padx=(0, 10))
+        self.render_btn.grid(row=0, column=1, padx=10)
+        self.region_mode.grid(row=0, column=2, padx=10)
+        self.preview_switch.grid(row=0, column=3, padx=10)
+        self.stats_switch.grid(row=0, column=4, padx=10)
+        self.status_label.grid(row=0, column=5, sticky="e")
+        self.lens_frame.grid(row=1, column=0, sticky="ew", padx=25, pady=(0, 10))
+        self.focus_label.grid(row=0, column=0, padx=(0, 10))
+        self.focus_slider.grid(row=0, column=1, padx=(0, 25))
+        self.aperture_label.grid(row=0, column=2, padx=(0, 10))
+        self.aperture_slider.grid(row=0, column=3, padx=(0, 25))
+        self.exposure_label.grid(row=0, column=4, padx=(0, 10))
+        self.exposure_slider.grid(row=0, column=5, padx=(0, 25))
+        self.operator_menu.grid(row=0, column=6, padx=(0, 25))
+        self.background_menu.grid(row=0, column=7)
+        self.canvas.grid(row=2, column=0, sticky="nsew", padx=25, pady=(0, 25))
+
+        self.after(AUTOSAVE_INTERVAL, self._autosave_tick)
+
+    def open_scene(self) -> None:
+        """
+        * Loads a scene file with any autosaved edits and clears the cached render, updating the world in place when the new scene is a version of the open one.
+        """
+        path = filedialog.askopenfilename(title="Open Scene")
+        if not path or self.busy:
+            return
+        if self.preview_switch.get():
+            self.preview_switch.deselect()
+            self.toggle_preview()
+
+        from three_dev import Autosave, diff_scenes, recover
+
+        previous = self.scene
+        try:
+            # Brings back edits autosaved before the app last closed or crashed
+            self.scene = recover(path)
+        except (OSError, ValueError) as e:
+            self.status_label.configure(text=f"Could not open scene: {e}")
+            return
+        if self.autosave is not None:
+            self.autosave.close()
+            self.autosave = None
+        preferences = get_db().get_user_section(self.username, "preferences")
+        if preferences and preferences["auto_save"]:
+            self.autosave = Autosave(self.scene, path)
+        if self.world is not None:
+            # Another version of the same scene only updates the objects that differ;
+            # a different scene leaves the world to be built on the next render, off this thread
+            from three_dev.render import update_world
+
+            diff = diff_scenes(previous, self.scene)
+            if diff.rebuild or len(diff) > len(self.scene) // 4:
+                self.world = None
+            else:
+                self.world = update_world(self.world, self.scene, diff)
+        self.framebuffer = None
+        self.seed = None
+        self._close_display()
+        self.background_menu.set(os.path.basename(self.scene.background) if self.scene.background else SKY)
+        self.status_label.configure(text=f"Loaded {path}")
+
+    def _autosave_tick(self) -> None:
+        # Only copies the rows edited since the last tick; the journal is written off this thread
+        if self.autosave is not None:
+            self.autosave.record()
+        self.after(AUTOSAVE_INTERVAL, self._autosave_tick)
+
+    def destroy(self) -> None:
+        if self.autosave is not None:
+            self.autosave.close()
+        super().destroy()
+
+    def _preferences(self) -> Dict:
+        preferences = get_db().get_user_section(self.username, "render")
+        return {**DEFAULT_PREFERENCES, **(preferences or {})}
+
+    def _backgrounds(self) -> List[str]:
+        # Environment maps in the user's assets/backgrounds folder
+        folder = get_asset_dir(self.username, "backgrounds")
+        return sorted(path.name for path in folder.iterdir() if path.suffix.lower() in BACKGROUND_EXTENSIONS)
+
+    def set_background(self, name: str) -> None:
+        """
+        * Lights the scene with an environment map from the user's backgrounds, or the default sky.
+        """
+        if self.scene is None or self.busy:
+            return
+        path = None if name == SKY else str(get_asset_dir(self.username, "backgrounds") / name)
+        self.scene.set_background(path)
+        if self.autosave is not None:
+            self.autosave.record()
+        # Decoded maps are cached by the renderer, so rebuilding the world is cheap; the cached
+        # render was lit by the old background, so regions can no longer be re-rendered into it
+        self.world = None
+        self.framebuffer = None
+        self._close_display()
+        if self.preview is not None:
+            from three_dev.render import build_world
+
+            self.world = build_world(self.scene)
+            self.preview.world = self.world
+            self.preview.set_camera()
+            self._schedule_preview()
+        self.status_label.configure(text=f"Background: {name}")
+
+    def _camera_settings(self) -> Dict:
+        from three_dev.render import camera_settings
+
+        settings = camera_settings(self._preferences(), LOOK_FROM, LOOK_AT)
+        settings.update(self.camera_overrides)
+        return settings
+
+    def render_frame(self) -> None:
+        """
+        * Renders the whole frame in the background, replacing the cached render.
+        """
+        if self.scene is None:
+            self.status_label.configure(text="Open a scene to render")
+            return
+        if self.busy:
+            return
+        # The final render takes over the canvas from the preview
+        if self.preview_switch.get():
+            self.preview_switch.deselect()
+            self.toggle_preview()
+
+        from three_dev import _core, Framebuffer, RenderStats
+
+        # A fixed seed per cached render lets region re-renders match it exactly
+        self.seed = int.from_bytes(os.urandom(7), "little")
+        self.camera = _core.Camera(**self._camera_settings(), seed=self.seed)
+        self.framebuffer = Framebuffer(self.camera.image_width, self.camera.image_height)
+        self._open_display(self.camera.image_width, self.camera.image_height)
+        # The preferences as this render used them, with the lens sliders and camera placement
+        preferences = {**self._preferences(), **self.camera_overrides}
+        stats = RenderStats() if self.stats_switch.get() else None
+
+        def job() -> str:
+            from three_dev.render import build_world, render_region
+
+            if self.world is None:
+                self.world = build_world(self.scene)
+            started = time.perf_counter()
+            # Rendered tile by tile so the canvas fills in as tiles finish
+            render_region(self.world, self.camera, self.framebuffer,
+                          (0, 0, self.framebuffer.width, self.framebuffer.height), display=self.display, stats=stats)
+            message = f"Rendered {self.camera.image_width}x{self.camera.image_height}"
+            if stats is None:
+                return message
+            stats.seconds = time.perf_counter() - started
+            if preferences.get("user_id") is not None:
+                get_db().add_render_history(preferences["user_id"], preferences, stats.to_dict())
+            return f"{message}, {stats.rays_per_second / 1e6:.2f} Mrays/s"
+
+        self._run("Rendering...", job)
+
+    def render_region(self, region: Tuple[int, int, int, int]) -> None:
+        """
+        * Re-renders or refines a pixel rectangle of the cached render, depending on the selected mode.
+
+        Parameters:
+        region (Tuple[int, int, int, int]): (x0, y0, x1, y1) in framebuffer pixels.
+        """
+        if self.framebuffer is None:
+            self.status_label.configure(text="Render the full frame first")
+            return
+        refine = self.region_mode.get() == "Refine"
+
+        def job() -> str:
+            from three_dev.render import build_world, render_region
+
+            if self.world is None:
+                self.world = build_world(self.scene)
+            pixels = render_region(self.world, self.camera, self.framebuffer, region,
+                                   refine=refine, display=self.display)
+            return f"{'Refined' if refine else 'Re-rendered'} {pixels} pixels"
+
+        self._run("Rendering region...", job)
+
+    def _run(self, message: str, job: Callable[[], str]) -> None:
+        # Renders run off the Tk thread; the result is shown once the job finishes
+        if self.busy:
+            return
+        self.busy = True
+        self.status_label.configure(text=message)
+
+        def run() -> None:
+            try:
+                result = job()
+            except Exception as e:
+                result = f"Render failed: {e}"
+            self.after(0, lambda: self._finish(result))
+
+        threading.Thread(target=run, daemon=True).start()
+        self._poll_display()
+
+    def _finish(self, message: str) -> None:
+        self.busy = False
+        self.status_label.configure(text=message)
+        self.show_framebuffer()
+
+    # Display ------------------------------------------------------------------
+    def _open_display(self, width: int, height: int) -> None:
+        # Reuses the display buffer while the image size is unchanged
+        from three_dev.display import DisplayBuffer
+
+        if self.display is not None and (self.display.width, self.display.height) == (width, height):
+            return
+        self._close_display()
+        self.display = DisplayBuffer(width, height, tonemap=self._tonemap())
+        self._display_image = self.display.image()
+
+    def _tonemap(self):
+        from three_dev import Tonemap
+
+        return Tonemap(exposure=self.exposure_slider.get(), operator=self.operator_menu.get())
+
+    def update_tonemap(self) -> None:
+        """
+        * Re-displays the cached render with the current exposure and tonemap operator.
+        """
+        tonemap = self._tonemap()
+        if self.preview is not None:
+            self.preview.tonemap = tonemap
+        if self.display is None:
+            return
+        self.display.tonemap = tonemap
+        # While rendering, tiles pick up the new settings as they finish
+        if self.framebuffer is not None and not self.busy:
+            self.display.update(self.framebuffer)
+            self._draw_dirty()
+
+    def _close_display(self) -> None:
+        self._clear_tiles()
+        if self.display is not None:
+            # The PIL image maps the shared memory, so it has to go before the buffer can close
+            self._display_image = None
+            self.display.close()
+            self.display = None
+
+    def _clear_tiles(self) -> None:
+        self.canvas.delete("image")
+        self._tile_items.clear()
+
+    def _poll_display(self) -> None:
+        # Redraws finished tiles while a render is running
+        self._draw_dirty()
+        if self.busy:
+            self.after(50, self._poll_display)
+
+    def _draw_dirty(self) -> None:
+        """
+        * Redraws only the tiles the renderer has written since the last redraw.
+        """
+        if self.display is None or self.preview is not None:
+            return
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width < 2 or height < 2:
+            return
+
+        self._scale = min(width / self.display.width, height / self.display.height)
+        if self._scale != self._tile_scale:
+            # Tile placement depends on the scale, so a resize redraws everything
+            self._tile_scale = self._scale
+            self._clear_tiles()
+            self.display.mark()
+
+        for tile in self.display.take_dirty():
+            # Adjacent tiles share rounded edges, so the scaled tiles meet without gaps
+            x0, y0, x1, y1 = (int(value * self._scale) for value in tile)
+            image = self._display_image.crop(tile).resize((max(1, x1 - x0), max(1, y1 - y0)))
+            photo = ImageTk.PhotoImage(image)
+            if tile in self._tile_items:
+                item, _ = self._tile_items[tile]
+                self.canvas.itemconfigure(item, image=photo)
+            else:
+                item = self.canvas.create_image(x0, y0, anchor="nw", image=photo, tags="image")
+                self.canvas.tag_lower(item)
+            self._tile_items[tile] = (item, photo)
+
+    def show_framebuffer(self) -> None:
+        """
+        * Draws the cached render scaled to fit the canvas.
+        """
+        if self.display is None or self.preview is not None:
+            return
+        self.display.mark()
+        self._draw_dirty()
+
+    def _draw(self, pixels) -> None:
+        # Draws a (height, width, 3) uint8 array scaled to fit the canvas, replacing any tiles
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width < 2 or height < 2:
+            return
+
+        image_height, image_width = pixels.shape[:2]
+        self._scale = min(width / image_width, height / image_height)
+        size = (max(1, int(image_width * self._scale)), max(1, int(image_height * self._scale)))
+        image = Image.fromarray(pixels)
+        if size != image.size:
+            image = image.resize(size)
+        self._photo = ImageTk.PhotoImage(image)
+        self._clear_tiles()
+        self._tile_scale = 0.0
+        self.canvas.create_image(0, 0, anchor="nw", image=self._photo, tags="image")
+        self.canvas.tag_lower("image")
+
+    # Preview ------------------------------------------------------------------
+    def toggle_preview(self) -> None:
+        """
+        * Starts or stops the interactive preview. While it runs, dragging orbits the camera and the wheel dollies it.
+        """
+        if not self.preview_switch.get():
+            if self._preview_job is not None:
+                self.after_cancel(self._preview_job)
+                self._preview_job = None
+            self.preview = None
+            self.show_framebuffer()
+            return
+
+        if self.scene is None:
+            self.preview_switch.deselect()
+            self.status_label.configure(text="Open a scene to preview")
+            return
+
+        from three_dev.preview import PreviewRenderer
+        from three_dev.render import build_world
+
+        if self.world is None:
+            self.world = build_world(self.scene)
+        self.preview = PreviewRenderer(self.world, self._camera_settings())
+        self.preview.tonemap = self._tonemap()
+        self.status_label.configure(text="Previewing")
+        self._schedule_preview()
+
+    def _schedule_preview(self) -> None:
+        if self.preview is not None and self._preview_job is None:
+            self._preview_job = self.after(1, self._preview_tick)
+
+    def _preview_tick(self) -> None:
+        # Each tick does about one frame budget of work; once refinement converges the
+        # loop stops until the camera moves again
+        self._preview_job = None
+        if self.preview is None:
+            return
+        # Composited at the canvas size, and drawn inside the step so the budget covers it
+        self.preview.set_view(self.canvas.winfo_width(), self.canvas.winfo_height())
+        if self.preview.step(draw=self._draw) is not None:
+            self._schedule_preview()
+
+    def move_camera(self, **changes) -> None:
+        """
+        * Updates the camera placement and restarts the preview from a fast frame.
+        """
+        self.camera_overrides.update(changes)
+        if self.preview is not None:
+            self.preview.set_camera(**changes)
+            self._schedule_preview()
+
+    def _orbit(self, dx: int, dy: int) -> None:
+        look_from, look_at = self.camera_overrides["look_from"], self.camera_overrides["look_at"]
+        offset = [a - b for a, b in zip(look_from, look_at)]
+        radius = math.sqrt(sum(value * value for value in offset))
+        azimuth = math.atan2(offset[2], offset[0]) + dx * 0.01
+        elevation = max(-1.5, min(1.5, math.asin(offset[1] / radius) + dy * 0.01))
+        self.move_camera(look_from=[
+            look_at[0] + radius * math.cos(elevation) * math.cos(azimuth),
+            look_at[1] + radius * math.sin(elevation),
+            look_at[2] + radius * math.cos(elevation) * math.sin(azimuth)
+        ])
+
+    def _dolly(self, factor: float) -> None:
+        if self.preview is None:
+            return
+        look_from, look_at = self.camera_overrides["look_from"], self.camera_overrides["look_at"]
+        self.move_camera(look_from=[b + (a - b) * factor for a, b in zip(look_from, look_at)])
+
+    # Mouse --------------------------------------------------------------------
+    def _on_press(self, event) -> None:
+        self._drag_start = (event.x, event.y)
+        if self.preview is not None:
+            return
+        if self._selection is not None:
+            self.canvas.delete(self._selection)
+        self._selection = self.canvas.create_rectangle(
+            event.x, event.y, event.x, event.y, outline=BUTTON_COLOUR, width=2
+        )
+
+    def _on_drag(self, event) -> None:
+        if self._drag_start is None:
+            return
+        if self.preview is not None:
+            self._orbit(event.x - self._drag_start[0], event.y - self._drag_start[1])
+            self._drag_start = (event.x, event.y)
+            return
+        self.canvas.coords(self._selection, *self._drag_start, event.x, event.y)
+
+    def _on_release(self, event) -> None:
+        if self._drag_start is None or self.preview is not None:
+            self._drag_start = None
+            return
+        (x0, y0), self._drag_start = self._drag_start, None
+        self.canvas.delete(self._selection)
+        self._selection = None
+
+        # Canvas coordinates back to framebuffer pixels; clicks without a drag are ignored
+        region = tuple(int(round(value / self._scale)) for value in (x0, y0, event.x, event.y))
+        if abs(region[2] - region[0]) < 2 or abs(region[3] - region[1]) < 2:
+            return
+        self.render_region(region)
@@ -1,11 +1,17 @@
 import customtkinter as ctk
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from data_management.data_manager import DataManager  # Import DataManager
+from data_management.database import get_db
+from data_management.garbage_collector import GarbageCollector
 from data_management.user_manager import UserManager    # Import UserManager
+from interface.asset_gallery import format_size
 
 from utilities.UI import *
 
+GC_INTERVAL = 500                  # ms between idle slices of garbage collection
+GC_BUDGET = 0.01                   # seconds of work per slice
+GC_RESCAN_INTERVAL = 60 * 60 * 1000  # ms before sweeping again after a sweep finishes
+
 class SettingsSection(ctk.CTkFrame):
     def __init__(self, master, title: str, **kwargs):
         super().__init__(master, fg_color=DARK_BLUE, **kwargs)
@@ -47,14 +53,14 @@ class SettingsSection(ctk.CTkFrame):
 
 
 class Settings(ctk.CTkFrame):
-    def __init__(self, master, **kwargs):
+    def __init__(self, master, username: Optional[str] = None, **kwargs):
         super().__init__(master, fg_color=DARK_BLUE, **kwargs)
 
-        self.data_manager = DataManager()
+        self.data_manager = get_db()
         self.user_manager = UserManager()
-        self.current_user_id = None  # Initialize to None
-        # self.current_user_id = self.user_manager.get_current_user_id() # This method does not exist
-        # Instead, you should retrieve the user ID when displaying the settings, e.g., from master or session
+        self.username = username
+        user = self.data_manager.get_user_section(username, 'security') if username else None
+        self.current_user_id = user['user_id'] if user else None
         self.user_preferences = None
         self.render_settings = None
 
@@ -213,9 +219,111 @@ class Settings(ctk.CTkFrame):
         self.samples_slider.set(current_samples) # Set default value from db
         self.render_prefs.add_setting("Samples per Pixel", self.samples_slider)
 
+        # Adaptive sampling switch
+        self.adaptive_switch = ctk.CTkSwitch(
+            self.render_prefs,
+            text="",
+            height=32,
+            width=60,
+            command=self.toggle_adaptive_sampling
+        )
+        adaptive_selected = False # Default to deselect
+        if self.render_settings and self.render_settings.adaptive_sampling:
+            adaptive_selected = True
+        self.adaptive_switch.select() if adaptive_selected else self.adaptive_switch.deselect() # Set default value from db
+        self.render_prefs.add_setting("Adaptive Sampling", self.adaptive_switch)
+
+        # Noise threshold entry with save button
+        self.noise_entry = ctk.CTkEntry(
+            self.render_prefs,
+            placeholder_text="Enter noise threshold...",
+            width=200,
+            height=32,
+            font=("Source Code Pro", 14)
+        )
+        current_noise = "" # Default empty
+        if self.render_settings and self.render_settings.noise_threshold is not None:
+            current_noise = str(self.render_settings.noise_threshold)
+        self.noise_entry.insert(0, current_noise) # Set default value from db
+        noise_save = ctk.CTkButton(
+            self.render_prefs,
+            text="Save",
+            width=60,
+            height=32,
+            font=("Source Code Pro", 12),
+            command=lambda: self.save_noise_threshold(self.noise_entry.get())
+        )
+        self.render_prefs.add_setting("Noise Threshold", self.noise_entry, noise_save)
+
+        # Min/max adaptive samples entries with save buttons
+        self.min_samples_entry = ctk.CTkEntry(
+            self.render_prefs,
+            placeholder_text="Enter min samples...",
+            width=200,
+            height=32,
+            font=("Source Code Pro", 14)
+        )
+        if self.render_settings and self.render_settings.min_samples is not None:
+            self.min_samples_entry.insert(0, str(self.render_settings.min_samples))
+        min_samples_save = ctk.CTkButton(
+            self.render_prefs,
+            text="Save",
+            width=60,
+            height=32,
+            font=("Source Code Pro", 12),
+            command=lambda: self.save_sample_limit("min_samples", self.min_samples_entry.get())
+        )
+        self.render_prefs.add_setting("Min Samples", self.min_samples_entry, min_samples_save)
+
+        self.max_samples_entry = ctk.CTkEntry(
+            self.render_prefs,
+            placeholder_text="Enter max samples...",
+            width=200,
+            height=32,
+            font=("Source Code Pro", 14)
+        )
+        if self.render_settings and self.render_settings.max_samples is not None:
+            self.max_samples_entry.insert(0, str(self.render_settings.max_samples))
+        max_samples_save = ctk.CTkButton(
+            self.render_prefs,
+            text="Save",
+            width=60,
+            height=32,
+            font=("Source Code Pro", 12),
+            command=lambda: self.save_sample_limit("max_samples", self.max_samples_entry.get())
+        )
+        self.render_prefs.add_setting("Max Samples", self.max_samples_entry, max_samples_save)
+
+        # Storage Section
+        self.storage = SettingsSection(self.scrollable_frame, "Storage")
+        self.storage.grid(row=2, column=0, sticky="ew", pady=(0, 25))
+
+        # Unreferenced files found by the garbage collector, which sweeps in idle time
+        self.storage_label = ctk.CTkLabel(
+            self.storage,
+            text="Scanning...",
+            anchor="w",
+            font=("Source Code Pro", 14)
+        )
+        cleanup_btn = ctk.CTkButton(
+            self.storage,
+            text="Clean Up",
+            width=60,
+            height=32,
+            font=("Source Code Pro", 12),
+            command=self.clean_up
+        )
+        self.storage.add_setting("Unused Files", self.storage_label, cleanup_btn)
+
+        self.collector = GarbageCollector(username) if self.current_user_id is not None else None
+        self.cleaning = False
+        if self.collector:
+            self.show_storage()
+            self.schedule_gc()
+
         # Security Section
         self.security = SettingsSection(self.scrollable_frame, "Security")
-        self.security.grid(row=2, column=0, sticky="ew", pady=(0, 25))
+        self.security.grid(row=3, column=0, sticky="ew", pady=(0, 25))
 
         # Username field with save button
         username_entry = ctk.CTkEntry(
@@ -274,13 +382,15 @@ class Settings(ctk.CTkFrame):
     def toggle_autosave(self):
         """Toggle the autosave setting in the database."""
         current_autosave = self.autosave_switch.get() == 1 # Get current state of the switch (1 for checked, 0 for unchecked)
-        self.data_manager.update_user_preferences(self.current_user_id, autosave=current_autosave) # Update autosave in db
+        self.data_manager.update_user_preferences(self.current_user_id, auto_save=current_autosave) # Update autosave in db
         print(f"Autosave toggled to: {'on' if current_autosave else 'off'}") # Optional: print status to console
 
     def save_image_width(self, new_width: float):
         """Save the image width to the database."""
         new_width_int = int(new_width) # Convert to integer
-        self.data_manager.update_render_preferences(self.current_user_id, image_width=new_width_int) # Update image_width in db
+        # Sliders call back on every step of a drag, so only the last value waiting is written
+        self.data_manager.writes.submit(("render", "image_width"), self.data_manager.update_render_preferences,
+                                        self.current_user_id, image_width=new_width_int) # Update image_width in db
         print(f"Image width saved: {new_width_int}") # Optional: print status to console
 
     def save_aspect_ratio(self, new_ratio: str):
@@ -300,7 +410,8 @@ class Settings(ctk.CTkFrame):
 
     def save_aperture(self, new_aperture: float):
         """Save the aperture to the database."""
-        self.data_manager.update_render_preferences(self.current_user_id, aperture=new_aperture) # Update aperture in db
+        self.data_manager.writes.submit(("render", "aperture"), self.data_manager.update_render_preferences,
+                                        self.current_user_id, aperture=new_aperture) # Update aperture in db
         print(f"Aperture saved: {new_aperture}") # Optional: print status to console
 
     def save_max_depth(self, new_depth: str):
@@ -316,5 +427,69 @@ class Settings(ctk.CTkFrame):
     def save_samples_per_pixel(self, new_samples: float):
         """Save samples per pixel to the database."""
         new_samples_int = int(new_samples) # Convert to integer
-        self.data_manager.update_render_preferences(self.current_user_id, samples_per_pixel=new_samples_int) # Update samples_per_pixel in db
-        print(f"Samples per pixel saved: {new_samples_int}") # Optional: print status to console
\ No newline at end of file
+        self.data_manager.writes.submit(("render", "samples_per_pixel"), self.data_manager.update_render_preferences,
+                                        self.current_user_id, samples_per_pixel=new_samples_int) # Update samples_per_pixel in db
+        print(f"Samples per pixel saved: {new_samples_int}") # Optional: print status to console
+
+    def toggle_adaptive_sampling(self):
+        """Toggle adaptive sampling in the database."""
+        adaptive = self.adaptive_switch.get() == 1
+        self.data_manager.update_render_preferences(self.current_user_id, adaptive_sampling=adaptive)
+        print(f"Adaptive sampling toggled to: {'on' if adaptive else 'off'}")
+
+    def save_noise_threshold(self, new_threshold: str):
+        """Save the adaptive sampling noise threshold to the database."""
+        try:
+            new_threshold_float = float(new_threshold)
+            if new_threshold_float <= 0:
+                raise ValueError
+            self.data_manager.update_render_preferences(self.current_user_id, noise_threshold=new_threshold_float)
+            print(f"Noise threshold saved: {new_threshold_float}")
+        except ValueError:
+            print("Invalid noise threshold. Please enter a positive number.")
+
+    def save_sample_limit(self, field: str, new_limit: str):
+        """Save the adaptive sampling min_samples or max_samples to the database."""
+        try:
+            new_limit_int = int(new_limit)
+            if new_limit_int < 1:
+                raise ValueError
+            self.data_manager.update_render_preferences(self.current_user_id, **{field: new_limit_int})
+            print(f"{field.replace('_', ' ').capitalize()} saved: {new_limit_int}")
+        except ValueError:
+            print("Invalid sample count. Please enter a positive integer.")
+
+    def schedule_gc(self, delay: int = GC_INTERVAL) -> None:
+        """Run the next slice of garbage collection once the UI is idle after `delay` ms."""
+        self.after(delay, lambda: self.after_idle(self.gc_slice))
+
+    def gc_slice(self) -> None:
+        """Sweep, or delete what the sweep found, for one time slice."""
+        collector = self.collector
+        if self.cleaning:
+            if collector.collect(GC_BUDGET):
+                self.cleaning = False
+                collector.restart()
+        elif collector.done:
+            # Only reached GC_RESCAN_INTERVAL after the last sweep finished
+            collector.restart()
+        else:
+            collector.step(GC_BUDGET)
+        self.show_storage()
+        self.schedule_gc(GC_RESCAN_INTERVAL if collector.done and not self.cleaning else GC_INTERVAL)
+
+    def show_storage(self) -> None:
+        """Show how much space the unused files found so far take up."""
+        report = self.collector.report()
+        text = f"{format_size(report['bytes'])} in {report['files']} files"
+        if self.cleaning:
+            text = f"Cleaning up... {text} left"
+        elif not self.collector.done:
+            text = f"Scanning... {text} so far"
+        self.storage_label.configure(text=text)
+
+    def clean_up(self) -> None:
+        """Delete the unused files found so far, in idle time slices."""
+        if self.collector:
+            self.cleaning = True
+            self.show_storage()
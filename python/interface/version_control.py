@@ -1,8 +1,12 @@
 import customtkinter as ctk
 import os
+import threading
 from datetime import datetime
+from tkinter import filedialog
 
 from utilities.UI import *
+from data_management.bundle import BUNDLE_EXTENSION, ProjectBundle
+from data_management.database import get_db
 
 class ProjectCard(ctk.CTkFrame):
     def __init__(
@@ -11,13 +15,14 @@ class ProjectCard(ctk.CTkFrame):
         title: str,
         version: str,
         created_date,
+        export_callback=None,
         **kwargs
     ) -> None:
         super().__init__(master, fg_color=LIGHTER_BLUE, **kwargs)
         
         # Configure grid weights
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(4, weight=1)
+        self.grid_rowconfigure(5, weight=1)
         
         # Project title and version
         self.title_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -55,6 +60,15 @@ class ProjectCard(ctk.CTkFrame):
             fg_color=BUTTON_COLOUR,
             height=BUTTON_HEIGHT
         )
+
+        # Export button, which saves the project with its versions and assets as a bundle
+        self.export_btn = ctk.CTkButton(
+            self,
+            text="Export",
+            fg_color=BUTTON_COLOUR,
+            height=BUTTON_HEIGHT,
+            command=export_callback
+        )
         
         # Layout
         self.title_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=(10, 5))
@@ -63,7 +77,8 @@ class ProjectCard(ctk.CTkFrame):
         
         self.image_frame.grid(row=1, column=0, sticky="nsew", padx=10, pady=5)
         self.date_label.grid(row=2, column=0, sticky="w", padx=10, pady=5)
-        self.launch_btn.grid(row=3, column=0, sticky="ew", padx=10, pady=(5, 10))
+        self.launch_btn.grid(row=3, column=0, sticky="ew", padx=10, pady=5)
+        self.export_btn.grid(row=4, column=0, sticky="ew", padx=10, pady=(5, 10))
 
 class AddProjectDialog(ctk.CTkFrame):
     def __init__(self, master, close_callback, create_callback, **kwargs):
@@ -155,8 +170,13 @@ class AddProjectDialog(ctk.CTkFrame):
         self.close_callback()
 
 class VersionControl(ctk.CTkFrame):
-    def __init__(self, master, **kwargs):
+    def __init__(self, master, username: str, **kwargs):
         super().__init__(master, fg_color=DARK_BLUE, **kwargs)
+
+        self.db = get_db()
+        self.username = username
+        user = self.db.get_user_section(username, 'security')
+        self.user_id = user['user_id'] if user else None
         
         # Configure grid weights for main frame
         self.grid_columnconfigure(0, weight=1)
@@ -176,6 +196,15 @@ class VersionControl(ctk.CTkFrame):
             height=BUTTON_HEIGHT,
             command=self.open_add_project_dialog
         )
+        self.import_btn = ctk.CTkButton(
+            self,
+            text="Import Bundle",
+            fg_color=BUTTON_COLOUR,
+            width=150,
+            height=BUTTON_HEIGHT,
+            command=self.import_bundle
+        )
+        self.status_label = ctk.CTkLabel(self, text="", text_color="gray")
         
         # Project cards section title
         self.projects_label = ctk.CTkLabel(
@@ -194,8 +223,8 @@ class VersionControl(ctk.CTkFrame):
         # Configure the scrollable frame's grid
         self.scrollable_frame.grid_columnconfigure((0, 1), weight=1)
         
-        # Convert string dates to datetime objects
-        self.projects = []
+        # (project_id, title, latest version, created date) of each project, most recently updated first
+        self.projects = self.load_projects()
         
         # Dialog reference
         self.dialog = None
@@ -203,6 +232,8 @@ class VersionControl(ctk.CTkFrame):
         # Layout
         self.title_label.grid(row=0, column=0, sticky="nw", padx=20, pady=(50, 10))
         self.new_scene_btn.grid(row=0, column=0, sticky="nw", padx=20, pady=(75, 10))
+        self.import_btn.grid(row=0, column=0, sticky="nw", padx=180, pady=(75, 10))
+        self.status_label.grid(row=1, column=0, sticky="e", padx=30, pady=(10, 10))
         self.projects_label.grid(row=1, column=0, sticky="w", padx=30, pady=(10, 10))
         
         # Add the scrollable frame to the main layout
@@ -211,20 +242,29 @@ class VersionControl(ctk.CTkFrame):
         # Create and layout project cards
         self.refresh_project_cards()
     
+    def load_projects(self):
+        if self.user_id is None:
+            return []
+        return [
+            (project['project_id'], project['title'], project['version'], datetime.strptime(project['created_at'], "%Y-%m-%d %H:%M:%S"))
+            for project in self.db.get_projects(self.user_id)
+        ]
+
     def refresh_project_cards(self):
         # Clear existing cards from the scrollable frame
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
                 
         # Create and layout project cards in the scrollable frame
-        for i, (title, version, date) in enumerate(self.projects):
+        for i, (project_id, title, version, date) in enumerate(self.projects):
             row = i // 2
             col = i % 2
             card = ProjectCard(
                 self.scrollable_frame,
                 title=title,
                 version=version,
-                created_date=date
+                created_date=date,
+                export_callback=lambda project_id=project_id, title=title: self.export_project(project_id, title)
             )
             card.grid(
                 row=row,
@@ -270,12 +310,61 @@ class VersionControl(ctk.CTkFrame):
             self.dialog = None
     
     def add_new_project(self, title, version):
-        # Add the new project with current date
-        current_date = datetime.now()
-        self.projects.append((title, version, current_date))
+        # Titles are unique per user, so a duplicate is not added
+        if self.user_id is None or self.db.add_project(self.user_id, title, version) is None:
+            return
+        self.projects = self.load_projects()
         
         # Refresh the project cards display
         self.refresh_project_cards()
         
-        # Scroll to the bottom to show the new project
-        self.scrollable_frame._parent_canvas.yview_moveto(1.0)
\ No newline at end of file
+        # Scroll to the top to show the new project
+        self.scrollable_frame._parent_canvas.yview_moveto(0.0)
+
+    def _in_background(self, message: str, job, done) -> None:
+        # Bundles can be large, so they are written and read off the Tk thread
+        self.status_label.configure(text=message)
+
+        def run() -> None:
+            try:
+                result = job()
+            except (OSError, ValueError) as e:
+                # e is unbound once the except block ends, before the callback runs
+                failure = f"Failed: {e}"
+                self.after(0, lambda: self.status_label.configure(text=failure))
+                return
+            self.after(0, lambda: done(result))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def export_project(self, project_id: int, title: str) -> None:
+        destination = filedialog.asksaveasfilename(
+            title="Export Project",
+            initialfile=f"{title}{BUNDLE_EXTENSION}",
+            defaultextension=BUNDLE_EXTENSION,
+            filetypes=[("3Dev bundle", f"*{BUNDLE_EXTENSION}")]
+        )
+        if not destination:
+            return
+        bundle = ProjectBundle(self.username)
+        self._in_background(
+            f"Exporting {title}...",
+            lambda: bundle.export(project_id, destination),
+            lambda _: self.status_label.configure(text=f"Exported {title}")
+        )
+
+    def import_bundle(self) -> None:
+        source = filedialog.askopenfilename(
+            title="Import Bundle",
+            filetypes=[("3Dev bundle", f"*{BUNDLE_EXTENSION}")]
+        )
+        if not source or self.user_id is None:
+            return
+        bundle = ProjectBundle(self.username)
+
+        def done(project_id) -> None:
+            self.status_label.configure(text="Imported" if project_id is not None else "Could not import")
+            self.projects = self.load_projects()
+            self.refresh_project_cards()
+
+        self._in_background("Importing...", lambda: bundle.import_bundle(source), done)
@@ -1,8 +1,703 @@
-// use pyo3::prelude::*;
+use glam::{DAffine3, DVec3};
+use pyo3::{
+    buffer::{Element, PyBuffer, ReadOnlyCell},
+    exceptions::PyValueError,
+    prelude::*,
+    types::PyDict,
+};
+use std::{
+    fs,
+    sync::{Arc, Mutex, RwLock},
+    time::SystemTime,
+};
 
-// #[pyfunction]
-// fn multiply(a: isize, b: isize) -> PyResult<isize> {
-//     Ok(a * b)
-// }
+pub mod renderer;
 
+use renderer::{
+    create_cuboid, AdaptiveSampling, Bvh, Camera, Dielectric, EnvironmentMap, Hittable, HittableList, ImageTexture, Instance, Lambertian,
+    Material, MaterialId, MaterialKind, Metal, Quad, RenderStats, Sphere, Tile,
+};
 
+// Material kinds, kept in step with three_dev/scene.py
+const LAMBERTIAN: u8 = 0;
+const METAL: u8 = 1;
+const DIELECTRIC: u8 = 2;
+
+// Borrow a C-contiguous buffer as rows of `width` items without copying it
+fn rows<'a, T: Element>(
+    py: Python<'a>,
+    buffer: &'a PyBuffer<T>,
+    width: usize,
+    name: &str,
+) -> PyResult<Vec<&'a [ReadOnlyCell<T>]>> {
+    let items = buffer
+        .as_slice(py)
+        .ok_or_else(|| PyValueError::new_err(format!("{name} must be a C-contiguous array")))?;
+    if items.len() % width != 0 {
+        return Err(PyValueError::new_err(format!("{name} must have {width} values per row")));
+    }
+    Ok(items.chunks_exact(width).collect())
+}
+
+fn vec3(row: &[ReadOnlyCell<f64>]) -> DVec3 {
+    DVec3::new(row[0].get(), row[1].get(), row[2].get())
+}
+
+// Objects keep the index, so the tracer can look the material up without bounds errors
+fn material_at(materials: &[Material], index: i32) -> PyResult<MaterialId> {
+    usize::try_from(index)
+        .ok()
+        .filter(|&i| i < materials.len())
+        .map(|i| i as MaterialId)
+        .ok_or_else(|| PyValueError::new_err(format!("material index {index} is out of range")))
+}
+
+// Check that `buffer` can receive exactly `expected` values
+fn check_output<T: Element>(buffer: &PyBuffer<T>, expected: usize, name: &str) -> PyResult<()> {
+    if buffer.readonly() || !buffer.is_c_contiguous() || buffer.item_count() != expected {
+        return Err(PyValueError::new_err(format!(
+            "{name} must be a writable C-contiguous buffer of {expected} values"
+        )));
+    }
+    Ok(())
+}
+
+// Materials: kind, (r, g, b, fuzz or refractive index), texture index or -1
+fn build_materials(
+    py: Python<'_>,
+    material_kinds: &PyBuffer<u8>,
+    material_params: &PyBuffer<f64>,
+    material_textures: &PyBuffer<i32>,
+    textures: &[Arc<ImageTexture>],
+) -> PyResult<Vec<Material>> {
+    let kinds = rows(py, material_kinds, 1, "material_kinds")?;
+    let params = rows(py, material_params, 4, "material_params")?;
+    let texture_ids = rows(py, material_textures, 1, "material_textures")?;
+    if params.len() != kinds.len() || texture_ids.len() != kinds.len() {
+        return Err(PyValueError::new_err("material columns must have the same length"));
+    }
+
+    let mut materials = Vec::with_capacity(kinds.len());
+    for ((kind, param), texture) in kinds.iter().zip(&params).zip(&texture_ids) {
+        let albedo = vec3(param);
+        let material: Material = match (kind[0].get(), texture[0].get()) {
+            (LAMBERTIAN, -1) => Lambertian::new(albedo).into(),
+            (LAMBERTIAN, id) => {
+                let texture = usize::try_from(id)
+                    .ok()
+                    .and_then(|i| textures.get(i))
+                    .ok_or_else(|| PyValueError::new_err(format!("texture index {id} is out of range")))?;
+                Lambertian::from_texture(Arc::clone(texture)).into()
+            }
+            (METAL, _) => Metal::new(albedo, param[3].get()).into(),
+            (DIELECTRIC, _) => Dielectric {
+                albedo,
+                refractive_index: param[3].get(),
+            }.into(),
+            (other, _) => return Err(PyValueError::new_err(format!("unknown material kind {other}"))),
+        };
+        materials.push(material);
+    }
+    Ok(materials)
+}
+
+// Sphere, quad and cuboid columns, as World() and World.update() take them
+struct PrimitiveColumns {
+    spheres: PyBuffer<f64>,
+    sphere_materials: PyBuffer<i32>,
+    sphere_groups: PyBuffer<i32>,
+    sphere_ids: PyBuffer<i64>,
+    quads: PyBuffer<f64>,
+    quad_materials: PyBuffer<i32>,
+    quad_groups: PyBuffer<i32>,
+    quad_ids: PyBuffer<i64>,
+    cuboids: PyBuffer<f64>,
+    cuboid_materials: PyBuffer<i32>,
+    cuboid_groups: PyBuffer<i32>,
+    cuboid_ids: PyBuffer<i64>,
+}
+
+// One object per row as (group, stable id, object); a group index >= 0 puts the
+// object in that group's shared geometry rather than the world
+type Built = Vec<(i32, u64, Box<dyn Hittable>)>;
+
+fn build_primitives(py: Python<'_>, columns: &PrimitiveColumns, materials: &[Material]) -> PyResult<Built> {
+    let mut objects: Built = Vec::new();
+    let ids = |buffer: &PyBuffer<i64>, name: &str| -> PyResult<Vec<u64>> {
+        Ok(rows(py, buffer, 1, name)?.iter().map(|id| id[0].get() as u64).collect())
+    };
+
+    // Spheres: (cx, cy, cz, radius)
+    for (((sphere, material), group), id) in rows(py, &columns.spheres, 4, "spheres")?
+        .iter()
+        .zip(rows(py, &columns.sphere_materials, 1, "sphere_materials")?)
+        .zip(rows(py, &columns.sphere_groups, 1, "sphere_groups")?)
+        .zip(ids(&columns.sphere_ids, "sphere_ids")?)
+    {
+        let sphere = Sphere {
+            center: vec3(sphere),
+            radius: sphere[3].get(),
+            material: material_at(materials, material[0].get())?,
+        };
+        objects.push((group[0].get(), id, Box::new(sphere)));
+    }
+
+    // Quads: (origin, u, v)
+    for (((quad, material), group), id) in rows(py, &columns.quads, 9, "quads")?
+        .iter()
+        .zip(rows(py, &columns.quad_materials, 1, "quad_materials")?)
+        .zip(rows(py, &columns.quad_groups, 1, "quad_groups")?)
+        .zip(ids(&columns.quad_ids, "quad_ids")?)
+    {
+        let quad = Quad::new(
+            vec3(&quad[0..3]),
+            vec3(&quad[3..6]),
+            vec3(&quad[6..9]),
+            material_at(materials, material[0].get())?,
+        );
+        objects.push((group[0].get(), id, Box::new(quad)));
+    }
+
+    // Cuboids: (center, dimensions), expanded into six quads each, kept together under the cuboid's id
+    for (((cuboid, material), group), id) in rows(py, &columns.cuboids, 6, "cuboids")?
+        .iter()
+        .zip(rows(py, &columns.cuboid_materials, 1, "cuboid_materials")?)
+        .zip(rows(py, &columns.cuboid_groups, 1, "cuboid_groups")?)
+        .zip(ids(&columns.cuboid_ids, "cuboid_ids")?)
+    {
+        let mut faces = HittableList::new();
+        create_cuboid(
+            vec3(&cuboid[0..3]),
+            vec3(&cuboid[3..6]),
+            material_at(materials, material[0].get())?,
+            &mut faces,
+        );
+        objects.push((group[0].get(), id, Box::new(faces)));
+    }
+    Ok(objects)
+}
+
+// Instances: group index, column-major 3x4 affine transform, material override or -1
+fn build_instances(
+    py: Python<'_>,
+    instance_groups: &PyBuffer<i32>,
+    instance_transforms: &PyBuffer<f64>,
+    instance_materials: &PyBuffer<i32>,
+    instance_ids: &PyBuffer<i64>,
+    groups: &[Arc<dyn Hittable>],
+    materials: &[Material],
+) -> PyResult<Vec<(u64, Box<dyn Hittable>)>> {
+    let mut instances: Vec<(u64, Box<dyn Hittable>)> = Vec::new();
+    for (((group, transform), material), id) in rows(py, instance_groups, 1, "instance_groups")?
+        .iter()
+        .zip(rows(py, instance_transforms, 12, "instance_transforms")?)
+        .zip(rows(py, instance_materials, 1, "instance_materials")?)
+        .zip(rows(py, instance_ids, 1, "instance_ids")?)
+    {
+        let object = usize::try_from(group[0].get())
+            .ok()
+            .and_then(|g| groups.get(g))
+            .ok_or_else(|| PyValueError::new_err(format!("instance group {} is out of range", group[0].get())))?;
+        let columns: [f64; 12] = std::array::from_fn(|i| transform[i].get());
+        let material = match material[0].get() {
+            -1 => None,
+            index => Some(material_at(materials, index)?),
+        };
+        let instance = Instance::new(Arc::clone(object), DAffine3::from_cols_array(&columns), material);
+        instances.push((id[0].get() as u64, Box::new(instance)));
+    }
+    Ok(instances)
+}
+
+// Decoded environment maps with their sampling tables, keyed by path, modification
+// time and intensity, so rebuilding a World for the same background skips the work
+const ENVIRONMENT_CACHE_SIZE: usize = 4;
+static ENVIRONMENTS: Mutex<Vec<(String, SystemTime, u64, Arc<EnvironmentMap>)>> = Mutex::new(Vec::new());
+
+fn load_environment(py: Python<'_>, path: &str, intensity: f64) -> PyResult<Arc<EnvironmentMap>> {
+    let modified = fs::metadata(path)?.modified()?;
+    let key = intensity.to_bits();
+    let cached = ENVIRONMENTS
+        .lock()
+        .unwrap()
+        .iter()
+        .find(|entry| entry.0 == path && entry.1 == modified && entry.2 == key)
+        .map(|entry| Arc::clone(&entry.3));
+    if let Some(environment) = cached {
+        return Ok(environment);
+    }
+
+    // Decoded without the GIL or the cache lock, so other threads are not held up
+    let environment = Arc::new(py.allow_threads(|| EnvironmentMap::open(path, intensity))?);
+    let mut cache = ENVIRONMENTS.lock().unwrap();
+    cache.retain(|entry| entry.0 != path);
+    if cache.len() >= ENVIRONMENT_CACHE_SIZE {
+        cache.remove(0);
+    }
+    cache.push((path.to_string(), modified, key, Arc::clone(&environment)));
+    Ok(environment)
+}
+
+// World ----------------------------------------------------------------------
+// What update() needs to build new objects: the decoded textures and the shared group geometry
+struct WorldState {
+    world: Bvh,
+    textures: Vec<Arc<ImageTexture>>,
+    groups: Vec<Arc<dyn Hittable>>,
+}
+
+// Renders hold the read lock for their duration, so update() waits for them to finish
+#[pyclass(name = "World", frozen)]
+struct PyWorld {
+    state: RwLock<WorldState>,
+}
+
+#[pymethods]
+impl PyWorld {
+    #[new]
+    #[pyo3(signature = (
+        spheres, sphere_materials, sphere_groups, sphere_ids,
+        quads, quad_materials, quad_groups, quad_ids,
+        cuboids, cuboid_materials, cuboid_groups, cuboid_ids,
+        material_kinds, material_params, material_textures,
+        instance_groups, instance_transforms, instance_materials, instance_ids,
+        texture_paths, background = None, background_intensity = 1.0,
+    ))]
+    #[allow(clippy::too_many_arguments)]
+    fn new(
+        py: Python<'_>,
+        spheres: PyBuffer<f64>,
+        sphere_materials: PyBuffer<i32>,
+        sphere_groups: PyBuffer<i32>,
+        sphere_ids: PyBuffer<i64>,
+        quads: PyBuffer<f64>,
+        quad_materials: PyBuffer<i32>,
+        quad_groups: PyBuffer<i32>,
+        quad_ids: PyBuffer<i64>,
+        cuboids: PyBuffer<f64>,
+        cuboid_materials: PyBuffer<i32>,
+        cuboid_groups: PyBuffer<i32>,
+        cuboid_ids: PyBuffer<i64>,
+        material_kinds: PyBuffer<u8>,
+        material_params: PyBuffer<f64>,
+        material_textures: PyBuffer<i32>,
+        instance_groups: PyBuffer<i32>,
+        instance_transforms: PyBuffer<f64>,
+        instance_materials: PyBuffer<i32>,
+        instance_ids: PyBuffer<i64>,
+        texture_paths: Vec<String>,
+        background: Option<String>,
+        background_intensity: f64,
+    ) -> PyResult<Self> {
+        let textures = texture_paths
+            .iter()
+            .map(|path| Ok(Arc::new(ImageTexture::new(path)?)))
+            .collect::<PyResult<Vec<_>>>()?;
+        let materials = build_materials(py, &material_kinds, &material_params, &material_textures, &textures)?;
+
+        let columns = PrimitiveColumns {
+            spheres, sphere_materials, sphere_groups, sphere_ids,
+            quads, quad_materials, quad_groups, quad_ids,
+            cuboids, cuboid_materials, cuboid_groups, cuboid_ids,
+        };
+        let primitives = build_primitives(py, &columns, &materials)?;
+        let instance_group_rows = rows(py, &instance_groups, 1, "instance_groups")?;
+        let group_count = primitives
+            .iter()
+            .map(|(group, _, _)| *group + 1)
+            .chain(instance_group_rows.iter().map(|group| group[0].get() + 1))
+            .max()
+            .unwrap_or(0)
+            .max(0) as usize;
+
+        let mut objects = Vec::with_capacity(primitives.len());
+        let mut groups: Vec<HittableList> = (0..group_count).map(|_| HittableList::new()).collect();
+        for (group, id, object) in primitives {
+            match usize::try_from(group) {
+                Ok(group) => groups[group].objects.push(object),
+                Err(_) => objects.push((id, object)),
+            }
+        }
+        let groups: Vec<Arc<dyn Hittable>> = groups
+            .into_iter()
+            .map(|group| Arc::new(group) as Arc<dyn Hittable>)
+            .collect();
+        objects.extend(build_instances(
+            py, &instance_groups, &instance_transforms, &instance_materials, &instance_ids, &groups, &materials,
+        )?);
+
+        let mut world = py.allow_threads(|| Bvh::new(objects));
+        world.set_materials(materials);
+        // An environment map lights the scene in place of the sky gradient
+        if let Some(path) = background {
+            world.set_environment(load_environment(py, &path, background_intensity)?);
+        }
+
+        Ok(Self { state: RwLock::new(WorldState { world, textures, groups }) })
+    }
+
+    /// Apply a scene diff (see three_dev.scene_diff) without rebuilding the world:
+    /// the primitive and instance columns hold only the added and modified rows,
+    /// keyed by their ids, `removed` holds the ids of deleted objects, and the
+    /// material columns are the scene's full, current material table.
+    ///
+    /// Changed objects are refitted into the acceleration structure, or collected
+    /// in a small secondary tree until enough have changed to rebuild it. Material
+    /// edits apply to every object using the material. Group geometry, textures and
+    /// the background cannot change this way, and materials cannot be removed.
+    #[pyo3(signature = (
+        spheres, sphere_materials, sphere_groups, sphere_ids,
+        quads, quad_materials, quad_groups, quad_ids,
+        cuboids, cuboid_materials, cuboid_groups, cuboid_ids,
+        material_kinds, material_params, material_textures,
+        instance_groups, instance_transforms, instance_materials, instance_ids,
+        removed,
+    ))]
+    #[allow(clippy::too_many_arguments)]
+    fn update(
+        &self,
+        py: Python<'_>,
+        spheres: PyBuffer<f64>,
+        sphere_materials: PyBuffer<i32>,
+        sphere_groups: PyBuffer<i32>,
+        sphere_ids: PyBuffer<i64>,
+        quads: PyBuffer<f64>,
+        quad_materials: PyBuffer<i32>,
+        quad_groups: PyBuffer<i32>,
+        quad_ids: PyBuffer<i64>,
+        cuboids: PyBuffer<f64>,
+        cuboid_materials: PyBuffer<i32>,
+        cuboid_groups: PyBuffer<i32>,
+        cuboid_ids: PyBuffer<i64>,
+        material_kinds: PyBuffer<u8>,
+        material_params: PyBuffer<f64>,
+        material_textures: PyBuffer<i32>,
+        instance_groups: PyBuffer<i32>,
+        instance_transforms: PyBuffer<f64>,
+        instance_materials: PyBuffer<i32>,
+        instance_ids: PyBuffer<i64>,
+        removed: PyBuffer<i64>,
+    ) -> PyResult<()> {
+        let columns = PrimitiveColumns {
+            spheres, sphere_materials, sphere_groups, sphere_ids,
+            quads, quad_materials, quad_groups, quad_ids,
+            cuboids, cuboid_materials, cuboid_groups, cuboid_ids,
+        };
+        // Textures and groups only change through a rebuild, so a shared lock is enough to read them
+        let (objects, materials) = {
+            let state = self.state.read().unwrap();
+            let materials = build_materials(py, &material_kinds, &material_params, &material_textures, &state.textures)?;
+            // Unchanged objects keep indexing the table, so it can grow or change but not shrink
+            if materials.len() < state.world.materials().len() {
+                return Err(PyValueError::new_err("materials were removed; build a new World instead"));
+            }
+            let mut objects = Vec::new();
+            for (group, id, object) in build_primitives(py, &columns, &materials)? {
+                if group >= 0 {
+                    return Err(PyValueError::new_err("group geometry changed; build a new World instead"));
+                }
+                objects.push((id, object));
+            }
+            objects.extend(build_instances(
+                py, &instance_groups, &instance_transforms, &instance_materials, &instance_ids, &state.groups, &materials,
+            )?);
+            (objects, materials)
+        };
+        let removed: Vec<u64> = rows(py, &removed, 1, "removed")?.iter().map(|id| id[0].get() as u64).collect();
+
+        py.allow_threads(|| {
+            let mut state = self.state.write().unwrap();
+            for id in removed {
+                state.world.remove(id);
+            }
+            for (id, object) in objects {
+                state.world.insert(id, object);
+            }
+            state.world.set_materials(materials);
+            state.world.commit();
+        });
+        Ok(())
+    }
+
+    fn __len__(&self) -> usize {
+        self.state.read().unwrap().world.len()
+    }
+}
+
+// Camera ---------------------------------------------------------------------
+#[pyclass(name = "Camera", frozen)]
+struct PyCamera {
+    camera: Camera,
+    adaptive: Option<AdaptiveSampling>,
+}
+
+#[pymethods]
+impl PyCamera {
+    #[new]
+    #[pyo3(signature = (
+        image_width, aspect_ratio, samples_per_pixel, max_depth,
+        look_from, look_at, up = [0.0, 1.0, 0.0],
+        focus_distance = 10.0, aperture = 0.1,
+        noise_threshold = None, min_samples = 16, max_samples = 1024, seed = None,
+    ))]
+    #[allow(clippy::too_many_arguments)]
+    fn new(
+        image_width: u32,
+        aspect_ratio: f64,
+        samples_per_pixel: u32,
+        max_depth: u32,
+        look_from: [f64; 3],
+        look_at: [f64; 3],
+        up: [f64; 3],
+        focus_distance: f64,
+        aperture: f64,
+        noise_threshold: Option<f64>,
+        min_samples: u32,
+        max_samples: u32,
+        seed: Option<u64>,
+    ) -> PyResult<Self> {
+        if image_width == 0 || samples_per_pixel == 0 || aspect_ratio <= 0.0 {
+            return Err(PyValueError::new_err(
+                "image_width, samples_per_pixel and aspect_ratio must be positive",
+            ));
+        }
+        if noise_threshold.is_some() && (min_samples == 0 || min_samples > max_samples) {
+            return Err(PyValueError::new_err("min_samples must be between 1 and max_samples"));
+        }
+        let mut camera = Camera::new(
+            image_width,
+            aspect_ratio,
+            samples_per_pixel,
+            max_depth,
+            DVec3::from_array(look_from),
+            DVec3::from_array(look_at),
+            DVec3::from_array(up),
+            focus_distance,
+            aperture,
+        );
+        // Without a seed every camera draws a fresh random sequence
+        if let Some(seed) = seed {
+            camera = camera.with_seed(seed);
+        }
+        Ok(Self {
+            // Adaptive sampling is enabled by giving a noise threshold
+            adaptive: noise_threshold.map(|noise_threshold| AdaptiveSampling {
+                noise_threshold,
+                min_samples,
+                max_samples,
+            }),
+            camera,
+        })
+    }
+
+    #[getter]
+    fn image_width(&self) -> u32 {
+        self.camera.image_width()
+    }
+
+    #[getter]
+    fn image_height(&self) -> u32 {
+        self.camera.image_height()
+    }
+
+    #[getter]
+    fn samples_per_pixel(&self) -> u32 {
+        self.camera.samples_per_pixel()
+    }
+
+    #[getter]
+    fn adaptive(&self) -> bool {
+        self.adaptive.is_some()
+    }
+
+    #[getter]
+    fn seed(&self) -> u64 {
+        self.camera.seed()
+    }
+}
+
+// Rendering ------------------------------------------------------------------
+// Plain-data form of RenderStats, wrapped by three_dev.stats.RenderStats
+fn stats_dict<'py>(py: Python<'py>, stats: &RenderStats) -> PyResult<Bound<'py, PyDict>> {
+    let dict = PyDict::new_bound(py);
+    dict.set_item("primary_rays", stats.primary_rays)?;
+    dict.set_item("secondary_rays", stats.secondary_rays)?;
+    dict.set_item("shadow_rays", stats.shadow_rays)?;
+    dict.set_item("intersection_tests", stats.intersection_tests)?;
+    dict.set_item("max_depth_hits", stats.max_depth_hits)?;
+    dict.set_item("depth_histogram", &stats.depth_histogram)?;
+
+    let scatter_counts = PyDict::new_bound(py);
+    for kind in MaterialKind::ALL {
+        scatter_counts.set_item(kind.name(), stats.scatter_counts[kind as usize])?;
+    }
+    dict.set_item("scatter_counts", scatter_counts)?;
+
+    let tile_times: Vec<(u32, u32, u32, u32, f64)> = stats.tile_times
+        .iter()
+        .map(|(tile, seconds)| (tile.x0, tile.y0, tile.x1, tile.y1, *seconds))
+        .collect();
+    dict.set_item("tile_times", tile_times)?;
+    dict.set_item("seconds", stats.seconds)?;
+    Ok(dict)
+}
+
+/// Trace `world` through `camera`, writing summed sample colours into `output`,
+/// a float64 buffer of shape (height, width, 3), and the number of samples
+/// taken per pixel into `sample_counts`, a uint32 buffer of shape (height, width).
+///
+/// With `stats=True` the instrumented tracing path is used and a dict of ray,
+/// intersection, scatter and tile timing counters is returned; otherwise None.
+///
+/// With `packets=True` camera rays are traced in single-precision packets of
+/// neighbouring pixels, which is faster but may pick a different surface where
+/// two are within float32 precision of each other. Bounces are traced as usual.
+/// It cannot be combined with stats or adaptive sampling.
+#[pyfunction]
+#[pyo3(signature = (world, camera, output, sample_counts, stats = false, packets = false))]
+fn render<'py>(
+    py: Python<'py>,
+    world: &Bound<'py, PyWorld>,
+    camera: &Bound<'py, PyCamera>,
+    output: PyBuffer<f64>,
+    sample_counts: PyBuffer<u32>,
+    stats: bool,
+    packets: bool,
+) -> PyResult<Option<Bound<'py, PyDict>>> {
+    let PyCamera { camera, adaptive } = camera.get();
+    let pixel_count = (camera.image_width() * camera.image_height()) as usize;
+    check_output(&output, pixel_count * 3, "output")?;
+    check_output(&sample_counts, pixel_count, "sample_counts")?;
+    check_packets(packets, stats, adaptive)?;
+
+    let state = &world.get().state;
+    let (pixels, counts, stats) = py.allow_threads(|| {
+        let world = &state.read().unwrap().world;
+        let mut stats = stats.then(|| RenderStats::new(camera.max_depth()));
+        let (pixels, counts) = match adaptive {
+            Some(adaptive) => camera.render_adaptive(world, adaptive, stats.as_mut()),
+            None if packets => (camera.render_pixels_packets(world), vec![camera.samples_per_pixel(); pixel_count]),
+            None => (camera.render_pixels(world, stats.as_mut()), vec![camera.samples_per_pixel(); pixel_count]),
+        };
+        (pixels, counts, stats)
+    });
+    write_samples(py, &output, &sample_counts, &pixels, &counts, stats)
+}
+
+/// Trace one tile, (x0, y0, x1, y1) in pixels with exclusive ends, of the camera's
+/// image. `output` and `sample_counts` are shaped like the tile rather than the
+/// image; otherwise this behaves like render(), including adaptive sampling,
+/// whose budget is then spread within the tile, and `packets`.
+///
+/// `first_sample` and `samples` select a range of sample indices (by default all
+/// of samples_per_pixel), so a tile can be refined in batches. With a seeded
+/// camera the same sample indices always trace the same paths.
+#[pyfunction]
+#[pyo3(signature = (
+    world, camera, tile, output, sample_counts, stats = false, first_sample = 0, samples = None, packets = false,
+))]
+#[allow(clippy::too_many_arguments)]
+fn render_tile<'py>(
+    py: Python<'py>,
+    world: &Bound<'py, PyWorld>,
+    camera: &Bound<'py, PyCamera>,
+    tile: (u32, u32, u32, u32),
+    output: PyBuffer<f64>,
+    sample_counts: PyBuffer<u32>,
+    stats: bool,
+    first_sample: u32,
+    samples: Option<u32>,
+    packets: bool,
+) -> PyResult<Option<Bound<'py, PyDict>>> {
+    let PyCamera { camera, adaptive } = camera.get();
+    let (x0, y0, x1, y1) = tile;
+    if x0 >= x1 || y0 >= y1 || x1 > camera.image_width() || y1 > camera.image_height() {
+        return Err(PyValueError::new_err(format!(
+            "tile {tile:?} is empty or outside the {}x{} image",
+            camera.image_width(),
+            camera.image_height()
+        )));
+    }
+    let samples = samples.unwrap_or(camera.samples_per_pixel().saturating_sub(first_sample));
+    if adaptive.is_some() && (first_sample != 0 || samples != camera.samples_per_pixel()) {
+        return Err(PyValueError::new_err("adaptive tiles are rendered in a single pass"));
+    }
+    let tile = Tile { x0, y0, x1, y1 };
+    check_output(&output, tile.pixel_count() * 3, "output")?;
+    check_output(&sample_counts, tile.pixel_count(), "sample_counts")?;
+    check_packets(packets, stats, adaptive)?;
+
+    let state = &world.get().state;
+    let (pixels, counts, stats) = py.allow_threads(|| {
+        let world = &state.read().unwrap().world;
+        let mut stats = stats.then(|| RenderStats::new(camera.max_depth()));
+        let (pixels, counts) = match adaptive {
+            Some(adaptive) => camera.render_adaptive_tile(world, &tile, adaptive, stats.as_mut()),
+            None if packets => (
+                camera.render_tile_packets(world, &tile, first_sample..first_sample + samples),
+                vec![samples; tile.pixel_count()],
+            ),
+            None => (
+                camera.render_tile(world, &tile, first_sample..first_sample + samples, stats.as_mut()),
+                vec![samples; tile.pixel_count()],
+            ),
+        };
+        (pixels, counts, stats)
+    });
+    write_samples(py, &output, &sample_counts, &pixels, &counts, stats)
+}
+
+// Packet tracing counts nothing and takes a fixed number of samples per pixel
+fn check_packets(packets: bool, stats: bool, adaptive: &Option<AdaptiveSampling>) -> PyResult<()> {
+    if packets && (stats || adaptive.is_some()) {
+        return Err(PyValueError::new_err("packets cannot be combined with stats or adaptive sampling"));
+    }
+    Ok(())
+}
+
+fn write_samples<'py>(
+    py: Python<'py>,
+    output: &PyBuffer<f64>,
+    sample_counts: &PyBuffer<u32>,
+    pixels: &[DVec3],
+    counts: &[u32],
+    stats: Option<RenderStats>,
+) -> PyResult<Option<Bound<'py, PyDict>>> {
+    let flat: Vec<f64> = pixels.iter().flat_map(|p| p.to_array()).collect();
+    output.copy_from_slice(py, &flat)?;
+    sample_counts.copy_from_slice(py, counts)?;
+    stats.map(|stats| stats_dict(py, &stats)).transpose()
+}
+
+/// Fill `albedo` and `normal`, float64 buffers of shape (height, width, 3),
+/// with the first-hit guide buffers used by three_dev.denoise.
+#[pyfunction]
+#[pyo3(signature = (world, camera, albedo, normal, samples = 4))]
+fn render_aux(
+    py: Python<'_>,
+    world: &Bound<'_, PyWorld>,
+    camera: &Bound<'_, PyCamera>,
+    albedo: PyBuffer<f64>,
+    normal: PyBuffer<f64>,
+    samples: u32,
+) -> PyResult<()> {
+    let camera = &camera.get().camera;
+    let pixel_count = (camera.image_width() * camera.image_height()) as usize;
+    check_output(&albedo, pixel_count * 3, "albedo")?;
+    check_output(&normal, pixel_count * 3, "normal")?;
+
+    let state = &world.get().state;
+    let (albedo_pixels, normal_pixels) = py.allow_threads(|| camera.render_aux(&state.read().unwrap().world, samples));
+    albedo.copy_from_slice(py, &albedo_pixels.iter().flat_map(|p| p.to_array()).collect::<Vec<f64>>())?;
+    normal.copy_from_slice(py, &normal_pixels.iter().flat_map(|p| p.to_array()).collect::<Vec<f64>>())
+}
+
+#[pymodule]
+fn _core(m: &Bound<'_, PyModule>) -> PyResult<()> {
+    m.add_class::<PyWorld>()?;
+    m.add_class::<PyCamera>()?;
+    m.add_function(wrap_pyfunction!(render, m)?)?;
+    m.add_function(wrap_pyfunction!(render_tile, m)?)?;
+    m.add_function(wrap_pyfunction!(render_aux, m)?)?;
+    Ok(())
+}
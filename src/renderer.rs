@@ -0,0 +1,2052 @@
+use glam::{DAffine3, DMat3, DVec3};
+use itertools::Itertools;
+use rand::{rngs::SmallRng, Rng, SeedableRng};
+use std::{collections::HashMap, f64::consts::PI, fs, io, ops::Range, path::Path, sync::Arc, time::Instant};
+
+// Textures -------------------------------------------------------------------
+// A closed set, matched on rather than called through a vtable in the shading loop
+#[derive(Clone)]
+pub enum Texture {
+    Solid(DVec3),
+    // Shared between the materials that use it
+    Image(Arc<ImageTexture>),
+}
+
+impl Texture {
+    pub fn color(&self, u: f64, v: f64, _p: DVec3) -> DVec3 {
+        match self {
+            Texture::Solid(color) => *color,
+            Texture::Image(image) => image.color(u, v),
+        }
+    }
+}
+
+pub struct ImageTexture {
+    image: image::RgbImage,
+}
+
+impl ImageTexture {
+    pub fn new(path: &str) -> io::Result<Self> {
+        let img = image::open(path)
+            .map_err(|e| io::Error::new(io::ErrorKind::Other, e))?
+            .to_rgb8();
+        Ok(Self { image: img })
+    }
+
+    fn color(&self, u: f64, v: f64) -> DVec3 {
+        let u = u.clamp(0.0, 1.0);
+        let v = 1.0 - v.clamp(0.0, 1.0); // Flip V
+
+        let x = (u * (self.image.width() - 1) as f64) as u32;
+        let y = (v * (self.image.height() - 1) as f64) as u32;
+
+        let pixel = self.image.get_pixel(x, y);
+        DVec3::new(
+            pixel[0] as f64 / 255.0,
+            pixel[1] as f64 / 255.0,
+            pixel[2] as f64 / 255.0,
+        )
+    }
+}
+
+// Materials ------------------------------------------------------------------
+#[derive(Clone, Copy, PartialEq, Eq, Debug)]
+pub enum MaterialKind {
+    Lambertian,
+    Metal,
+    Dielectric,
+}
+
+impl MaterialKind {
+    pub const COUNT: usize = 3;
+    pub const ALL: [MaterialKind; MaterialKind::COUNT] = [MaterialKind::Lambertian, MaterialKind::Metal, MaterialKind::Dielectric];
+
+    pub fn name(self) -> &'static str {
+        match self {
+            MaterialKind::Lambertian => "lambertian",
+            MaterialKind::Metal => "metal",
+            MaterialKind::Dielectric => "dielectric",
+        }
+    }
+}
+
+// Objects refer to their material by its index in the world's material table (see
+// Hittable::materials), so hit records are plain data and need no reference counting
+pub type MaterialId = u32;
+
+#[derive(Clone)]
+pub enum Material {
+    Lambertian(Lambertian),
+    Metal(Metal),
+    Dielectric(Dielectric),
+}
+
+impl Material {
+    pub fn scatter(&self, ray_in: &Ray, rec: &HitRecord, rng: &mut SmallRng) -> Option<(DVec3, Ray)> {
+        match self {
+            Material::Lambertian(material) => material.scatter(rec, rng),
+            Material::Metal(material) => material.scatter(ray_in, rec, rng),
+            Material::Dielectric(material) => material.scatter(ray_in, rec, rng),
+        }
+    }
+
+    // Surface colour at the hit, used for the denoiser's albedo buffer
+    pub fn albedo(&self, rec: &HitRecord) -> DVec3 {
+        match self {
+            Material::Lambertian(material) => material.albedo.color(rec.u, rec.v, rec.point),
+            Material::Metal(material) => material.albedo,
+            Material::Dielectric(material) => material.albedo,
+        }
+    }
+
+    pub fn kind(&self) -> MaterialKind {
+        match self {
+            Material::Lambertian(_) => MaterialKind::Lambertian,
+            Material::Metal(_) => MaterialKind::Metal,
+            Material::Dielectric(_) => MaterialKind::Dielectric,
+        }
+    }
+
+    // Density (per steradian) with which scatter() picks `direction`, for materials that
+    // scatter diffusely in proportion to the BRDF times the cosine, so that
+    // albedo * scatter_pdf is that product. None for mirror-like materials, which
+    // cannot be lit by sampling the environment directly.
+    pub fn scatter_pdf(&self, rec: &HitRecord, direction: DVec3) -> Option<f64> {
+        match self {
+            // Lambertian scattering draws normal + a random unit vector, which is cosine-distributed
+            Material::Lambertian(_) => Some(rec.normal.dot(direction.normalize()).max(0.0) / PI),
+            Material::Metal(_) | Material::Dielectric(_) => None,
+        }
+    }
+}
+
+impl From<Lambertian> for Material {
+    fn from(material: Lambertian) -> Self {
+        Material::Lambertian(material)
+    }
+}
+
+impl From<Metal> for Material {
+    fn from(material: Metal) -> Self {
+        Material::Metal(material)
+    }
+}
+
+impl From<Dielectric> for Material {
+    fn from(material: Dielectric) -> Self {
+        Material::Dielectric(material)
+    }
+}
+
+#[derive(Clone)]
+pub struct Lambertian {
+    albedo: Texture,
+}
+
+impl Lambertian {
+    pub fn new(color: DVec3) -> Self {
+        Self {
+            albedo: Texture::Solid(color)
+        }
+    }
+
+    pub fn from_texture(texture: Arc<ImageTexture>) -> Self {
+        Self { albedo: Texture::Image(texture) }
+    }
+
+    fn scatter(&self, rec: &HitRecord, rng: &mut SmallRng) -> Option<(DVec3, Ray)> {
+        let mut scatter_dir = rec.normal + random_unit_vector(rng);
+        if scatter_dir.abs_diff_eq(DVec3::ZERO, 1e-8) {
+            scatter_dir = rec.normal;
+        }
+        let attenuation = self.albedo.color(rec.u, rec.v, rec.point);
+        Some((attenuation, Ray::new(rec.point, scatter_dir)))
+    }
+}
+
+#[derive(Clone)]
+pub struct Metal {
+    albedo: DVec3,
+    fuzz: f64,
+}
+
+impl Metal {
+    pub fn new(albedo: DVec3, fuzz: f64) -> Self {
+        Metal { albedo, fuzz: fuzz.clamp(0.0, 1.0) }
+    }
+
+    fn scatter(&self, ray_in: &Ray, rec: &HitRecord, rng: &mut SmallRng) -> Option<(DVec3, Ray)> {
+        let reflected = reflect(ray_in.direction.normalize(), rec.normal);
+        let scattered = Ray::new(
+            rec.point,
+            reflected + self.fuzz * random_in_unit_sphere(rng),
+        );
+        (scattered.direction.dot(rec.normal) > 0.0).then_some((self.albedo, scattered))
+    }
+}
+
+#[derive(Clone)]
+pub struct Dielectric {
+    pub albedo: DVec3,
+    pub refractive_index: f64,
+}
+
+// Utility functions ---------------------------------------------------------
+fn schlick(cosine: f64, refraction_ratio: f64) -> f64 {
+    let r0 = ((1.0 - refraction_ratio) / (1.0 + refraction_ratio)).powi(2);
+    r0 + (1.0 - r0) * (1.0 - cosine).powi(5)
+}
+
+fn refract(uv: DVec3, n: DVec3, etai_over_etat: f64) -> DVec3 {
+    let cos_theta = (-uv).dot(n).min(1.0);
+    let r_out_perp = etai_over_etat * (uv + cos_theta * n);
+    let r_out_parallel = -(1.0 - r_out_perp.length_squared()).abs().sqrt() * n;
+    r_out_perp + r_out_parallel
+}
+
+impl Dielectric {
+    fn scatter(&self, ray_in: &Ray, rec: &HitRecord, rng: &mut SmallRng) -> Option<(DVec3, Ray)> {
+        let refraction_ratio = if rec.front_face { 1.0 / self.refractive_index } else { self.refractive_index };
+        let unit_dir = ray_in.direction.normalize();
+        let cos_theta = (-unit_dir).dot(rec.normal).min(1.0);
+        let sin_theta = (1.0 - cos_theta.powi(2)).sqrt();
+
+        let cannot_refract = refraction_ratio * sin_theta > 1.0;
+        let reflectance = schlick(cos_theta, refraction_ratio);
+        let direction = if cannot_refract || reflectance > rng.random() {
+            reflect(unit_dir, rec.normal)
+        } else {
+            refract(unit_dir, rec.normal, refraction_ratio)
+        };
+
+        Some((self.albedo, Ray::new(rec.point, direction)))
+    }
+}
+
+fn reflect(v: DVec3, n: DVec3) -> DVec3 {
+    v - 2.0 * v.dot(n) * n
+}
+
+fn random_in_unit_sphere<R: Rng>(rng: &mut R) -> DVec3 {
+    loop {
+        let p = DVec3::new(
+            rng.random_range(-1.0..1.0),
+            rng.random_range(-1.0..1.0),
+            rng.random_range(-1.0..1.0),
+        );
+        if p.length_squared() < 1.0 {
+            return p;
+        }
+    }
+}
+
+fn random_unit_vector<R: Rng>(rng: &mut R) -> DVec3 {
+    random_in_unit_sphere(rng).normalize()
+}
+
+// Geometry -------------------------------------------------------------------
+#[derive(Clone, Copy)]
+pub struct Ray {
+    origin: DVec3,
+    direction: DVec3,
+}
+
+impl Ray {
+    pub fn new(origin: DVec3, direction: DVec3) -> Self {
+        Self { origin, direction }
+    }
+
+    pub fn at(&self, t: f64) -> DVec3 {
+        self.origin + t * self.direction
+    }
+
+    pub fn color<T: Hittable>(&self, depth: u32, world: &T, rng: &mut SmallRng) -> DVec3 {
+        self.trace(depth, world, rng, None)
+    }
+
+    // `scatter_pdf` is the density with which a diffuse bounce chose this ray, or None
+    // for camera rays and specular bounces. When the world has an environment map,
+    // diffuse hits also sample the map directly, and the two estimates of the light
+    // arriving from the map are combined by multiple importance sampling.
+    fn trace<T: Hittable>(&self, depth: u32, world: &T, rng: &mut SmallRng, scatter_pdf: Option<f64>) -> DVec3 {
+        if depth == 0 {
+            return DVec3::ZERO;
+        }
+        match world.hit(self, 0.001..f64::INFINITY) {
+            Some(rec) => self.shade(&rec, depth, world, rng),
+            None => self.background(world.environment(), scatter_pdf),
+        }
+    }
+
+    // Light leaving a hit back along the ray: the scattered ray traced onwards, plus
+    // the environment sampled directly from diffuse surfaces
+    fn shade<T: Hittable>(&self, rec: &HitRecord, depth: u32, world: &T, rng: &mut SmallRng) -> DVec3 {
+        let material = &world.materials()[rec.material as usize];
+        let Some((attenuation, scattered)) = material.scatter(self, rec, rng) else {
+            return DVec3::ZERO;
+        };
+        let Some(environment) = world.environment() else {
+            return attenuation * scattered.trace(depth - 1, world, rng, None);
+        };
+        let pdf = material.scatter_pdf(rec, scattered.direction);
+        let direct = match pdf {
+            Some(_) => direct_light(environment, world, material, rec, rng, None),
+            None => DVec3::ZERO,
+        };
+        direct + attenuation * scattered.trace(depth - 1, world, rng, pdf)
+    }
+
+    // Same as color(), but records every ray, intersection test, scatter and path
+    // length in `stats`. Kept separate so uninstrumented renders pay nothing for it.
+    pub fn color_with_stats<T: Hittable>(&self, depth: u32, world: &T, rng: &mut SmallRng, stats: &mut RenderStats) -> DVec3 {
+        self.trace_with_stats(depth, world, rng, stats, None)
+    }
+
+    fn trace_with_stats<T: Hittable>(
+        &self,
+        depth: u32,
+        world: &T,
+        rng: &mut SmallRng,
+        stats: &mut RenderStats,
+        scatter_pdf: Option<f64>,
+    ) -> DVec3 {
+        let bounce = stats.max_depth() - depth;
+        if depth == 0 {
+            stats.max_depth_hits += 1;
+            stats.depth_histogram[bounce as usize] += 1;
+            return DVec3::ZERO;
+        }
+
+        if bounce == 0 {
+            stats.primary_rays += 1;
+        } else {
+            stats.secondary_rays += 1;
+        }
+
+        let environment = world.environment();
+        if let Some(rec) = world.hit_counted(self, 0.001..f64::INFINITY, &mut stats.intersection_tests) {
+            let material = &world.materials()[rec.material as usize];
+            if let Some((attenuation, scattered)) = material.scatter(self, &rec, rng) {
+                stats.scatter_counts[material.kind() as usize] += 1;
+                let pdf = environment.and_then(|_| material.scatter_pdf(&rec, scattered.direction));
+                let direct = match (environment, pdf) {
+                    (Some(environment), Some(_)) => direct_light(environment, world, material, &rec, rng, Some(&mut *stats)),
+                    _ => DVec3::ZERO,
+                };
+                return direct + attenuation * scattered.trace_with_stats(depth - 1, world, rng, stats, pdf);
+            }
+            stats.depth_histogram[bounce as usize] += 1;
+            return DVec3::ZERO;
+        }
+
+        stats.depth_histogram[bounce as usize] += 1;
+        self.background(environment, scatter_pdf)
+    }
+
+    // Light arriving along the ray from outside the scene. Rays chosen by a diffuse
+    // bounce are weighted against the environment's own sampling of the same direction.
+    fn background(&self, environment: Option<&EnvironmentMap>, scatter_pdf: Option<f64>) -> DVec3 {
+        let Some(environment) = environment else {
+            let t = 0.5 * (self.direction.normalize().y + 1.0);
+            return DVec3::ONE.lerp(DVec3::new(0.5, 0.7, 1.0), t);
+        };
+        let radiance = environment.radiance(self.direction);
+        match scatter_pdf {
+            Some(pdf) => radiance * power_heuristic(pdf, environment.pdf(self.direction)),
+            None => radiance,
+        }
+    }
+}
+
+// Next-event estimation: light from one direction drawn from the environment map,
+// if nothing blocks it, weighted against the material's chance of scattering that way
+fn direct_light<T: Hittable>(
+    environment: &EnvironmentMap,
+    world: &T,
+    material: &Material,
+    rec: &HitRecord,
+    rng: &mut SmallRng,
+    stats: Option<&mut RenderStats>,
+) -> DVec3 {
+    let Some((direction, radiance, light_pdf)) = environment.sample(rng) else {
+        return DVec3::ZERO;
+    };
+    let scatter_pdf = match material.scatter_pdf(rec, direction) {
+        Some(pdf) if pdf > 0.0 => pdf,
+        _ => return DVec3::ZERO,
+    };
+
+    let shadow = Ray::new(rec.point, direction);
+    let blocked = match stats {
+        Some(stats) => {
+            stats.shadow_rays += 1;
+            world.intersect_counted(&shadow, 0.001..f64::INFINITY, &mut stats.intersection_tests).is_some()
+        }
+        None => world.intersect(&shadow, 0.001..f64::INFINITY).is_some(),
+    };
+    if blocked {
+        return DVec3::ZERO;
+    }
+    material.albedo(rec) * scatter_pdf * radiance / light_pdf * power_heuristic(light_pdf, scatter_pdf)
+}
+
+// Multiple importance sampling weight of a strategy with density `pdf` against one with `other`
+fn power_heuristic(pdf: f64, other: f64) -> f64 {
+    let (a, b) = (pdf * pdf, other * other);
+    if a + b > 0.0 { a / (a + b) } else { 0.0 }
+}
+
+// Hit detection -------------------------------------------------------------
+#[derive(Clone, Copy)]
+pub struct HitRecord {
+    point: DVec3,
+    normal: DVec3,
+    front_face: bool,
+    material: MaterialId,
+    u: f64,
+    v: f64,
+}
+
+impl HitRecord {
+    pub fn new(ray: &Ray, point: DVec3, outward_normal: DVec3, material: MaterialId, u: f64, v: f64) -> Self {
+        let front_face = ray.direction.dot(outward_normal) < 0.0;
+        let normal = if front_face { outward_normal } else { -outward_normal };
+        Self { point, normal, front_face, material, u, v }
+    }
+}
+
+// The closest hit intersect() found: its distance, the primitive there, and the
+// instance the primitive was reached through, if any, whose transform its record needs
+#[derive(Clone, Copy)]
+pub struct Hit<'a> {
+    pub t: f64,
+    primitive: &'a dyn Hittable,
+    instance: Option<&'a Instance>,
+}
+
+impl<'a> Hit<'a> {
+    pub fn new(t: f64, primitive: &'a dyn Hittable) -> Self {
+        Self { t, primitive, instance: None }
+    }
+
+    // The HitRecord of this hit of `ray`
+    pub fn record(&self, ray: &Ray) -> HitRecord {
+        match self.instance {
+            Some(instance) => instance.to_world_record(self.primitive.record(&instance.to_local(ray), self.t)),
+            None => self.primitive.record(ray, self.t),
+        }
+    }
+
+    // The outermost object hit, i.e. the instance if there is one, to test the ray against again
+    pub fn object(&self) -> &'a dyn Hittable {
+        match self.instance {
+            Some(instance) => instance,
+            None => self.primitive,
+        }
+    }
+}
+
+// Finding the closest hit and describing it are separate steps: intersect() only
+// returns a distance and the primitive hit, and the HitRecord (point, normal, UVs)
+// is built once, for the closest primitive, rather than for every one a ray passes through.
+pub trait Hittable: Send + Sync {
+    // The nearest intersection within the interval, whose record() describes it
+    fn intersect(&self, ray: &Ray, interval: Range<f64>) -> Option<Hit<'_>>;
+
+    // The hit at `t`, a distance intersect() returned for this primitive and ray
+    fn record(&self, ray: &Ray, t: f64) -> HitRecord;
+
+    // intersect() that also adds the number of primitive intersection tests to `tests`.
+    // Containers override it to count their children instead of themselves.
+    fn intersect_counted(&self, ray: &Ray, interval: Range<f64>, tests: &mut u64) -> Option<Hit<'_>> {
+        *tests += 1;
+        self.intersect(ray, interval)
+    }
+
+    fn hit(&self, ray: &Ray, interval: Range<f64>) -> Option<HitRecord> {
+        Some(self.intersect(ray, interval)?.record(ray))
+    }
+
+    fn hit_counted(&self, ray: &Ray, interval: Range<f64>, tests: &mut u64) -> Option<HitRecord> {
+        Some(self.intersect_counted(ray, interval, tests)?.record(ray))
+    }
+
+    // Closest hits of a packet of rays: narrows each lane's t_max and sets its hit to the
+    // object there (see Hit::object()). Primitives test all lanes at once in f32; by
+    // default each live lane is tested on its own with intersect(), in f64.
+    fn intersect_packet<'a>(&'a self, packet: &mut RayPacket<'a>) {
+        for lane in 0..PACKET_SIZE {
+            if packet.t_max[lane] <= packet.t_min {
+                continue;
+            }
+            let interval = packet.t_min as f64..packet.t_max[lane] as f64;
+            if let Some(hit) = self.intersect(&packet.rays[lane], interval) {
+                packet.t_max[lane] = hit.t as f32;
+                packet.hits[lane] = Some(hit.object());
+            }
+        }
+    }
+
+    // Light from outside the scene; only the top-level world has one. None means the default sky gradient.
+    fn environment(&self) -> Option<&EnvironmentMap> {
+        None
+    }
+
+    // Materials by MaterialId; only the top-level world has them
+    fn materials(&self) -> &[Material] {
+        &[]
+    }
+
+    // A box enclosing everything hit() can return, for the acceleration structure
+    fn bounding_box(&self) -> Aabb;
+}
+
+// Axis-aligned bounding box -------------------------------------------------
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub struct Aabb {
+    pub min: DVec3,
+    pub max: DVec3,
+}
+
+impl Aabb {
+    // Contains nothing; the identity of union()
+    pub const EMPTY: Aabb = Aabb { min: DVec3::INFINITY, max: DVec3::NEG_INFINITY };
+
+    pub fn from_points(points: impl IntoIterator<Item = DVec3>) -> Self {
+        points.into_iter().fold(Self::EMPTY, |aabb, point| Self {
+            min: aabb.min.min(point),
+            max: aabb.max.max(point),
+        })
+    }
+
+    pub fn union(self, other: Self) -> Self {
+        Self { min: self.min.min(other.min), max: self.max.max(other.max) }
+    }
+
+    pub fn contains(&self, other: &Self) -> bool {
+        self.min.min(other.min) == self.min && self.max.max(other.max) == self.max
+    }
+
+    pub fn centroid(&self) -> DVec3 {
+        (self.min + self.max) * 0.5
+    }
+
+    pub fn surface_area(&self) -> f64 {
+        let size = (self.max - self.min).max(DVec3::ZERO);
+        2.0 * (size.x * size.y + size.y * size.z + size.z * size.x)
+    }
+
+    // Grown by `margin` on every side, so flat primitives such as quads have some thickness
+    pub fn padded(self, margin: f64) -> Self {
+        Self { min: self.min - DVec3::splat(margin), max: self.max + DVec3::splat(margin) }
+    }
+
+    // Slab test; returns where the ray enters the box if it does so within the interval
+    fn hit(&self, origin: DVec3, inverse_direction: DVec3, interval: &Range<f64>) -> Option<f64> {
+        let t0 = (self.min - origin) * inverse_direction;
+        let t1 = (self.max - origin) * inverse_direction;
+        let enter = t0.min(t1).max_element().max(interval.start);
+        let exit = t0.max(t1).min_element().min(interval.end);
+        (enter <= exit).then_some(enter)
+    }
+}
+
+// Ray packets ----------------------------------------------------------------
+// PACKET_SIZE coherent rays (camera rays through neighbouring pixels) traced together
+// in f32. Lanes are stored structure-of-arrays and every test is a loop over all lanes
+// with no early exit, which the compiler turns into SIMD: 8 lanes fill an AVX register,
+// or two SSE/NEON ones. Only the closest primitive per lane is found this way; see
+// Camera::render_tile_packets.
+pub const PACKET_SIZE: usize = 8;
+
+// Widens each lane's exit distance from a box so f32 rounding cannot lose a hit at its faces
+const PACKET_EXIT_SCALE: f32 = 1.0 + 4.0 * f32::EPSILON;
+
+pub struct RayPacket<'a> {
+    rays: [Ray; PACKET_SIZE],
+    origin: [[f32; PACKET_SIZE]; 3],
+    direction: [[f32; PACKET_SIZE]; 3],
+    inverse_direction: [[f32; PACKET_SIZE]; 3],
+    t_min: f32,
+    // Closest hit so far per lane; minus infinity for lanes without a ray, which nothing can hit
+    t_max: [f32; PACKET_SIZE],
+    hits: [Option<&'a dyn Hittable>; PACKET_SIZE],
+}
+
+impl<'a> RayPacket<'a> {
+    // Up to PACKET_SIZE rays, all tested over the same interval
+    pub fn new(rays: &[Ray], interval: Range<f64>) -> Self {
+        assert!(!rays.is_empty() && rays.len() <= PACKET_SIZE, "a packet holds 1 to {PACKET_SIZE} rays");
+        let mut packet = Self {
+            rays: [rays[0]; PACKET_SIZE],
+            origin: [[0.0; PACKET_SIZE]; 3],
+            direction: [[0.0; PACKET_SIZE]; 3],
+            inverse_direction: [[0.0; PACKET_SIZE]; 3],
+            t_min: interval.start as f32,
+            t_max: [f32::NEG_INFINITY; PACKET_SIZE],
+            hits: [None; PACKET_SIZE],
+        };
+        for (lane, ray) in rays.iter().enumerate() {
+            packet.rays[lane] = *ray;
+            for axis in 0..3 {
+                packet.origin[axis][lane] = ray.origin[axis] as f32;
+                packet.direction[axis][lane] = ray.direction[axis] as f32;
+                packet.inverse_direction[axis][lane] = 1.0 / ray.direction[axis] as f32;
+            }
+            packet.t_max[lane] = interval.end as f32;
+        }
+        packet
+    }
+
+    // The object each ray hit first, if any, in the order the rays were given
+    pub fn hits(&self) -> &[Option<&'a dyn Hittable>; PACKET_SIZE] {
+        &self.hits
+    }
+
+    // Records `object` as the closest hit of every lane whose entry in `t` beats it
+    fn accept(&mut self, t: &[f32; PACKET_SIZE], object: &'a dyn Hittable) {
+        for lane in 0..PACKET_SIZE {
+            if t[lane] < self.t_max[lane] {
+                self.t_max[lane] = t[lane];
+                self.hits[lane] = Some(object);
+            }
+        }
+    }
+}
+
+fn packet_vector(v: DVec3) -> [f32; 3] {
+    [v.x as f32, v.y as f32, v.z as f32]
+}
+
+// f32 bounds that still contain the f64 ones
+fn round_down(x: f64) -> f32 {
+    let y = x as f32;
+    if y as f64 > x { y.next_down() } else { y }
+}
+
+fn round_up(x: f64) -> f32 {
+    let y = x as f32;
+    if (y as f64) < x { y.next_up() } else { y }
+}
+
+impl Aabb {
+    // Whether any lane enters the box before its closest hit so far
+    fn hit_packet(&self, packet: &RayPacket) -> bool {
+        let min = [round_down(self.min.x), round_down(self.min.y), round_down(self.min.z)];
+        let max = [round_up(self.max.x), round_up(self.max.y), round_up(self.max.z)];
+        let mut enter = [packet.t_min; PACKET_SIZE];
+        let mut exit = packet.t_max;
+        for axis in 0..3 {
+            for lane in 0..PACKET_SIZE {
+                let t0 = (min[axis] - packet.origin[axis][lane]) * packet.inverse_direction[axis][lane];
+                let t1 = (max[axis] - packet.origin[axis][lane]) * packet.inverse_direction[axis][lane];
+                enter[lane] = enter[lane].max(t0.min(t1));
+                exit[lane] = exit[lane].min(t0.max(t1));
+            }
+        }
+        let mut any = false;
+        for lane in 0..PACKET_SIZE {
+            any |= enter[lane] <= exit[lane] * PACKET_EXIT_SCALE;
+        }
+        any
+    }
+}
+
+pub struct Sphere {
+    pub center: DVec3,
+    pub radius: f64,
+    pub material: MaterialId,
+}
+
+impl Hittable for Sphere {
+    fn intersect(&self, ray: &Ray, interval: Range<f64>) -> Option<Hit<'_>> {
+        let oc = ray.origin - self.center;
+        let a = ray.direction.length_squared();
+        let half_b = oc.dot(ray.direction);
+        let c = oc.length_squared() - self.radius.powi(2);
+        let discriminant = half_b.powi(2) - a * c;
+
+        if discriminant < 0.0 {
+            return None;
+        }
+
+        let sqrtd = discriminant.sqrt();
+        let mut root = (-half_b - sqrtd) / a;
+
+        if !interval.contains(&root) {
+            root = (-half_b + sqrtd) / a;
+            if !interval.contains(&root) {
+                return None;
+            }
+        }
+        Some(Hit::new(root, self))
+    }
+
+    fn record(&self, ray: &Ray, t: f64) -> HitRecord {
+        let point = ray.at(t);
+        let outward_normal = (point - self.center) / self.radius;
+
+        // Calculate UV coordinates for texture mapping
+        let dir = outward_normal;
+        let phi = (-dir.z).atan2(dir.x) + std::f64::consts::PI;
+        let theta = (-dir.y).acos();
+        let u = phi / (2.0 * std::f64::consts::PI);
+        let v = theta / std::f64::consts::PI;
+
+        HitRecord::new(ray, point, outward_normal, self.material, u, v)
+    }
+
+    fn intersect_packet<'a>(&'a self, packet: &mut RayPacket<'a>) {
+        let center = packet_vector(self.center);
+        let radius_squared = (self.radius * self.radius) as f32;
+        let mut t = [f32::INFINITY; PACKET_SIZE];
+        for lane in 0..PACKET_SIZE {
+            let oc = [0, 1, 2].map(|axis| packet.origin[axis][lane] - center[axis]);
+            let d = [0, 1, 2].map(|axis| packet.direction[axis][lane]);
+            let a = d[0] * d[0] + d[1] * d[1] + d[2] * d[2];
+            let half_b = oc[0] * d[0] + oc[1] * d[1] + oc[2] * d[2];
+            // The centre's distance from the line, taken directly rather than from b^2 - ac,
+            // which loses everything to cancellation in f32 for large spheres like a ground plane
+            let s = half_b / a;
+            let l = [0, 1, 2].map(|axis| oc[axis] - s * d[axis]);
+            let discriminant = a * (radius_squared - (l[0] * l[0] + l[1] * l[1] + l[2] * l[2]));
+            let sqrtd = discriminant.max(0.0).sqrt();
+            let near = (-half_b - sqrtd) / a;
+            let far = (-half_b + sqrtd) / a;
+            let root = if near >= packet.t_min { near } else { far };
+            if discriminant >= 0.0 && root >= packet.t_min && root < packet.t_max[lane] {
+                t[lane] = root;
+            }
+        }
+        packet.accept(&t, self);
+    }
+
+    fn bounding_box(&self) -> Aabb {
+        // A negative radius makes a hollow sphere; its extent is the same
+        let radius = DVec3::splat(self.radius.abs());
+        Aabb { min: self.center - radius, max: self.center + radius }
+    }
+}
+
+pub struct Quad {
+    origin: DVec3,
+    u_vec: DVec3,
+    v_vec: DVec3,
+    material: MaterialId,
+    normal: DVec3,
+    d: f64,
+    w: DVec3,
+}
+
+impl Quad {
+    pub fn new(origin: DVec3, u_vec: DVec3, v_vec: DVec3, material: MaterialId) -> Self {
+        // Calculate the normal vector (pointing outward by right-hand rule)
+        let normal = u_vec.cross(v_vec).normalize();
+        let d = normal.dot(origin);
+        let w = u_vec.cross(v_vec) / u_vec.cross(v_vec).dot(u_vec.cross(v_vec));
+        
+        Self {
+            origin,
+            u_vec,
+            v_vec,
+            material,
+            normal,
+            d,
+            w,
+        }
+    }
+
+    // Barycentric coordinates of a point on the quad's plane
+    fn coordinates(&self, point: DVec3) -> (f64, f64) {
+        let planar_hitpt = point - self.origin;
+        let alpha = self.w.dot(planar_hitpt.cross(self.v_vec));
+        let beta = self.w.dot(self.u_vec.cross(planar_hitpt));
+        (alpha, beta)
+    }
+}
+
+impl Hittable for Quad {
+    fn intersect(&self, ray: &Ray, interval: Range<f64>) -> Option<Hit<'_>> {
+        // Calculate intersection with the plane containing the quad
+        let denom = self.normal.dot(ray.direction);
+        
+        // Ray is parallel to the plane
+        if denom.abs() < 1e-8 {
+            return None;
+        }
+
+        // Calculate the intersection distance
+        let t = (self.d - self.normal.dot(ray.origin)) / denom;
+        if !interval.contains(&t) {
+            return None;
+        }
+
+        // Check if the point lies within the quad
+        let (alpha, beta) = self.coordinates(ray.at(t));
+        if alpha < 0.0 || alpha > 1.0 || beta < 0.0 || beta > 1.0 {
+            return None;
+        }
+        Some(Hit::new(t, self))
+    }
+
+    fn record(&self, ray: &Ray, t: f64) -> HitRecord {
+        let intersection = ray.at(t);
+        let (alpha, beta) = self.coordinates(intersection);
+        HitRecord::new(ray, intersection, self.normal, self.material, alpha, beta)
+    }
+
+    fn intersect_packet<'a>(&'a self, packet: &mut RayPacket<'a>) {
+        let normal = packet_vector(self.normal);
+        let origin = packet_vector(self.origin);
+        // coordinates() as dot products with the point: w.(p x v) = p.(v x w) and w.(u x p) = p.(w x u)
+        let alpha_axis = packet_vector(self.v_vec.cross(self.w));
+        let beta_axis = packet_vector(self.w.cross(self.u_vec));
+        let d = self.d as f32;
+        let mut t = [f32::INFINITY; PACKET_SIZE];
+        for lane in 0..PACKET_SIZE {
+            let o = [0, 1, 2].map(|axis| packet.origin[axis][lane]);
+            let dir = [0, 1, 2].map(|axis| packet.direction[axis][lane]);
+            let denom = normal[0] * dir[0] + normal[1] * dir[1] + normal[2] * dir[2];
+            let distance = (d - (normal[0] * o[0] + normal[1] * o[1] + normal[2] * o[2])) / denom;
+            let p = [0, 1, 2].map(|axis| o[axis] + distance * dir[axis] - origin[axis]);
+            let alpha = p[0] * alpha_axis[0] + p[1] * alpha_axis[1] + p[2] * alpha_axis[2];
+            let beta = p[0] * beta_axis[0] + p[1] * beta_axis[1] + p[2] * beta_axis[2];
+            if denom.abs() >= 1e-8
+                && distance >= packet.t_min
+                && distance < packet.t_max[lane]
+                && (0.0..=1.0).contains(&alpha)
+                && (0.0..=1.0).contains(&beta)
+            {
+                t[lane] = distance;
+            }
+        }
+        packet.accept(&t, self);
+    }
+
+    fn bounding_box(&self) -> Aabb {
+        let Self { origin, u_vec, v_vec, .. } = *self;
+        Aabb::from_points([origin, origin + u_vec, origin + v_vec, origin + u_vec + v_vec]).padded(1e-4)
+    }
+}
+
+pub fn create_cuboid(
+    center: DVec3,
+    dimensions: DVec3,
+    material: MaterialId,
+    world: &mut HittableList,
+) {
+    // Calculate half-dimensions for easier positioning
+    let half_width = dimensions.x / 2.0;
+    let half_height = dimensions.y / 2.0;
+    let half_depth = dimensions.z / 2.0;
+
+    // Front face
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, -half_height, half_depth),
+        DVec3::new(0.0, dimensions.y, 0.0),
+        DVec3::new(dimensions.x, 0.0, 0.0),
+        material,
+    ));
+
+    // Back face
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, -half_height, -half_depth),
+        DVec3::new(0.0, dimensions.y, 0.0),
+        DVec3::new(-dimensions.x, 0.0, 0.0),
+        material,
+    ));
+
+    // Right face - ERROR 1: Incorrect starting position (using half_width instead of -half_width)
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, -half_height, half_depth),
+        DVec3::new(0.0, dimensions.y, 0.0),
+        DVec3::new(0.0, 0.0, -dimensions.z),
+        material,
+    ));
+
+    // Left face
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, -half_height, -half_depth),
+        DVec3::new(0.0, dimensions.y, 0.0),
+        DVec3::new(0.0, 0.0, dimensions.z),
+        material,
+    ));
+
+    // Top face - ERROR 2: Swapped vector parameters (u and v vectors mixed up)
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, half_height, -half_depth),
+        DVec3::new(0.0, 0.0, dimensions.z),
+        DVec3::new(dimensions.x, 0.0, 0.0),
+        material,
+    ));
+
+    // Bottom face
+    world.add(Quad::new(
+        center + DVec3::new(-half_width, -half_height, -half_depth),
+        DVec3::new(dimensions.x, 0.0, 0.0),
+        DVec3::new(0.0, 0.0, dimensions.z),
+        material,
+    ));
+}
+
+pub struct HittableList {
+    pub objects: Vec<Box<dyn Hittable>>,
+    pub materials: Vec<Material>,
+    environment: Option<Arc<EnvironmentMap>>,
+}
+
+impl HittableList {
+    pub fn new() -> Self {
+        Self { objects: vec![], materials: vec![], environment: None }
+    }
+
+    // Lights the scene with an environment map instead of the sky gradient
+    pub fn set_environment(&mut self, environment: Arc<EnvironmentMap>) {
+        self.environment = Some(environment);
+    }
+
+    pub fn add(&mut self, object: impl Hittable + 'static) {
+        self.objects.push(Box::new(object));
+    }
+
+    // Adds a material to the table and returns the id objects refer to it by
+    pub fn add_material(&mut self, material: impl Into<Material>) -> MaterialId {
+        self.materials.push(material.into());
+        (self.materials.len() - 1) as MaterialId
+    }
+}
+
+impl Hittable for HittableList {
+    fn intersect(&self, ray: &Ray, mut interval: Range<f64>) -> Option<Hit<'_>> {
+        let mut closest = None;
+        for object in &self.objects {
+            if let Some(hit) = object.intersect(ray, interval.clone()) {
+                interval.end = hit.t;
+                closest = Some(hit);
+            }
+        }
+        closest
+    }
+
+    fn intersect_counted(&self, ray: &Ray, mut interval: Range<f64>, tests: &mut u64) -> Option<Hit<'_>> {
+        let mut closest = None;
+        for object in &self.objects {
+            if let Some(hit) = object.intersect_counted(ray, interval.clone(), tests) {
+                interval.end = hit.t;
+                closest = Some(hit);
+            }
+        }
+        closest
+    }
+
+    // intersect() returns the primitive hit, which builds its own record
+    fn record(&self, _: &Ray, _: f64) -> HitRecord {
+        unreachable!("a HittableList never returns itself from intersect()")
+    }
+
+    fn intersect_packet<'a>(&'a self, packet: &mut RayPacket<'a>) {
+        for object in &self.objects {
+            object.intersect_packet(packet);
+        }
+    }
+
+    fn environment(&self) -> Option<&EnvironmentMap> {
+        self.environment.as_deref()
+    }
+
+    fn materials(&self) -> &[Material] {
+        &self.materials
+    }
+
+    fn bounding_box(&self) -> Aabb {
+        self.objects.iter().fold(Aabb::EMPTY, |aabb, object| aabb.union(object.bounding_box()))
+    }
+}
+
+// Bounding volume hierarchy --------------------------------------------------
+// The top-level world: objects keyed by stable ids from the scene, in a tree of
+// bounding boxes so a ray only tests the objects whose boxes it passes through.
+//
+// Edits do not rebuild the tree. An object replaced by one that still fits its
+// leaf's box is swapped in place, one that moved a little grows the boxes on the
+// path to the root, and one that moved far, or is new, goes into a second tree of
+// recent objects that commit() rebuilds. Once the recent objects or the removed
+// ones are a sizeable fraction of the scene, commit() rebuilds everything.
+const LEAF_SIZE: usize = 4;
+// A moved object refits in place while it grows its leaf's surface area at most this much
+const REFIT_GROWTH: f64 = 2.0;
+
+#[derive(Clone, Copy)]
+struct BvhNode {
+    bounds: Aabb,
+    parent: u32,
+    // A leaf holds order[start..start + count]; an interior node has count 0, its
+    // left child is the next node and `start` is its right child
+    start: u32,
+    count: u32,
+}
+
+#[derive(Default)]
+struct BvhTree {
+    // Preorder, so every child comes after its parent
+    nodes: Vec<BvhNode>,
+    // Object slots, grouped by leaf
+    order: Vec<u32>,
+}
+
+impl BvhTree {
+    fn build(slots: Vec<u32>, bounds: &[Aabb], mut on_leaf: impl FnMut(u32, u32)) -> Self {
+        let mut tree = Self { nodes: Vec::with_capacity(2 * slots.len() / LEAF_SIZE + 1), order: slots };
+        if !tree.order.is_empty() {
+            tree.build_node(0..tree.order.len(), u32::MAX, bounds);
+            for (index, node) in tree.nodes.iter().enumerate().filter(|(_, node)| node.count > 0) {
+                for &slot in &tree.order[node.start as usize..(node.start + node.count) as usize] {
+                    on_leaf(slot, index as u32);
+                }
+            }
+        }
+        tree
+    }
+
+    // Splits at the median centroid along the widest axis of the centroids, which
+    // keeps the tree balanced and the build O(n log n)
+    fn build_node(&mut self, range: Range<usize>, parent: u32, bounds: &[Aabb]) -> u32 {
+        let index = self.nodes.len() as u32;
+        let slots = &mut self.order[range.clone()];
+        let node_bounds = slots.iter().fold(Aabb::EMPTY, |aabb, &slot| aabb.union(bounds[slot as usize]));
+        self.nodes.push(BvhNode { bounds: node_bounds, parent, start: range.start as u32, count: slots.len() as u32 });
+        if slots.len() <= LEAF_SIZE {
+            return index;
+        }
+
+        let centroids = Aabb::from_points(slots.iter().map(|&slot| bounds[slot as usize].centroid()));
+        let extent = centroids.max - centroids.min;
+        let axis = if extent.x >= extent.y && extent.x >= extent.z { 0 } else if extent.y >= extent.z { 1 } else { 2 };
+        let middle = slots.len() / 2;
+        slots.select_nth_unstable_by(middle, |a, b| {
+            let a = bounds[*a as usize].centroid()[axis];
+            let b = bounds[*b as usize].centroid()[axis];
+            a.total_cmp(&b)
+        });
+
+        self.build_node(range.start..range.start + middle, index, bounds);
+        let right = self.build_node(range.start + middle..range.end, index, bounds);
+        self.nodes[index as usize].start = right;
+        self.nodes[index as usize].count = 0;
+        index
+    }
+
+    // Grows the boxes from a leaf up to the root until one already encloses `bounds`
+    fn grow(&mut self, mut node: u32, bounds: Aabb) {
+        while node != u32::MAX {
+            let entry = &mut self.nodes[node as usize];
+            if entry.bounds.contains(&bounds) {
+                break;
+            }
+            entry.bounds = entry.bounds.union(bounds);
+            node = entry.parent;
+        }
+    }
+
+    fn bounds(&self) -> Aabb {
+        self.nodes.first().map_or(Aabb::EMPTY, |root| root.bounds)
+    }
+}
+
+#[derive(Clone, Copy, PartialEq)]
+enum BvhSlot {
+    // In the main tree, in this leaf
+    Main(u32),
+    Recent,
+    Free,
+}
+
+pub struct Bvh {
+    objects: Vec<Option<Box<dyn Hittable>>>,
+    // Per slot: the object's box (kept so builds make no virtual calls), id and where it is
+    bounds: Vec<Aabb>,
+    ids: Vec<u64>,
+    location: Vec<BvhSlot>,
+    slots: HashMap<u64, u32>,
+    main: BvhTree,
+    recent: BvhTree,
+    recent_slots: Vec<u32>,
+    recent_changed: bool,
+    removed: usize,
+    environment: Option<Arc<EnvironmentMap>>,
+    materials: Vec<Material>,
+}
+
+impl Bvh {
+    pub fn new(objects: impl IntoIterator<Item = (u64, Box<dyn Hittable>)>) -> Self {
+        let mut bvh = Self {
+            objects: vec![],
+            bounds: vec![],
+            ids: vec![],
+            location: vec![],
+            slots: HashMap::new(),
+            main: BvhTree::default(),
+            recent: BvhTree::default(),
+            recent_slots: vec![],
+            recent_changed: false,
+            removed: 0,
+            environment: None,
+            materials: vec![],
+        };
+        for (id, object) in objects {
+            bvh.insert(id, object);
+        }
+        bvh.rebuild();
+        bvh
+    }
+
+    // Lights the scene with an environment map instead of the sky gradient
+    pub fn set_environment(&mut self, environment: Arc<EnvironmentMap>) {
+        self.environment = Some(environment);
+    }
+
+    // The material table the objects' MaterialIds index, replacing the previous one
+    pub fn set_materials(&mut self, materials: Vec<Material>) {
+        self.materials = materials;
+    }
+
+    pub fn len(&self) -> usize {
+        self.slots.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.slots.is_empty()
+    }
+
+    // Adds an object, or replaces the object with the same id. Call commit() after a batch of edits.
+    pub fn insert(&mut self, id: u64, object: Box<dyn Hittable>) {
+        let bounds = object.bounding_box();
+        let Some(&slot) = self.slots.get(&id) else {
+            self.push_recent(id, object, bounds);
+            return;
+        };
+
+        let index = slot as usize;
+        match self.location[index] {
+            BvhSlot::Main(leaf) => {
+                let leaf_bounds = self.main.nodes[leaf as usize].bounds;
+                let grown = leaf_bounds.union(bounds);
+                if grown.surface_area() > REFIT_GROWTH * leaf_bounds.surface_area() {
+                    // Moved too far to refit without slowing every ray through this part of the tree
+                    self.free(slot);
+                    self.push_recent(id, object, bounds);
+                    return;
+                }
+                self.main.grow(leaf, bounds);
+            }
+            _ => self.recent_changed = true,
+        }
+        self.objects[index] = Some(object);
+        self.bounds[index] = bounds;
+    }
+
+    pub fn remove(&mut self, id: u64) -> bool {
+        match self.slots.remove(&id) {
+            Some(slot) => {
+                self.free(slot);
+                true
+            }
+            None => false,
+        }
+    }
+
+    // Makes a batch of edits ready for rendering
+    pub fn commit(&mut self) {
+        let live = self.slots.len();
+        if self.recent_slots.len() > 64.max(live / 16) || self.removed > 64.max(live / 4) {
+            self.rebuild();
+        } else if self.recent_changed {
+            self.recent = BvhTree::build(self.recent_slots.clone(), &self.bounds, |_, _| {});
+            self.recent_changed = false;
+        }
+    }
+
+    // Builds one tree over every object, dropping the slots of removed ones
+    pub fn rebuild(&mut self) {
+        let live: Vec<usize> = (0..self.objects.len()).filter(|&slot| self.location[slot] != BvhSlot::Free).collect();
+        self.objects = live.iter().map(|&slot| self.objects[slot].take()).collect();
+        self.bounds = live.iter().map(|&slot| self.bounds[slot]).collect();
+        self.ids = live.iter().map(|&slot| self.ids[slot]).collect();
+        self.slots = self.ids.iter().enumerate().map(|(slot, &id)| (id, slot as u32)).collect();
+        // Room for the recent objects commit() allows before the next rebuild, so edits never reallocate
+        let headroom = 65.max(self.objects.len() / 16 + 1);
+        self.objects.reserve(headroom);
+        self.bounds.reserve(headroom);
+        self.ids.reserve(headroom);
+
+        self.location = vec![BvhSlot::Free; self.objects.len()];
+        self.location.reserve(headroom);
+        let location = &mut self.location;
+        self.main = BvhTree::build((0..self.objects.len() as u32).collect(), &self.bounds, |slot, leaf| {
+            location[slot as usize] = BvhSlot::Main(leaf);
+        });
+        self.recent = BvhTree::default();
+        self.recent_slots.clear();
+        self.recent_changed = false;
+        self.removed = 0;
+    }
+
+    fn push_recent(&mut self, id: u64, object: Box<dyn Hittable>, bounds: Aabb) {
+        let slot = self.objects.len() as u32;
+        self.objects.push(Some(object));
+        self.bounds.push(bounds);
+        self.ids.push(id);
+        self.location.push(BvhSlot::Recent);
+        self.slots.insert(id, slot);
+        self.recent_slots.push(slot);
+        self.recent_changed = true;
+    }
+
+    fn free(&mut self, slot: u32) {
+        let index = slot as usize;
+        if self.location[index] == BvhSlot::Recent {
+            self.recent_slots.retain(|&recent| recent != slot);
+            self.recent_changed = true;
+        }
+        self.objects[index] = None;
+        self.location[index] = BvhSlot::Free;
+        self.removed += 1;
+    }
+
+    // Closest hit in one tree, nearer children first, skipping subtrees beyond the closest hit so far
+    fn hit_tree<'a>(
+        &'a self,
+        tree: &BvhTree,
+        ray: &Ray,
+        interval: &mut Range<f64>,
+        closest: &mut Option<Hit<'a>>,
+        test: &mut impl FnMut(&'a dyn Hittable, Range<f64>) -> Option<Hit<'a>>,
+    ) {
+        let inverse_direction = ray.direction.recip();
+        let Some(root_t) = tree.nodes.first().and_then(|root| root.bounds.hit(ray.origin, inverse_direction, interval)) else {
+            return;
+        };
+        // Deep enough for any tree built from median splits of up to 2^64 objects
+        let mut stack = [(0u32, 0.0f64); 64];
+        stack[0] = (0, root_t);
+        let mut depth = 1;
+
+        while depth > 0 {
+            depth -= 1;
+            let (index, enter) = stack[depth];
+            if enter > interval.end {
+                continue;
+            }
+            let node = &tree.nodes[index as usize];
+            if node.count > 0 {
+                for &slot in &tree.order[node.start as usize..(node.start + node.count) as usize] {
+                    let Some(object) = &self.objects[slot as usize] else { continue };
+                    if let Some(hit) = test(object.as_ref(), interval.clone()) {
+                        interval.end = hit.t;
+                        *closest = Some(hit);
+                    }
+                }
+                continue;
+            }
+
+            let children = [index + 1, node.start];
+            let hits = children.map(|child| tree.nodes[child as usize].bounds.hit(ray.origin, inverse_direction, interval));
+            let [near, far] = match hits {
+                [Some(a), Some(b)] if b < a => [(children[1], hits[1]), (children[0], hits[0])],
+                _ => [(children[0], hits[0]), (children[1], hits[1])],
+            };
+            for (child, enter) in [far, near] {
+                if let Some(enter) = enter {
+                    stack[depth] = (child, enter);
+                    depth += 1;
+                }
+            }
+        }
+    }
+
+    // hit_tree() for a packet: a node is entered if any lane's ray passes through its box
+    // before that lane's closest hit, and children are visited nearer first along the
+    // first ray, which in a coherent packet is nearer first for the others too
+    fn packet_tree<'a>(&'a self, tree: &BvhTree, packet: &mut RayPacket<'a>) {
+        if tree.nodes.is_empty() {
+            return;
+        }
+        let direction = packet.rays[0].direction;
+        // Both children of every node on the path to the deepest leaf fit
+        let mut stack = [0u32; 128];
+        let mut depth = 1;
+
+        while depth > 0 {
+            depth -= 1;
+            let index = stack[depth];
+            let node = &tree.nodes[index as usize];
+            if !node.bounds.hit_packet(packet) {
+                continue;
+            }
+            if node.count > 0 {
+                for &slot in &tree.order[node.start as usize..(node.start + node.count) as usize] {
+                    if let Some(object) = &self.objects[slot as usize] {
+                        object.intersect_packet(packet);
+                    }
+                }
+                continue;
+            }
+
+            let (left, right) = (index + 1, node.start);
+            let ahead = tree.nodes[right as usize].bounds.centroid() - tree.nodes[left as usize].bounds.centroid();
+            let (near, far) = if ahead.dot(direction) >= 0.0 { (left, right) } else { (right, left) };
+            stack[depth] = far;
+            stack[depth + 1] = near;
+            depth += 2;
+        }
+    }
+
+    fn intersect_with<'a>(
+        &'a self,
+        ray: &Ray,
+        mut interval: Range<f64>,
+        mut test: impl FnMut(&'a dyn Hittable, Range<f64>) -> Option<Hit<'a>>,
+    ) -> Option<Hit<'a>> {
+        let mut closest = None;
+        self.hit_tree(&self.main, ray, &mut interval, &mut closest, &mut test);
+        self.hit_tree(&self.recent, ray, &mut interval, &mut closest, &mut test);
+        closest
+    }
+}
+
+impl Hittable for Bvh {
+    fn intersect(&self, ray: &Ray, interval: Range<f64>) -> Option<Hit<'_>> {
+        self.intersect_with(ray, interval, |object, interval| object.intersect(ray, interval))
+    }
+
+    fn intersect_counted(&self, ray: &Ray, interval: Range<f64>, tests: &mut u64) -> Option<Hit<'_>> {
+        self.intersect_with(ray, interval, |object, interval| object.intersect_counted(ray, interval, tests))
+    }
+
+    // intersect() returns the primitive hit, which builds its own record
+    fn record(&self, _: &Ray, _: f64) -> HitRecord {
+        unreachable!("a Bvh never returns itself from intersect()")
+    }
+
+    fn intersect_packet<'a>(&'a self, packet: &mut RayPacket<'a>) {
+        self.packet_tree(&self.main, packet);
+        self.packet_tree(&self.recent, packet);
+    }
+
+    fn environment(&self) -> Option<&EnvironmentMap> {
+        self.environment.as_deref()
+    }
+
+    fn materials(&self) -> &[Material] {
+        &self.materials
+    }
+
+    fn bounding_box(&self) -> Aabb {
+        self.main.bounds().union(self.recent.bounds())
+    }
+}
+
+// Instancing -----------------------------------------------------------------
+// One shared object (typically a HittableList group) placed by an affine transform.
+// Rays are moved into object space, so any number of instances share the same geometry.
+pub struct Instance {
+    object: Arc<dyn Hittable>,
+    to_world: DAffine3,
+    to_object: DAffine3,
+    normal_matrix: DMat3,
+    material: Option<MaterialId>,
+}
+
+impl Instance {
+    pub fn new(object: Arc<dyn Hittable>, to_world: DAffine3, material: Option<MaterialId>) -> Self {
+        let to_object = to_world.inverse();
+        Self {
+            object,
+            to_world,
+            to_object,
+            normal_matrix: to_object.matrix3.transpose(),
+            material,
+        }
+    }
+
+    // The direction is not renormalised, so t is the same in both spaces
+    fn to_local(&self, ray: &Ray) -> Ray {
+        Ray::new(
+            self.to_object.transform_point3(ray.origin),
+            self.to_object.transform_vector3(ray.direction),
+        )
+    }
+
+    // An object-space record of a primitive in this instance, moved into world space
+    fn to_world_record(&self, mut rec: HitRecord) -> HitRecord {
+        // Normals transform by the inverse transpose; front_face is preserved by that transform
+        rec.point = self.to_world.transform_point3(rec.point);
+        rec.normal = (self.normal_matrix * rec.normal).normalize();
+        if let Some(material) = self.material {
+            rec.material = material;
+        }
+        rec
+    }
+
+    fn through<'a>(&'a self, hit: Hit<'a>) -> Hit<'a> {
+        match hit.instance {
+            None => Hit { t: hit.t, primitive: hit.primitive, instance: Some(self) },
+            // A Hit carries one instance, so one nested in this instance's object makes
+            // this instance the primitive, and its record() finds the nested hit again
+            Some(_) => Hit::new(hit.t, self),
+        }
+    }
+}
+
+// The primitive hit inside the shared object is carried in the Hit, so its record is
+// built in object space and moved into world space without traversing the object again.
+impl Hittable for Instance {
+    fn intersect(&self, ray: &Ray, interval: Range<f64>) -> Option<Hit<'_>> {
+        Some(self.through(self.object.intersect(&self.to_local(ray), interval)?))
+    }
+
+    fn intersect_counted(&self, ray: &Ray, interval: Range<f64>, tests: &mut u64) -> Option<Hit<'_>> {
+        Some(self.through(self.object.intersect_counted(&self.to_local(ray), interval, tests)?))
+    }
+
+    // Only for instances whose object contains instances (see through()). Rounding in the
+    // object's bounding boxes can miss the hit at exactly t, so the interval then widens
+    // to every hit beyond it, and a surface facing the ray stands in if even that misses.
+    fn record(&self, ray: &Ray, t: f64) -> HitRecord {
+        let local = self.to_local(ray);
+        let hit = self.object.intersect(&local, t..t.next_up())
+            .or_else(|| self.object.intersect(&local, t.next_down()..f64::INFINITY));
+        match hit {
+            Some(hit) => self.to_world_record(hit.record(&local)),
+            None => HitRecord::new(ray, ray.at(t), -ray.direction.normalize(), self.material.unwrap_or(0), 0.0, 0.0),
+        }
+    }
+
+    fn bounding_box(&self) -> Aabb {
+        let Aabb { min, max } = self.object.bounding_box();
+        Aabb::from_points((0..8).map(|corner| {
+            let pick = |axis: usize| if corner & (1 << axis) == 0 { min[axis] } else { max[axis] };
+            self.to_world.transform_point3(DVec3::new(pick(0), pick(1), pick(2)))
+        }))
+    }
+}
+
+// Environment lighting -------------------------------------------------------
+// An equirectangular map of the light arriving from every direction, +y up, laid
+// out like the UVs of a textured sphere. Directions are importance sampled in
+// proportion to luminance (times sin(theta), the solid angle of each row) using a
+// marginal CDF over the rows and a conditional CDF within each row, so a small
+// bright sun is found by most samples rather than by the odd lucky bounce.
+pub struct EnvironmentMap {
+    width: usize,
+    height: usize,
+    // Linear RGB, row-major from the top (+y)
+    pixels: Vec<f32>,
+    intensity: f64,
+    // height + 1 entries, normalised to end at 1
+    row_cdf: Vec<f32>,
+    // width + 1 entries per row, each row normalised to end at 1
+    column_cdf: Vec<f32>,
+    // Sum of the sampling weights; zero for an all-black map, which is never sampled
+    total: f64,
+}
+
+impl EnvironmentMap {
+    // `pixels` holds width * height linear RGB triples
+    pub fn new(width: usize, height: usize, pixels: Vec<f32>, intensity: f64) -> Self {
+        assert_eq!(pixels.len(), width * height * 3, "environment map size mismatch");
+        let mut row_cdf = Vec::with_capacity(height + 1);
+        let mut column_cdf = Vec::with_capacity((width + 1) * height);
+        let mut row = vec![0.0f64; width + 1];
+        let mut total = 0.0f64;
+        row_cdf.push(0.0);
+
+        for y in 0..height {
+            let sin_theta = (PI * (y as f64 + 0.5) / height as f64).sin();
+            for x in 0..width {
+                let i = (y * width + x) * 3;
+                let color = DVec3::new(pixels[i] as f64, pixels[i + 1] as f64, pixels[i + 2] as f64);
+                row[x + 1] = row[x] + luminance(color).max(0.0) * sin_theta;
+            }
+            let row_total = row[width];
+            column_cdf.extend(row.iter().map(|&c| if row_total > 0.0 { (c / row_total) as f32 } else { 0.0 }));
+            total += row_total;
+            row_cdf.push(total as f32);
+        }
+        if total > 0.0 {
+            for c in &mut row_cdf {
+                *c = (*c as f64 / total) as f32;
+            }
+        }
+
+        Self { width, height, pixels, intensity, row_cdf, column_cdf, total }
+    }
+
+    // Decodes an image file. Radiance (.hdr) and OpenEXR files are already linear;
+    // other formats are treated as stored with the gamma-2 curve the renderer writes.
+    pub fn open(path: &str, intensity: f64) -> io::Result<Self> {
+        let image = image::open(path)
+            .map_err(|e| io::Error::new(io::ErrorKind::Other, e))?
+            .to_rgb32f();
+        let linear = Path::new(path)
+            .extension()
+            .and_then(|extension| extension.to_str())
+            .is_some_and(|extension| extension.eq_ignore_ascii_case("hdr") || extension.eq_ignore_ascii_case("exr"));
+        let (width, height) = (image.width() as usize, image.height() as usize);
+        let mut pixels = image.into_raw();
+        if !linear {
+            for value in &mut pixels {
+                *value *= *value;
+            }
+        }
+        Ok(Self::new(width, height, pixels, intensity))
+    }
+
+    fn texel(&self, direction: DVec3) -> (usize, usize) {
+        let d = direction.normalize();
+        let u = ((-d.z).atan2(d.x) + PI) / (2.0 * PI);
+        let v = d.y.clamp(-1.0, 1.0).acos() / PI;
+        let x = ((u * self.width as f64) as usize).min(self.width - 1);
+        let y = ((v * self.height as f64) as usize).min(self.height - 1);
+        (x, y)
+    }
+
+    fn pixel(&self, x: usize, y: usize) -> DVec3 {
+        let i = (y * self.width + x) * 3;
+        DVec3::new(self.pixels[i] as f64, self.pixels[i + 1] as f64, self.pixels[i + 2] as f64) * self.intensity
+    }
+
+    pub fn radiance(&self, direction: DVec3) -> DVec3 {
+        let (x, y) = self.texel(direction);
+        self.pixel(x, y)
+    }
+
+    // Probability density (per steradian) of sample() returning `direction`
+    pub fn pdf(&self, direction: DVec3) -> f64 {
+        if self.total <= 0.0 {
+            return 0.0;
+        }
+        let (x, y) = self.texel(direction);
+        let d = direction.normalize();
+        self.texel_pdf(x, y, (1.0 - d.y * d.y).max(0.0).sqrt())
+    }
+
+    fn texel_pdf(&self, x: usize, y: usize, sin_theta: f64) -> f64 {
+        if sin_theta <= 0.0 {
+            return 0.0;
+        }
+        let row = &self.column_cdf[y * (self.width + 1)..(y + 1) * (self.width + 1)];
+        let row_probability = (self.row_cdf[y + 1] - self.row_cdf[y]) as f64;
+        let probability = row_probability * (row[x + 1] - row[x]) as f64;
+        // Density over the unit square of (u, v), then per steradian: d(omega) = 2 pi^2 sin(theta) du dv
+        probability * (self.width * self.height) as f64 / (2.0 * PI * PI * sin_theta)
+    }
+
+    // A direction drawn in proportion to the map's luminance, with its radiance and density
+    pub fn sample<R: Rng>(&self, rng: &mut R) -> Option<(DVec3, DVec3, f64)> {
+        if self.total <= 0.0 {
+            return None;
+        }
+        let (row_choice, column_choice) = (rng.random::<f32>(), rng.random::<f32>());
+        let y = self.row_cdf[1..].partition_point(|&c| c <= row_choice).min(self.height - 1);
+        let row = &self.column_cdf[y * (self.width + 1)..(y + 1) * (self.width + 1)];
+        let x = row[1..].partition_point(|&c| c <= column_choice).min(self.width - 1);
+
+        let u = (x as f64 + rng.random::<f64>()) / self.width as f64;
+        let v = (y as f64 + rng.random::<f64>()) / self.height as f64;
+        let (phi, theta) = (2.0 * PI * u - PI, PI * v);
+        let direction = DVec3::new(theta.sin() * phi.cos(), theta.cos(), -theta.sin() * phi.sin());
+
+        let pdf = self.texel_pdf(x, y, theta.sin());
+        (pdf > 0.0).then(|| (direction, self.pixel(x, y), pdf))
+    }
+}
+
+// Rendering statistics -------------------------------------------------------
+// A rectangle of pixels, [x0, x1) x [y0, y1), rendered as one unit of work
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub struct Tile {
+    pub x0: u32,
+    pub y0: u32,
+    pub x1: u32,
+    pub y1: u32,
+}
+
+impl Tile {
+    pub fn width(&self) -> u32 {
+        self.x1 - self.x0
+    }
+
+    pub fn height(&self) -> u32 {
+        self.y1 - self.y0
+    }
+
+    pub fn pixel_count(&self) -> usize {
+        (self.width() * self.height()) as usize
+    }
+}
+
+// Opt-in counters filled by Ray::color_with_stats and the Camera render methods
+#[derive(Clone, Debug)]
+pub struct RenderStats {
+    pub primary_rays: u64,
+    pub secondary_rays: u64,
+    // Rays towards an environment map sample, testing whether it is blocked
+    pub shadow_rays: u64,
+    pub intersection_tests: u64,
+    pub max_depth_hits: u64,
+    // Paths by the number of bounces before they ended; the last bin holds paths cut off at max_depth
+    pub depth_histogram: Vec<u64>,
+    // Scattering events per material kind, indexed by MaterialKind
+    pub scatter_counts: [u64; MaterialKind::COUNT],
+    pub tile_times: Vec<(Tile, f64)>,
+    pub seconds: f64,
+}
+
+impl RenderStats {
+    pub fn new(max_depth: u32) -> Self {
+        Self {
+            primary_rays: 0,
+            secondary_rays: 0,
+            shadow_rays: 0,
+            intersection_tests: 0,
+            max_depth_hits: 0,
+            depth_histogram: vec![0; max_depth as usize + 1],
+            scatter_counts: [0; MaterialKind::COUNT],
+            tile_times: Vec::new(),
+            seconds: 0.0,
+        }
+    }
+
+    pub fn max_depth(&self) -> u32 {
+        self.depth_histogram.len() as u32 - 1
+    }
+
+    // seconds is the tracing time summed over tiles
+    pub fn record_tile(&mut self, tile: &Tile, seconds: f64) {
+        self.tile_times.push((*tile, seconds));
+        self.seconds += seconds;
+    }
+
+    // Adds the counters of another render of the same camera, e.g. a separately rendered tile
+    pub fn merge(&mut self, other: &RenderStats) {
+        self.primary_rays += other.primary_rays;
+        self.secondary_rays += other.secondary_rays;
+        self.shadow_rays += other.shadow_rays;
+        self.intersection_tests += other.intersection_tests;
+        self.max_depth_hits += other.max_depth_hits;
+        for (bin, count) in self.depth_histogram.iter_mut().zip(&other.depth_histogram) {
+            *bin += count;
+        }
+        for (bin, count) in self.scatter_counts.iter_mut().zip(&other.scatter_counts) {
+            *bin += count;
+        }
+        self.tile_times.extend_from_slice(&other.tile_times);
+        self.seconds += other.seconds;
+    }
+}
+
+// Camera ---------------------------------------------------------------------
+pub const TILE_SIZE: u32 = 32;
+
+// Variance-driven sampling: every pixel gets min_samples (or samples_per_pixel if
+// that is fewer), then the rest of the samples_per_pixel budget goes to pixels whose
+// estimated noise is still above noise_threshold, up to max_samples each.
+#[derive(Clone, Copy)]
+pub struct AdaptiveSampling {
+    pub noise_threshold: f64,
+    pub min_samples: u32,
+    pub max_samples: u32,
+}
+
+fn luminance(color: DVec3) -> f64 {
+    color.dot(DVec3::new(0.2126, 0.7152, 0.0722))
+}
+
+pub struct Camera {
+    image_width: u32,
+    image_height: u32,
+    samples_per_pixel: u32,
+    max_depth: u32,
+    position: DVec3,
+    basis_u: DVec3,
+    basis_v: DVec3,
+    basis_w: DVec3,
+    pixel_delta_u: DVec3,
+    pixel_delta_v: DVec3,
+    pixel00_loc: DVec3,
+    defocus_radius: f64,
+    focus_distance: f64,
+    seed: u64,
+}
+
+impl Camera {
+    pub fn new(
+        image_width: u32,
+        aspect_ratio: f64,
+        samples_per_pixel: u32,
+        max_depth: u32,
+        position: DVec3,
+        look_at: DVec3,
+        up: DVec3,
+        focus_distance: f64,
+        aperture: f64,
+    ) -> Self {
+        let image_height = (image_width as f64 / aspect_ratio) as u32;
+        let defocus_radius = aperture / 2.0;
+
+        // Calculate camera basis vectors
+        let w = (position - look_at).normalize();
+        let u = up.cross(w).normalize();
+        let v = w.cross(u);
+
+        // Viewport dimensions
+        let viewport_height = 2.0;
+        let viewport_width = viewport_height * (image_width as f64 / image_height as f64);
+
+        // Calculate pixel vectors
+        let viewport_u = viewport_width * u;
+        let viewport_v = viewport_height * -v;
+        let pixel_delta_u = viewport_u / image_width as f64;
+        let pixel_delta_v = viewport_v / image_height as f64;
+
+        // Calculate viewport positions
+        let viewport_upper_left = position - focus_distance * w - viewport_u/2.0 - viewport_v/2.0;
+        let pixel00_loc = viewport_upper_left + 0.5 * (pixel_delta_u + pixel_delta_v);
+
+        Self {
+            image_width,
+            image_height,
+            samples_per_pixel,
+            max_depth,
+            position,
+            basis_u: u,
+            basis_v: v,
+            basis_w: w,
+            pixel_delta_u,
+            pixel_delta_v,
+            pixel00_loc,
+            defocus_radius,
+            focus_distance,
+            seed: rand::random(),
+        }
+    }
+
+    // Fixes the random sequence, making renders reproducible and resumable
+    pub fn with_seed(mut self, seed: u64) -> Self {
+        self.seed = seed;
+        self
+    }
+
+    pub fn seed(&self) -> u64 {
+        self.seed
+    }
+
+    pub fn image_width(&self) -> u32 {
+        self.image_width
+    }
+
+    pub fn image_height(&self) -> u32 {
+        self.image_height
+    }
+
+    pub fn samples_per_pixel(&self) -> u32 {
+        self.samples_per_pixel
+    }
+
+    pub fn max_depth(&self) -> u32 {
+        self.max_depth
+    }
+
+    pub fn render<T: Hittable>(&self, world: &T) -> io::Result<()> {
+        let pixels = self.render_pixels(world, None);
+        self.save_ppm(pixels)
+    }
+
+    // Splits the image into tiles of at most size x size pixels, row-major from the top-left
+    pub fn tiles(&self, size: u32) -> Vec<Tile> {
+        let size = size.max(1);
+        let mut tiles = Vec::new();
+        for y0 in (0..self.image_height).step_by(size as usize) {
+            for x0 in (0..self.image_width).step_by(size as usize) {
+                tiles.push(Tile {
+                    x0,
+                    y0,
+                    x1: (x0 + size).min(self.image_width),
+                    y1: (y0 + size).min(self.image_height),
+                });
+            }
+        }
+        tiles
+    }
+
+    // Summed colours of the given sample indices for one tile, row-major within the tile
+    pub fn render_tile<T: Hittable>(
+        &self,
+        world: &T,
+        tile: &Tile,
+        samples: Range<u32>,
+        mut stats: Option<&mut RenderStats>,
+    ) -> Vec<DVec3> {
+        let start = Instant::now();
+        let mut pixels = Vec::with_capacity(tile.pixel_count());
+
+        for y in tile.y0..tile.y1 {
+            for x in tile.x0..tile.x1 {
+                let mut pixel_color = DVec3::ZERO;
+                for sample in samples.clone() {
+                    pixel_color += self.sample(world, x, y, sample, stats.as_deref_mut());
+                }
+                pixels.push(pixel_color);
+            }
+        }
+
+        if let Some(stats) = stats {
+            stats.record_tile(tile, start.elapsed().as_secs_f64());
+        }
+        pixels
+    }
+
+    // One camera sample. Its random numbers depend only on the seed, the pixel and the
+    // sample index, so splitting a render into tiles, batches or processes (or resuming
+    // it) gives the same image.
+    fn sample<T: Hittable>(&self, world: &T, x: u32, y: u32, sample: u32, stats: Option<&mut RenderStats>) -> DVec3 {
+        let mut rng = self.sample_rng(x, y, sample);
+        let ray = self.get_ray(x, y, &mut rng);
+        match stats {
+            Some(stats) => ray.color_with_stats(self.max_depth, world, &mut rng, stats),
+            None => ray.color(self.max_depth, world, &mut rng),
+        }
+    }
+
+    fn sample_rng(&self, x: u32, y: u32, sample: u32) -> SmallRng {
+        let pixel = ((y as u64) << 32) | x as u64;
+        let key = self.seed
+            ^ pixel.wrapping_mul(0x9E37_79B9_7F4A_7C15)
+            ^ (sample as u64).wrapping_mul(0xC2B2_AE3D_27D4_EB4F);
+        SmallRng::seed_from_u64(key)
+    }
+
+    // render_tile() with camera rays traced in packets of PACKET_SIZE neighbouring pixels,
+    // in f32. A packet only finds each ray's closest primitive: that primitive is
+    // intersected again in f64 for the hit record, and everything after it is traced one
+    // ray at a time, since rays go their separate ways once they scatter. A ray the f64
+    // test does not confirm is traced from the camera like any other. Samples use the
+    // same random numbers as render_tile(), so the two differ only where f32 picks a
+    // different primitive, at silhouettes and grazing angles.
+    pub fn render_tile_packets<T: Hittable>(&self, world: &T, tile: &Tile, samples: Range<u32>) -> Vec<DVec3> {
+        let mut pixels = vec![DVec3::ZERO; tile.pixel_count()];
+        if self.max_depth == 0 {
+            return pixels;
+        }
+        let pixel = |i: usize| (tile.x0 + i as u32 % tile.width(), tile.y0 + i as u32 / tile.width());
+
+        for (chunk, colors) in pixels.chunks_mut(PACKET_SIZE).enumerate() {
+            let first = chunk * PACKET_SIZE;
+            let lanes = colors.len();
+            for sample in samples.clone() {
+                // Lanes past the end of the tile repeat its last pixel, but are left out of the packet
+                let mut rngs: [SmallRng; PACKET_SIZE] = std::array::from_fn(|lane| {
+                    let (x, y) = pixel(first + lane.min(lanes - 1));
+                    self.sample_rng(x, y, sample)
+                });
+                let rays: [Ray; PACKET_SIZE] = std::array::from_fn(|lane| {
+                    let (x, y) = pixel(first + lane.min(lanes - 1));
+                    self.get_ray(x, y, &mut rngs[lane])
+                });
+                let mut packet = RayPacket::new(&rays[..lanes], 0.001..f64::INFINITY);
+                world.intersect_packet(&mut packet);
+
+                for (lane, color) in colors.iter_mut().enumerate() {
+                    let (ray, rng) = (&rays[lane], &mut rngs[lane]);
+                    *color += match packet.hits()[lane] {
+                        Some(object) => match object.intersect(ray, 0.001..f64::INFINITY) {
+                            Some(hit) => ray.shade(&hit.record(ray), self.max_depth, world, rng),
+                            None => ray.trace(self.max_depth, world, rng, None),
+                        },
+                        None => ray.background(world.environment(), None),
+                    };
+                }
+            }
+        }
+        pixels
+    }
+
+    // Summed (not yet averaged) sample colours, row-major from the top-left pixel
+    pub fn render_pixels<T: Hittable>(&self, world: &T, mut stats: Option<&mut RenderStats>) -> Vec<DVec3> {
+        self.render_tiles(|tile| self.render_tile(world, tile, 0..self.samples_per_pixel, stats.as_deref_mut()))
+    }
+
+    // render_pixels() with camera rays traced in packets; see render_tile_packets()
+    pub fn render_pixels_packets<T: Hittable>(&self, world: &T) -> Vec<DVec3> {
+        self.render_tiles(|tile| self.render_tile_packets(world, tile, 0..self.samples_per_pixel))
+    }
+
+    fn render_tiles(&self, mut render_tile: impl FnMut(&Tile) -> Vec<DVec3>) -> Vec<DVec3> {
+        let mut pixels = vec![DVec3::ZERO; (self.image_width * self.image_height) as usize];
+
+        // Parallel tile processing would go here
+        for tile in self.tiles(TILE_SIZE) {
+            let tile_pixels = render_tile(&tile);
+            for (row, colors) in tile_pixels.chunks(tile.width() as usize).enumerate() {
+                let offset = ((tile.y0 + row as u32) * self.image_width + tile.x0) as usize;
+                pixels[offset..offset + colors.len()].copy_from_slice(colors);
+            }
+        }
+
+        pixels
+    }
+
+    // Summed sample colours and the number of samples taken for each pixel
+    pub fn render_adaptive<T: Hittable>(
+        &self,
+        world: &T,
+        adaptive: &AdaptiveSampling,
+        stats: Option<&mut RenderStats>,
+    ) -> (Vec<DVec3>, Vec<u32>) {
+        let frame = Tile { x0: 0, y0: 0, x1: self.image_width, y1: self.image_height };
+        self.render_adaptive_tile(world, &frame, adaptive, stats)
+    }
+
+    // Adaptive sampling of one tile, with a budget of samples_per_pixel times its pixel count.
+    // Results are row-major within the tile.
+    pub fn render_adaptive_tile<T: Hittable>(
+        &self,
+        world: &T,
+        tile: &Tile,
+        adaptive: &AdaptiveSampling,
+        mut stats: Option<&mut RenderStats>,
+    ) -> (Vec<DVec3>, Vec<u32>) {
+        let start = Instant::now();
+        let pixel_count = tile.pixel_count();
+        let mut pixels = vec![DVec3::ZERO; pixel_count];
+        let mut counts = vec![0u32; pixel_count];
+
+        // Running luminance sums for each pixel's variance estimate
+        let mut lum_sum = vec![0.0f64; pixel_count];
+        let mut lum_sq_sum = vec![0.0f64; pixel_count];
+
+        let budget = self.samples_per_pixel as u64 * pixel_count as u64;
+        let mut spent = 0u64;
+        let mut active: Vec<usize> = (0..pixel_count).collect();
+        // A budget below min_samples per pixel is shared out evenly instead
+        let mut batch = adaptive.min_samples.max(1).min(self.samples_per_pixel.max(1));
+
+        while !active.is_empty() && spent < budget {
+            for &i in &active {
+                let x = tile.x0 + i as u32 % tile.width();
+                let y = tile.y0 + i as u32 / tile.width();
+                // The last batch may not go round, so it stops where the budget runs out
+                let take = (batch.min(adaptive.max_samples - counts[i]) as u64).min(budget - spent) as u32;
+                for sample in counts[i]..counts[i] + take {
+                    let color = self.sample(world, x, y, sample, stats.as_deref_mut());
+                    let lum = luminance(color);
+                    pixels[i] += color;
+                    lum_sum[i] += lum;
+                    lum_sq_sum[i] += lum * lum;
+                }
+                counts[i] += take;
+                spent += take as u64;
+            }
+
+            // Drop pixels whose standard error is within the threshold relative to their brightness
+            active.retain(|&i| {
+                let n = counts[i] as f64;
+                if counts[i] >= adaptive.max_samples {
+                    return false;
+                }
+                if counts[i] < 2 {
+                    return true;
+                }
+                let mean = lum_sum[i] / n;
+                let variance = ((lum_sq_sum[i] - lum_sum[i] * mean) / (n - 1.0)).max(0.0);
+                (variance / n).sqrt() > adaptive.noise_threshold * mean.max(1e-2)
+            });
+
+            // Spread what is left of the budget over the pixels that are still noisy
+            if !active.is_empty() {
+                let remaining = budget.saturating_sub(spent) / active.len() as u64;
+                batch = remaining.clamp(1, adaptive.min_samples.max(1) as u64) as u32;
+            }
+        }
+
+        if let Some(stats) = stats {
+            stats.record_tile(tile, start.elapsed().as_secs_f64());
+        }
+        (pixels, counts)
+    }
+
+    // First-hit albedo and world-space normal per pixel, averaged over `samples` rays.
+    // Misses record the background as albedo and a zero normal. Rays are those of the
+    // first samples of a render with the same seed, so the guides match the colour.
+    pub fn render_aux<T: Hittable>(&self, world: &T, samples: u32) -> (Vec<DVec3>, Vec<DVec3>) {
+        let pixel_count = (self.image_width * self.image_height) as usize;
+        let mut albedo = vec![DVec3::ZERO; pixel_count];
+        let mut normal = vec![DVec3::ZERO; pixel_count];
+        let scale = 1.0 / samples.max(1) as f64;
+
+        for y in 0..self.image_height {
+            for x in 0..self.image_width {
+                let i = (y * self.image_width + x) as usize;
+                for sample in 0..samples.max(1) {
+                    let ray = self.get_ray(x, y, &mut self.sample_rng(x, y, sample));
+                    match world.hit(&ray, 0.001..f64::INFINITY) {
+                        Some(rec) => {
+                            albedo[i] += world.materials()[rec.material as usize].albedo(&rec) * scale;
+                            normal[i] += rec.normal * scale;
+                        }
+                        None => albedo[i] += ray.background(world.environment(), None) * scale,
+                    }
+                }
+            }
+        }
+
+        (albedo, normal)
+    }
+
+    pub fn get_ray<R: Rng>(&self, x: u32, y: u32, rng: &mut R) -> Ray {
+        let pixel_center = self.pixel00_loc
+            + x as f64 * self.pixel_delta_u
+            + y as f64 * self.pixel_delta_v;
+        
+        let defocus = self.defocus_radius * random_in_unit_disk(rng);
+        let ray_origin = self.position + self.basis_u * defocus.x + self.basis_v * defocus.y;
+        let ray_direction = pixel_center - ray_origin;
+
+        Ray::new(ray_origin, ray_direction)
+    }
+
+    fn save_ppm(&self, pixels: Vec<DVec3>) -> io::Result<()> {
+        let scale = 1.0 / self.samples_per_pixel as f64;
+        let mut output = format!(
+            "P3\n{} {}\n255\n",
+            self.image_width, self.image_height
+        );
+
+        for color in pixels {
+            let scaled = color * scale;
+            let rgb = DVec3::new(
+                scaled.x.sqrt().clamp(0.0, 0.999),
+                scaled.y.sqrt().clamp(0.0, 0.999),
+                scaled.z.sqrt().clamp(0.0, 0.999),
+            ) * 256.0;
+
+            output += &format!(
+                "{} {} {}\n",
+                rgb.x as u8, rgb.y as u8, rgb.z as u8
+            );
+        }
+
+        fs::write("output.ppm", output)
+    }
+}
+
+fn random_in_unit_disk<R: Rng>(rng: &mut R) -> DVec3 {
+    loop {
+        let p = DVec3::new(rng.random_range(-1.0..1.0), rng.random_range(-1.0..1.0), 0.0);
+        if p.length_squared() < 1.0 {
+            return p;
+        }
+    }
+}
+
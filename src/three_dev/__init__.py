@@ -0,0 +1,8 @@
+from .scene import Scene, ColumnTable, LAMBERTIAN, METAL, DIELECTRIC
+from .scene_file import write_scene, read_scene
+from .scene_diff import SceneDiff, diff_scenes
+from .autosave import Autosave, recover
+from .framebuffer import Framebuffer
+from .stats import RenderStats
+from .tonemap import Tonemap
+from .cli import main
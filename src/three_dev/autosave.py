@@ -0,0 +1,303 @@
+"""
+Autosave for a scene being edited: edits are appended to a journal next to the
+scene file by a background thread, and the journal is periodically compacted
+into a snapshot of the whole scene.
+
+The scene's ColumnTables record which rows are written, so recording an edit
+copies only those rows, never the scene. Compaction replays the journal onto
+the previous snapshot (or the scene file) rather than writing out the live
+scene, so the full write happens on the background thread from files on disk
+and editing never waits for it. After a crash, recover() replays every record
+that reached the disk on top of the latest snapshot.
+
+For a scene file `cave.3dv` the journal is `cave.3dv.journal` and the snapshot
+`cave.3dv.autosave`. Both carry the size and mtime of the scene file they
+started from, so saving over the scene file retires them.
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from .scene import ColumnTable, Scene
+from .scene_file import _scene_metadata, dump_arrays, load_arrays, read_arrays, read_scene, write_arrays
+
+# Journal layout:
+#   MAGIC | i64 source size | i64 source mtime_ns | records
+#   record: u64 sequence | u64 payload length | u32 crc32 | payload (dump_arrays)
+# A record cut short by a crash fails its length or checksum, and replay stops there.
+MAGIC = b"3DEVJNL\0"
+SOURCE = struct.Struct("<qq")
+RECORD = struct.Struct("<QQI")
+
+# Tables journalled, by Scene attribute
+TABLES = ("materials", "spheres", "quads", "cuboids", "instances")
+
+# (byte size, mtime_ns) of the scene file, or (-1, -1) if there is none
+Stamp = Tuple[int, int]
+
+def journal_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".journal")
+
+def snapshot_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".autosave")
+
+def _stamp(path: Path) -> Stamp:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return (-1, -1)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def _journal_stamp(path: Path) -> Optional[Stamp]:
+    # The stamp a journal was started against, or None if there is no readable journal
+    try:
+        with open(journal_path(path), "rb") as f:
+            prefix = f.read(len(MAGIC) + SOURCE.size)
+    except FileNotFoundError:
+        return None
+    if len(prefix) < len(MAGIC) + SOURCE.size or not prefix.startswith(MAGIC):
+        return None
+    return SOURCE.unpack_from(prefix, len(MAGIC))
+
+def _records(f: BinaryIO):
+    # Yields (sequence, payload, end offset) for each intact record after the journal prefix
+    size = os.fstat(f.fileno()).st_size
+    f.seek(len(MAGIC) + SOURCE.size)
+    while True:
+        header = f.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        sequence, length, checksum = RECORD.unpack(header)
+        if length > size - f.tell():
+            return
+        payload = f.read(length)
+        if zlib.crc32(payload) != checksum:
+            return
+        yield sequence, payload, f.tell()
+
+def _base(path: Path) -> Tuple[Scene, int]:
+    # The scene the journal applies to and the last sequence already folded into it
+    snapshot = snapshot_path(path)
+    if snapshot.exists():
+        arrays, header = read_arrays(snapshot, mode="c")
+        if tuple(header.get("source", ())) == _stamp(path):
+            scene = Scene.from_arrays(
+                arrays, header.get("textures", []), header.get("background"),
+                header.get("background_intensity", 1.0)
+            )
+            return scene, header.get("sequence", 0)
+    if path.exists():
+        return read_scene(path), 0
+    return Scene(), 0
+
+def _apply(scene: Scene, arrays: Dict[str, np.ndarray], header: Dict) -> None:
+    # Writes one record's rows into the scene; rows are never removed, so later records win
+    for name in TABLES:
+        table: ColumnTable = getattr(scene, name)
+        table.grow(header["sizes"][name])
+        rows = arrays.get(f"{name}.rows")
+        if rows is None:
+            continue
+        for column in table.names:
+            table.column(column)[rows] = arrays[f"{name}.{column}"]
+    scene.textures = list(header["textures"])
+    scene.background = header["background"]
+    scene.background_intensity = header["background_intensity"]
+    scene.group_count = max(scene.group_count, header["group_count"])
+    scene.next_id = max(scene.next_id, header["next_id"])
+
+def _replay(path: Path) -> Tuple[Scene, int]:
+    # The base scene with every journalled record after it applied, and the last sequence applied
+    scene, sequence = _base(path)
+    if _journal_stamp(path) != _stamp(path):
+        return scene, sequence
+    with open(journal_path(path), "rb") as f:
+        for record_sequence, payload, _ in _records(f):
+            if record_sequence > sequence:
+                _apply(scene, *load_arrays(payload))
+                sequence = record_sequence
+    return scene, sequence
+
+def recover(path: Union[str, Path]) -> Scene:
+    """
+    Loads a scene with the edits autosaved since it was last written.
+
+    Parameters:
+        path (str | Path): The scene file; it need not exist if the scene was never saved.
+
+    Returns:
+        Scene: The latest snapshot, or the scene file, with the journal replayed onto it.
+        Autosaves made against an older version of the file are ignored.
+    """
+    return _replay(Path(path))[0]
+
+class Autosave:
+    """
+    Journals the edits to a scene in a background thread.
+
+    Call record() after an edit or on a timer: it collects the rows written since
+    the last call, which the thread appends to the journal, and every
+    `compact_records` records or `compact_bytes` of journal the thread folds the
+    journal into a new snapshot.
+    """
+
+    def __init__(self, scene: Scene, path: Union[str, Path], compact_records: int = 256,
+                 compact_bytes: int = 64 << 20,
+                 on_snapshot: Optional[Callable[[Path, int], None]] = None):
+        """
+        Parameters:
+            scene (Scene): The scene being edited, as loaded by recover() or read_scene(),
+                or a new scene if nothing exists at `path` yet.
+            path (str | Path): The scene file the autosave belongs to.
+            compact_records (int): Records after which the journal is compacted.
+            compact_bytes (int): Journal size after which it is compacted.
+            on_snapshot (Optional[Callable[[Path, int], None]]): Called from the
+                background thread with the snapshot path and its sequence after each compaction.
+        """
+        self.scene = scene
+        self.path = Path(path)
+        self.compact_records = compact_records
+        self.compact_bytes = compact_bytes
+        self.on_snapshot = on_snapshot
+        self._queue: "queue.Queue" = queue.Queue()
+        self._last_metadata: Optional[Dict] = None
+        self._journal: Optional[BinaryIO] = None
+        self._sequence = 0
+        self._records = 0
+
+        for name in TABLES:
+            getattr(scene, name).track()
+        if _journal_stamp(self.path) != _stamp(self.path) and not self.path.exists():
+            # Nothing on disk holds this scene yet, so the first record carries all of it
+            for name in TABLES:
+                table = getattr(scene, name)
+                table.mark(range(len(table)))
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _metadata(self) -> Dict:
+        return {
+            **_scene_metadata(self.scene),
+            "textures": list(self.scene.textures),
+            "group_count": self.scene.group_count,
+            "next_id": self.scene.next_id,
+            "sizes": {name: len(getattr(self.scene, name)) for name in TABLES}
+        }
+
+    def record(self) -> bool:
+        """
+        Queues the edits made since the last call for the journal. Only the written
+        rows are copied; the disk write happens in the background thread.
+
+        Returns:
+            bool: Whether there was anything to record.
+        """
+        arrays = {}
+        for name in TABLES:
+            table: ColumnTable = getattr(self.scene, name)
+            rows = table.take_dirty()
+            if not len(rows):
+                continue
+            arrays[f"{name}.rows"] = rows
+            for column in table.names:
+                arrays[f"{name}.{column}"] = table.column(column)[rows]
+
+        metadata = self._metadata()
+        if not arrays and metadata == self._last_metadata:
+            return False
+        self._last_metadata = metadata
+        self._queue.put(("record", arrays, metadata))
+        return True
+
+    def compact(self) -> None:
+        """
+        Asks the background thread to fold the journal into a snapshot now.
+        """
+        self._queue.put(("compact",))
+
+    def close(self) -> None:
+        """
+        Records the last edits, waits for the journal to reach the disk and stops
+        tracking the scene. The journal is left for the next compaction or recover().
+        """
+        self.record()
+        self._queue.put(None)
+        self._thread.join()
+        for name in TABLES:
+            getattr(self.scene, name).track(False)
+
+    def _open(self) -> None:
+        # Continues the journal if it belongs to the current scene file, otherwise starts a new one
+        path = journal_path(self.path)
+        stamp = _stamp(self.path)
+        if _journal_stamp(self.path) != stamp:
+            snapshot_path(self.path).unlink(missing_ok=True)
+            with open(path, "wb") as f:
+                f.write(MAGIC + SOURCE.pack(*stamp))
+            end = len(MAGIC) + SOURCE.size
+        else:
+            _, self._sequence = _base(self.path)
+            end = len(MAGIC) + SOURCE.size
+            with open(path, "rb") as f:
+                for sequence, _, end in _records(f):
+                    self._sequence = max(self._sequence, sequence)
+                    self._records += 1
+
+        self._journal = open(path, "r+b")
+        # Drops a record torn by a crash, so new records are not appended after it
+        self._journal.truncate(end)
+        self._journal.seek(end)
+
+    def _run(self) -> None:
+        self._open()
+        try:
+            while True:
+                task = self._queue.get()
+                if task is None:
+                    return
+                if task[0] == "record":
+                    self._append(*task[1:])
+                    if self._records >= self.compact_records or self._journal.tell() >= self.compact_bytes:
+                        self._compact()
+                else:
+                    self._compact()
+        finally:
+            self._journal.close()
+
+    def _append(self, arrays: Dict[str, np.ndarray], metadata: Dict) -> None:
+        payload = dump_arrays(arrays, **metadata)
+        self._sequence += 1
+        self._journal.write(RECORD.pack(self._sequence, len(payload), zlib.crc32(payload)))
+        self._journal.write(payload)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._records += 1
+
+    def _compact(self) -> None:
+        if not self._records:
+            return
+        scene, sequence = _replay(self.path)
+        snapshot = snapshot_path(self.path)
+        partial = snapshot.with_name(f".{snapshot.name}.{os.getpid()}")
+        write_arrays(partial, scene.arrays(), **_scene_metadata(scene),
+                     source=list(_stamp(self.path)), sequence=sequence)
+        with open(partial, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(partial, snapshot)
+
+        # A crash before the truncation leaves records the snapshot already holds,
+        # which replay skips by sequence
+        self._journal.truncate(len(MAGIC) + SOURCE.size)
+        self._journal.seek(len(MAGIC) + SOURCE.size)
+        self._records = 0
+        if self.on_snapshot is not None:
+            self.on_snapshot(snapshot, sequence)
@@ -0,0 +1,238 @@
+"""
+Resumable renders: progress is checkpointed tile by tile to a memory-mapped file,
+so a render killed by a crash or cancelled by the user continues where it left off.
+
+Renders are seeded, and every sample's random numbers depend only on the seed,
+the pixel and the sample index, so a resumed render produces the same image as
+one that was never interrupted.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Union
+
+import numpy as np
+
+from .framebuffer import Framebuffer
+from .scene import Scene
+from .scene_file import allocate_arrays, read_arrays, scene_to_bytes
+
+VERSION = 1
+
+class Checkpoint:
+    """
+    A render's committed progress on disk: for every tile, its summed colours,
+    per-pixel sample counts and how many samples per pixel it has been given.
+
+    Tiles are stored tile-major with two slots each. A flush writes every dirty
+    tile into its inactive slot and syncs, then flips the tiles' one-byte
+    active-slot markers and syncs again, so a crash at any point leaves each tile
+    at its last committed state. Only dirty tiles are written, which bounds the
+    cost of a flush by the work done since the previous one.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        Opens an existing checkpoint; use create() to start a new one.
+        """
+        self.path = Path(path)
+        arrays, self.header = read_arrays(self.path, mode="r+")
+        if self.header.get("checkpoint") != VERSION:
+            raise ValueError(f"{path} is not a render checkpoint")
+
+        self._color = arrays["color"]
+        self._samples = arrays["samples"]
+        self._progress = arrays["progress"]
+        self._active = arrays["active"]
+        self.width = self.header["width"]
+        self.height = self.header["height"]
+        self.tile_size = self.header["tile_size"]
+        self.tiles = [
+            (x, y, min(x + self.tile_size, self.width), min(y + self.tile_size, self.height))
+            for y in range(0, self.height, self.tile_size)
+            for x in range(0, self.width, self.tile_size)
+        ]
+        self.dirty: Set[int] = set()
+
+    @classmethod
+    def create(cls, path: Union[str, Path], width: int, height: int, tile_size: int = 64, **metadata) -> "Checkpoint":
+        """
+        Creates an empty checkpoint file. The file is sparse until tiles are flushed.
+
+        Parameters:
+            path (str | Path): Checkpoint file.
+            width (int): Image width.
+            height (int): Image height.
+            tile_size (int): Edge length of the tiles progress is tracked for.
+            **metadata: Extra JSON-serialisable header entries, e.g. the camera settings.
+
+        Returns:
+            Checkpoint: The opened checkpoint.
+        """
+        tile_count = -(-width // tile_size) * -(-height // tile_size)
+        allocate_arrays(
+            path,
+            {
+                "color": ((2, tile_count, tile_size, tile_size, 3), np.float64),
+                "samples": ((2, tile_count, tile_size, tile_size), np.uint32),
+                "progress": ((2, tile_count), np.uint32),
+                "active": ((tile_count,), np.uint8),
+            },
+            checkpoint=VERSION, width=width, height=height, tile_size=tile_size, **metadata
+        )
+        return cls(path)
+
+    def progress(self) -> List[int]:
+        """
+        Returns the committed number of samples per pixel of every tile.
+        """
+        tiles = np.arange(len(self.tiles))
+        return self._progress[self._active, tiles].astype(int).tolist()
+
+    def framebuffer(self) -> Framebuffer:
+        """
+        Returns an in-memory framebuffer holding the committed state of every tile.
+        """
+        framebuffer = Framebuffer(self.width, self.height)
+        for tile, (x0, y0, x1, y1) in enumerate(self.tiles):
+            slot = self._active[tile]
+            framebuffer.color[y0:y1, x0:x1] = self._color[slot, tile, :y1 - y0, :x1 - x0]
+            framebuffer.samples[y0:y1, x0:x1] = self._samples[slot, tile, :y1 - y0, :x1 - x0]
+        return framebuffer
+
+    def mark(self, tile: int) -> None:
+        """
+        Records that a tile has changed since the last flush.
+        """
+        self.dirty.add(tile)
+
+    def flush(self, framebuffer: Framebuffer, progress: List[int]) -> int:
+        """
+        Commits the dirty tiles of `framebuffer` along with their progress.
+
+        Returns:
+            int: The number of tiles written.
+        """
+        if not self.dirty:
+            return 0
+        tiles = sorted(self.dirty)
+        for tile in tiles:
+            x0, y0, x1, y1 = self.tiles[tile]
+            slot = 1 - self._active[tile]
+            self._color[slot, tile, :y1 - y0, :x1 - x0] = framebuffer.color[y0:y1, x0:x1]
+            self._samples[slot, tile, :y1 - y0, :x1 - x0] = framebuffer.samples[y0:y1, x0:x1]
+            self._progress[slot, tile] = progress[tile]
+        # The new slots must be on disk before anything points at them
+        self._color.flush()
+        self._samples.flush()
+        self._progress.flush()
+
+        for tile in tiles:
+            self._active[tile] = 1 - self._active[tile]
+        self._active.flush()
+        self.dirty.clear()
+        return len(tiles)
+
+def scene_fingerprint(scene: Scene) -> str:
+    return hashlib.sha256(scene_to_bytes(scene)).hexdigest()
+
+def _normalised(camera: Dict) -> Dict:
+    # Camera settings as they round-trip through the JSON header, without the seed
+    return {key: value for key, value in json.loads(json.dumps(camera)).items() if key != "seed"}
+
+def render_resumable(
+    scene: Scene,
+    camera: Dict,
+    path: Union[str, Path],
+    tile_size: int = 64,
+    batch: int = 16,
+    interval: float = 30.0,
+    world=None,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Framebuffer:
+    """
+    Renders with periodic checkpoints, resuming from `path` if it already holds a
+    checkpoint of the same scene and camera.
+
+    Every tile gets `batch` more samples per pixel before any tile gets more, so a
+    cancelled render is evenly converged. Adaptive cameras render each tile in one
+    pass, so their checkpoints advance a whole tile at a time.
+
+    Parameters:
+        scene (Scene): The scene to render.
+        camera (Dict): _core.Camera keyword arguments, e.g. from render.camera_settings().
+            A random seed is chosen (and stored in the checkpoint) if none is given.
+        path (str | Path): Checkpoint file to resume from and write to.
+        tile_size (int): Edge length of the checkpointed tiles, for new checkpoints.
+        batch (int): Samples per pixel rendered per tile between progress updates.
+        interval (float): Seconds between checkpoint flushes.
+        world (Optional[_core.World]): A world already built from the scene, to skip rebuilding it.
+        cancel (Optional[threading.Event]): Set to stop early; progress so far is flushed first.
+        progress (Optional[Callable[[int, int], None]]): Called after every tile batch with
+            (done, total), counting samples per pixel summed over tiles.
+
+    Returns:
+        Framebuffer: The render so far; complete unless it was cancelled.
+
+    Raises:
+        ValueError: If `path` is a checkpoint of a different scene or camera.
+    """
+    from . import _core
+    from .render import build_world
+
+    fingerprint = scene_fingerprint(scene)
+    settings = dict(camera)
+    if Path(path).exists():
+        checkpoint = Checkpoint(path)
+        stored = checkpoint.header["camera"]
+        if (checkpoint.header["scene"] != fingerprint or _normalised(stored) != _normalised(settings)
+                or settings.get("seed") not in (None, stored["seed"])):
+            raise ValueError(f"{path} is a checkpoint of a different scene or camera")
+        settings = stored
+    else:
+        if settings.get("seed") is None:
+            settings["seed"] = random.getrandbits(63)
+        size = _core.Camera(**settings)
+        checkpoint = Checkpoint.create(path, size.image_width, size.image_height, tile_size,
+                                       camera=settings, scene=fingerprint)
+
+    render_camera = _core.Camera(**settings)
+    if world is None:
+        world = build_world(scene)
+    framebuffer = checkpoint.framebuffer()
+    done = checkpoint.progress()
+    target = render_camera.samples_per_pixel
+    step = target if render_camera.adaptive else max(batch, 1)
+    total = target * len(done)
+    last_flush = time.monotonic()
+
+    while min(done) < target:
+        for tile, (x0, y0, x1, y1) in enumerate(checkpoint.tiles):
+            if done[tile] >= target:
+                continue
+            if cancel is not None and cancel.is_set():
+                checkpoint.flush(framebuffer, done)
+                return framebuffer
+
+            count = min(step, target - done[tile])
+            color = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float64)
+            samples = np.empty((y1 - y0, x1 - x0), dtype=np.uint32)
+            _core.render_tile(world, render_camera, (x0, y0, x1, y1), color, samples,
+                              first_sample=done[tile], samples=count)
+            framebuffer.color[y0:y1, x0:x1] += color
+            framebuffer.samples[y0:y1, x0:x1] += samples
+            done[tile] += count
+            checkpoint.mark(tile)
+
+            if time.monotonic() - last_flush >= interval:
+                checkpoint.flush(framebuffer, done)
+                last_flush = time.monotonic()
+            if progress is not None:
+                progress(sum(done), total)
+
+    checkpoint.flush(framebuffer, done)
+    return framebuffer
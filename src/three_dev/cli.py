@@ -0,0 +1,460 @@
+"""
+The `three-dev` command (also `python -m three_dev`): renders saved scenes
+without the app, e.g. on a server or from a script.
+
+    three-dev render scene.3dv -o frame.png --user alice
+    three-dev render scene.3dv -o frame.png --width 1920 --spp 256 --local 8
+    three-dev render scene.3dv -o frame.png --serve 0.0.0.0:7878
+    three-dev render scene.3dv -o frame.npz --checkpoint frame.ckpt
+    three-dev sweep scene.3dv -o sheet.png --vary aperture=0.1,0.5,1 --vary spp=16,64
+    three-dev sequence scene.3dv -o frames/orbit_###.png --turntable 120
+    three-dev sequence scene.3dv -o frames/move_###.png --keyframes move.json --workers 4
+
+Camera settings start from the app's defaults, then the named user's saved
+render preferences, then any flags. With --user, renders with --stats are added
+to that user's render history along with the preferences they used. The renderer renders in this process unless
+the job is handed to local farm workers (--local), served to remote workers
+(--serve) or checkpointed so it can resume (--checkpoint).
+
+Nothing here imports Tk or PIL, and the renderer, the farm and the database are
+only imported by the commands that use them. --timings reports how long after
+the process started the render began; benchmarks/cli_startup.py keeps that in check.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from .tonemap import CLAMP, OPERATORS
+
+if TYPE_CHECKING:
+    from .stats import RenderStats
+
+# Used when neither the user's preferences nor a flag sets them; the same as the app's render view
+DEFAULT_PREFERENCES = {
+    "image_width": 800,
+    "aspect_ratio": 1.778,
+    "focus_distance": 10.0,
+    "aperture": 0.1,
+    "max_depth": 50,
+    "samples_per_pixel": 100,
+    "adaptive_sampling": 0,
+    "noise_threshold": 0.01,
+    "min_samples": 16,
+    "max_samples": 1024
+}
+
+# The camera used by src/main.rs and the app's render view
+LOOK_FROM = (13.0, 2.0, 3.0)
+LOOK_AT = (0.0, 0.0, 0.0)
+
+# The app's Python source in a checkout, whose DataManager writes the render history
+APP = Path(__file__).resolve().parents[2] / "python"
+# The app's database in a source checkout; THREE_DEV_DB points elsewhere
+DATABASE = APP / "data" / "3Dev.db"
+
+# Flags that override render_preferences columns, by argparse destination
+PREFERENCE_FLAGS = {
+    "width": "image_width",
+    "aspect": "aspect_ratio",
+    "spp": "samples_per_pixel",
+    "max_depth": "max_depth",
+    "focus_distance": "focus_distance",
+    "aperture": "aperture",
+    "adaptive": "adaptive_sampling",
+    "noise_threshold": "noise_threshold",
+    "min_samples": "min_samples",
+    "max_samples": "max_samples"
+}
+
+OUTPUT_FORMATS = (".png", ".ppm", ".npz")
+
+def _vector(text: str) -> List[float]:
+    values = [float(value) for value in text.split(",")]
+    if len(values) != 3:
+        raise argparse.ArgumentTypeError(f"expected x,y,z, got {text!r}")
+    return values
+
+def _address(text: str):
+    host, _, port = text.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected host:port, got {text!r}")
+    return host, int(port)
+
+def _process_age() -> Optional[float]:
+    # Seconds since this process started, from /proc on Linux; None elsewhere
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, AttributeError, ValueError, IndexError):
+        return None
+
+def user_preferences(username: str, database: Path) -> Optional[Dict]:
+    """
+    Reads a user's saved render preferences, as DataManager.get_user_section(username, "render")
+    would, over a read-only connection so a running app is never held up.
+
+    Parameters:
+        username (str): The user whose preferences to read.
+        database (Path): The app's database file.
+
+    Returns:
+        Optional[Dict]: The render_preferences row, or None if there is no such user.
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(database.resolve().as_uri() + "?mode=ro", uri=True, timeout=5.0)
+    try:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            """
+            SELECT rp.*
+            FROM render_preferences rp
+            JOIN users u ON u.user_id = rp.user_id
+            WHERE u.username = ?
+            """,
+            (username,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+def resolve_preferences(args: argparse.Namespace, parser: argparse.ArgumentParser) -> Dict:
+    """
+    Layers the defaults, the user's saved preferences and the flags into one render_preferences row.
+    """
+    preferences = dict(DEFAULT_PREFERENCES)
+    if args.user is not None:
+        database = Path(args.database)
+        if not database.exists():
+            parser.error(f"no database at {database}; pass --database or set THREE_DEV_DB")
+        row = user_preferences(args.user, database)
+        if row is None:
+            parser.error(f"no user named {args.user!r} in {database}")
+        preferences.update({column: value for column, value in row.items() if value is not None})
+    for flag, column in PREFERENCE_FLAGS.items():
+        value = getattr(args, flag)
+        if value is not None:
+            preferences[column] = value
+    return preferences
+
+def record_renders(database: Path, renders: List[Tuple[Dict, Dict]]) -> None:
+    """
+    Adds renders to their users' render history through a writable DataManager, as the app does.
+
+    Parameters:
+        database (Path): The app's database file.
+        renders (List[Tuple[Dict, Dict]]): (preferences, stats) of each render: the resolved
+            render_preferences row, which names the user_id, and RenderStats.to_dict().
+    """
+    if str(APP) not in sys.path:
+        sys.path.append(str(APP))
+    try:
+        from data_management.data_manager import DataManager
+    except ImportError:
+        print(f"Render history not recorded: the app's data_management is not in {APP}", file=sys.stderr)
+        return
+
+    manager = DataManager(str(database))
+    for preferences, stats in renders:
+        manager.add_render_history(preferences["user_id"], preferences, stats)
+
+def _record(args: argparse.Namespace, renders: List[Tuple[Dict, Optional["RenderStats"]]]) -> None:
+    # Only renders with stats for a named user are recorded
+    renders = [(preferences, stats.to_dict()) for preferences, stats in renders if stats is not None]
+    if args.user is not None and renders:
+        record_renders(Path(args.database), renders)
+
+def _load(args: argparse.Namespace, preferences: Dict):
+    # The scene and the camera settings every rendering command starts from
+    from .render import camera_settings
+    from .scene_file import read_scene
+
+    try:
+        scene = read_scene(args.scene)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Could not read scene: {e}")
+    camera = camera_settings(preferences, args.look_from, args.look_at, args.up)
+    if args.seed is not None:
+        camera["seed"] = args.seed
+    return scene, camera
+
+def _progress(done: int, total: int) -> None:
+    print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+def render_command(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    output = Path(args.output)
+    if output.suffix.lower() not in OUTPUT_FORMATS:
+        parser.error(f"output must end in {', '.join(OUTPUT_FORMATS)}")
+    preferences = resolve_preferences(args, parser)
+    if args.packets and (args.stats or preferences["adaptive_sampling"]
+                         or any(job is not None for job in (args.local, args.serve, args.checkpoint))):
+        parser.error("--packets renders in this process, without --stats or adaptive sampling")
+
+    from . import _core
+
+    scene, camera = _load(args, preferences)
+    size = _core.Camera(**camera)
+
+    if args.timings:
+        age = _process_age()
+        if age is not None:
+            print(f"Rendering {age * 1000:.0f} ms after start", file=sys.stderr)
+    if args.dry_run:
+        print(json.dumps({"camera": camera, "width": size.image_width, "height": size.image_height}))
+        return
+
+    started = time.perf_counter()
+    if args.local is not None or args.serve is not None:
+        from .farm import Coordinator, spawn_workers
+
+        host, port = args.serve if args.serve is not None else ("127.0.0.1", 0)
+        farm = Coordinator(scene, camera, tile_size=args.tile_size, host=host, port=port, stats=args.stats)
+        print(f"Serving {len(farm.tiles)} tiles on {farm.address[0]}:{farm.address[1]}", file=sys.stderr)
+        processes = spawn_workers(("127.0.0.1", farm.address[1]), args.local) if args.local else []
+        try:
+            framebuffer = farm.render(progress=_progress)
+        finally:
+            farm.close()
+            for process in processes:
+                process.wait()
+        print(file=sys.stderr)
+    elif args.checkpoint is not None:
+        from .checkpoint import render_resumable
+
+        framebuffer = render_resumable(scene, camera, args.checkpoint, tile_size=args.tile_size, progress=_progress)
+        print(file=sys.stderr)
+    else:
+        from .render import render
+
+        framebuffer = render(scene, size, stats=args.stats, packets=args.packets)
+
+    if output.suffix.lower() == ".npz":
+        import numpy as np
+
+        np.savez(output, color=framebuffer.color, samples=framebuffer.samples)
+    else:
+        from .image import write_image
+        from .tonemap import Tonemap
+
+        write_image(output, framebuffer.to_rgb8(tonemap=Tonemap(exposure=args.exposure, operator=args.operator)))
+    print(f"Rendered {size.image_width}x{size.image_height} to {output} in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    if framebuffer.stats is not None:
+        print(framebuffer.stats.summary(), file=sys.stderr)
+    _record(args, [(preferences, framebuffer.stats)])
+
+def _variation(text: str):
+    name, _, values = text.partition("=")
+    if not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=V1,V2,..., got {text!r}")
+    return name.strip().replace("-", "_"), [value.strip() for value in values.split(",")]
+
+def sweep_command(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    output = Path(args.output)
+    if output.suffix.lower() not in OUTPUT_FORMATS[:2]:
+        parser.error(f"the contact sheet must end in {' or '.join(OUTPUT_FORMATS[:2])}")
+    preferences = resolve_preferences(args, parser)
+
+    from .image import write_image
+    from .render import build_world, camera_settings
+    from .sweep import SWEEPABLE, contact_sheet, render_sweep
+    from .tonemap import Tonemap
+
+    # Swept values are converted like saved preferences, so e.g. --vary aspect=16:9,4:3 works
+    camera_keys = set(camera_settings(DEFAULT_PREFERENCES, LOOK_FROM, LOOK_AT))
+    parameters = {}
+    for name, values in args.vary:
+        column = PREFERENCE_FLAGS.get(name, name)
+        if column not in camera_keys:
+            parser.error(f"cannot sweep {name!r}; try {', '.join(SWEEPABLE)}")
+        try:
+            parameters[column] = [
+                camera_settings({**preferences, column: value}, args.look_from, args.look_at, args.up)[column]
+                for value in values
+            ]
+        except ValueError:
+            parser.error(f"invalid values for {name}: {', '.join(values)}")
+
+    scene, camera = _load(args, preferences)
+    started = time.perf_counter()
+    world = build_world(scene)
+    built = time.perf_counter() - started
+    results = render_sweep(scene, camera, parameters, workers=args.workers, tile_size=args.tile_size,
+                           world=world, stats=args.stats, progress=_progress)
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+
+    tonemap = Tonemap(exposure=args.exposure, operator=args.operator)
+    write_image(output, contact_sheet(results, columns=args.columns, tonemap=tonemap))
+    print(f"{len(results)} combinations in {elapsed:.1f}s, world built once in {built:.2f}s; "
+          f"contact sheet written to {output}")
+    for index, result in enumerate(results):
+        settings = ", ".join(f"{name}={value}" for name, value in result.settings.items())
+        print(f"{index:4d}  {settings:<48} {result.seconds:8.2f}s")
+    _record(args, [({**preferences, **result.settings}, result.framebuffer.stats) for result in results])
+
+    if args.report is not None:
+        report = [
+            {
+                "settings": result.settings,
+                "camera": result.camera,
+                "width": result.framebuffer.width,
+                "height": result.framebuffer.height,
+                "seconds": result.seconds,
+                "stats": result.framebuffer.stats.to_dict() if result.framebuffer.stats is not None else None
+            }
+            for result in results
+        ]
+        Path(args.report).write_text(json.dumps(report, indent=2))
+
+def sequence_command(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    from .image import FORMATS
+    from .sequence import frame_path, keyframes, render_sequence, turntable
+    from .tonemap import Tonemap
+
+    if Path(args.output).suffix.lower() not in FORMATS:
+        parser.error(f"frames must end in {' or '.join(FORMATS)}")
+    preferences = resolve_preferences(args, parser)
+    if args.turntable is not None:
+        if args.turntable < 1:
+            parser.error("--turntable needs at least one frame")
+        path = turntable(args.look_from, args.look_at, args.turntable, degrees=args.degrees, up=args.up)
+    else:
+        try:
+            path = keyframes(json.loads(Path(args.keyframes).read_text()), frames=args.frames)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            sys.exit(f"Could not read keyframes: {e}")
+
+    # Load here only to report an unreadable scene; the workers map the file themselves
+    _, camera = _load(args, preferences)
+    started = time.perf_counter()
+    results = render_sequence(args.scene, camera, path, args.output, workers=args.workers,
+                              tonemap=Tonemap(exposure=args.exposure, operator=args.operator),
+                              stats=args.stats, skip_existing=args.skip_existing, progress=_progress)
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+
+    rendered = [result for result in results if result.reused_from is None and not result.skipped]
+    print(f"{len(rendered)} of {len(results)} frames rendered in {elapsed:.1f}s "
+          f"to {frame_path(args.output, 0).parent}")
+    for result in results:
+        if result.skipped:
+            note = "exists, skipped"
+        elif result.reused_from is not None:
+            note = f"same camera as frame {result.reused_from}, copied"
+        else:
+            note = f"{result.seconds:8.2f}s"
+            if result.stats is not None:
+                note += f"  {result.stats.summary()}"
+        print(f"{result.frame:4d}  {result.path.name:<24} {note}")
+    _record(args, [({**preferences, **path[result.frame]}, result.stats) for result in rendered])
+
+    if args.report is not None:
+        report = [
+            {
+                "frame": result.frame,
+                "path": str(result.path),
+                "camera": result.camera,
+                "seconds": result.seconds,
+                "reused_from": result.reused_from,
+                "skipped": result.skipped,
+                "stats": result.stats.to_dict() if result.stats is not None else None
+            }
+            for result in results
+        ]
+        Path(args.report).write_text(json.dumps(report, indent=2))
+
+def _add_camera_arguments(command: argparse.ArgumentParser) -> None:
+    # Camera and image flags shared by the commands that render
+    settings = command.add_argument_group("camera settings", "override the defaults and the user's preferences")
+    settings.add_argument("--user", help="start from this user's saved render preferences")
+    settings.add_argument("--database", default=os.environ.get("THREE_DEV_DB", str(DATABASE)),
+                          help="the app's database, for --user (default: %(default)s)")
+    settings.add_argument("--width", type=int, help="image width in pixels")
+    settings.add_argument("--aspect", help="aspect ratio, e.g. 16:9 or 1.5")
+    settings.add_argument("--spp", type=int, help="samples per pixel")
+    settings.add_argument("--max-depth", type=int)
+    settings.add_argument("--focus-distance", type=float)
+    settings.add_argument("--aperture", type=float)
+    settings.add_argument("--adaptive", action=argparse.BooleanOptionalAction, help="adaptive sampling")
+    settings.add_argument("--noise-threshold", type=float)
+    settings.add_argument("--min-samples", type=int)
+    settings.add_argument("--max-samples", type=int)
+    settings.add_argument("--look-from", type=_vector, default=list(LOOK_FROM), metavar="X,Y,Z")
+    settings.add_argument("--look-at", type=_vector, default=list(LOOK_AT), metavar="X,Y,Z")
+    settings.add_argument("--up", type=_vector, default=[0.0, 1.0, 0.0], metavar="X,Y,Z")
+    settings.add_argument("--seed", type=int, help="fix the random seed, for repeatable images")
+
+    image = command.add_argument_group("image")
+    image.add_argument("--exposure", type=float, default=0.0, help="in stops")
+    image.add_argument("--operator", default=CLAMP, choices=OPERATORS)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="three-dev", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="render a scene file to an image")
+    render.set_defaults(run=render_command)
+    render.add_argument("scene", help="scene file written by three_dev.write_scene")
+    render.add_argument("-o", "--output", required=True,
+                        help=f"image ({', '.join(OUTPUT_FORMATS[:2])}) or .npz of summed colours and sample counts")
+    _add_camera_arguments(render)
+
+    job = render.add_argument_group("job").add_mutually_exclusive_group()
+    job.add_argument("--local", type=int, metavar="N", help="render on N local farm worker processes")
+    job.add_argument("--serve", type=_address, metavar="HOST:PORT",
+                     help="serve the job to farm workers (python -m three_dev.farm worker HOST:PORT)")
+    job.add_argument("--checkpoint", metavar="PATH", help="checkpoint to PATH, resuming from it if it exists")
+    render.add_argument("--tile-size", type=int, default=64, help="tile size for --local, --serve and --checkpoint")
+    render.add_argument("--stats", action="store_true", help="collect and print render statistics")
+    render.add_argument("--packets", action="store_true",
+                        help="trace camera rays in float32 packets; faster, not with --stats or adaptive sampling")
+    render.add_argument("--timings", action="store_true", help="report the time taken to start rendering")
+    render.add_argument("--dry-run", action="store_true",
+                        help="print the camera settings instead of rendering")
+
+    sweep = commands.add_parser("sweep", help="render a scene at every combination of some camera settings")
+    sweep.set_defaults(run=sweep_command)
+    sweep.add_argument("scene", help="scene file written by three_dev.write_scene")
+    sweep.add_argument("-o", "--output", required=True, help="contact sheet (.png or .ppm)")
+    sweep.add_argument("--vary", type=_variation, action="append", required=True, metavar="NAME=V1,V2,...",
+                       help="values to try for a camera setting, e.g. aperture=0.1,0.5; repeat to sweep several")
+    _add_camera_arguments(sweep)
+    sweep.add_argument("--columns", type=int, help="contact sheet cells per row (default: one row per "
+                                                   "combination of all but the last --vary)")
+    sweep.add_argument("--workers", type=int, help="tracing threads (default: one per CPU)")
+    sweep.add_argument("--tile-size", type=int, default=32)
+    sweep.add_argument("--stats", action="store_true", help="collect render statistics for the report")
+    sweep.add_argument("--report", metavar="PATH", help="write settings, timing and stats per combination as JSON")
+
+    sequence = commands.add_parser("sequence", help="render numbered frames along a camera path")
+    sequence.set_defaults(run=sequence_command)
+    sequence.add_argument("scene", help="scene file written by three_dev.write_scene")
+    sequence.add_argument("-o", "--output", required=True,
+                          help="frame pattern (.png or .ppm); a run of # is replaced by the frame number")
+    camera_path = sequence.add_argument_group("camera path").add_mutually_exclusive_group(required=True)
+    camera_path.add_argument("--turntable", type=int, metavar="FRAMES",
+                             help="orbit --look-from around --look-at about --up")
+    camera_path.add_argument("--keyframes", metavar="PATH",
+                             help='JSON list of keys, e.g. [{"frame": 0, "look_from": [13, 2, 3]}, ...], '
+                                  "with camera settings to interpolate between them")
+    sequence.add_argument("--degrees", type=float, default=360.0, help="how far --turntable turns")
+    sequence.add_argument("--frames", type=int, help="sequence length for --keyframes (default: to the last key)")
+    _add_camera_arguments(sequence)
+    sequence.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    sequence.add_argument("--skip-existing", action="store_true", help="keep frames already written, to resume")
+    sequence.add_argument("--stats", action="store_true", help="collect and print render statistics per frame")
+    sequence.add_argument("--report", metavar="PATH", help="write camera, timing and stats per frame as JSON")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.run(args, parser)
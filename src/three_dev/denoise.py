@@ -0,0 +1,132 @@
+import numpy as np
+from typing import Optional
+
+from .framebuffer import Framebuffer
+
+# 1D B3-spline taps; the 5x5 kernel is their outer product
+KERNEL = np.array([1 / 16, 1 / 4, 3 / 8, 1 / 4, 1 / 16], dtype=np.float32)
+
+def _atrous_pass(color: np.ndarray, guide: np.ndarray, step: int) -> np.ndarray:
+    """
+    One edge-avoiding à-trous iteration over a whole tile, with taps `step` pixels apart.
+
+    `guide` stacks the pre-scaled colour, normal and albedo channels, so a tap's
+    edge-stopping weight is exp(-|guide_q - guide_p|^2). Each tap is a shifted view
+    of the padded tile, so the work is 25 array operations rather than a per-pixel loop.
+    """
+    height, width = color.shape[:2]
+    pad = 2 * step
+    color_padded = np.pad(color, ((pad, pad), (pad, pad), (0, 0)), mode="edge")
+    guide_padded = np.pad(guide, ((pad, pad), (pad, pad), (0, 0)), mode="edge")
+
+    total = np.zeros_like(color)
+    weight_sum = np.zeros((height, width), dtype=color.dtype)
+    difference = np.empty_like(guide)
+    weight = np.empty((height, width), dtype=color.dtype)
+
+    for ky, wy in enumerate(KERNEL):
+        y0 = pad + (ky - 2) * step
+        for kx, wx in enumerate(KERNEL):
+            x0 = pad + (kx - 2) * step
+            window = (slice(y0, y0 + height), slice(x0, x0 + width))
+
+            np.subtract(guide_padded[window], guide, out=difference)
+            np.einsum("ijk,ijk->ij", difference, difference, out=weight)
+            np.negative(weight, out=weight)
+            np.exp(weight, out=weight)
+            weight *= wy * wx
+
+            total += color_padded[window] * weight[..., None]
+            weight_sum += weight
+
+    total /= weight_sum[..., None]
+    return total
+
+def _filter(color, albedo, normal, iterations, sigma_color, sigma_normal, sigma_albedo) -> np.ndarray:
+    height, width = color.shape[:2]
+    guide = np.empty((height, width, 9), dtype=np.float32)
+    guide[..., 3:6] = normal / sigma_normal
+    guide[..., 6:9] = albedo / sigma_albedo
+
+    for i in range(iterations):
+        # Each pass doubles the tap spacing and tightens the colour edge-stopping
+        guide[..., 0:3] = color / (sigma_color * 2.0 ** -i)
+        color = _atrous_pass(color, guide, step=2 ** i)
+    return color
+
+def halo(iterations: int) -> int:
+    """
+    Returns how far (in pixels) the filter reaches, i.e. the border a tile needs to be filtered exactly.
+    """
+    return 2 * (2 ** iterations - 1)
+
+def denoise(
+    color: np.ndarray,
+    albedo: np.ndarray,
+    normal: np.ndarray,
+    iterations: int = 4,
+    sigma_color: float = 1.0,
+    sigma_normal: float = 0.3,
+    sigma_albedo: float = 0.1,
+    tile_size: int = 256,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Denoises a linear HDR image with an edge-avoiding à-trous wavelet filter
+    guided by first-hit albedo and normal buffers.
+
+    The colour is divided by the albedo before filtering and multiplied back
+    afterwards, so texture detail is kept while lighting noise is smoothed.
+    The image is processed in tiles (each with a halo wide enough to make the
+    result identical to filtering the whole frame), bounding peak memory to a
+    few tile-sized float32 temporaries regardless of resolution.
+
+    Parameters:
+        color (np.ndarray): (height, width, 3) averaged HDR colour, e.g. Framebuffer.mean().
+        albedo (np.ndarray): (height, width, 3) first-hit albedo.
+        normal (np.ndarray): (height, width, 3) first-hit normals.
+        iterations (int): Number of à-trous passes; the filter reaches halo(iterations) pixels.
+        sigma_color (float): Colour edge-stopping width for the first pass, halved every pass.
+        sigma_normal (float): Normal edge-stopping width.
+        sigma_albedo (float): Albedo edge-stopping width.
+        tile_size (int): Edge length of the tiles processed at once.
+        out (Optional[np.ndarray]): Array to write the result into; allocated if omitted.
+
+    Returns:
+        np.ndarray: The denoised (height, width, 3) image.
+    """
+    height, width = color.shape[:2]
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.float32)
+    border = halo(iterations)
+
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            # Tile plus halo, clipped to the frame
+            y0, y1 = max(y - border, 0), min(y + tile_size + border, height)
+            x0, x1 = max(x - border, 0), min(x + tile_size + border, width)
+            window = (slice(y0, y1), slice(x0, x1))
+
+            tile_albedo = albedo[window].astype(np.float32)
+            demodulate = np.maximum(tile_albedo, 1e-3)
+            irradiance = color[window].astype(np.float32) / demodulate
+            filtered = _filter(
+                irradiance,
+                tile_albedo,
+                normal[window].astype(np.float32),
+                iterations, sigma_color, sigma_normal, sigma_albedo
+            ) * demodulate
+
+            inner = (slice(y - y0, y - y0 + min(tile_size, height - y)),
+                     slice(x - x0, x - x0 + min(tile_size, width - x)))
+            out[y:y + tile_size, x:x + tile_size] = filtered[inner]
+
+    return out
+
+def denoise_framebuffer(framebuffer: Framebuffer, **options) -> np.ndarray:
+    """
+    Denoises a framebuffer rendered with aux=True. Keyword options are passed to denoise().
+    """
+    if framebuffer.albedo is None:
+        raise ValueError("the framebuffer has no albedo/normal buffers; render with aux=True")
+    return denoise(framebuffer.mean(), framebuffer.albedo, framebuffer.normal, **options)
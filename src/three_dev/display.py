@@ -0,0 +1,124 @@
+"""
+An 8-bit display image shared between a renderer and the UI.
+
+The renderer tonemaps each finished tile straight into a shared-memory buffer and
+flags the tile as dirty; the UI wraps the same memory in a PIL image and redraws
+only the flagged tiles. Nothing is written to disk and no full frame is copied
+per refresh. The buffer lives in multiprocessing.shared_memory, so a renderer in
+a worker process attaches to it by name.
+"""
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .framebuffer import Framebuffer
+from .tonemap import Tonemap
+
+Region = Tuple[int, int, int, int]
+
+class DisplayBuffer:
+    """
+    A (height, width, 4) uint8 RGBA image followed by one dirty flag per tile.
+
+    Pixels are stored as RGBA rather than RGB because PIL only maps 4-byte modes
+    onto a buffer without copying. A writer fills a tile's pixels before setting
+    its flag, and a reader clears flags before reading pixels, so a tile written
+    during a redraw is flagged again rather than lost.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        tile_size: int = 64,
+        name: Optional[str] = None,
+        tonemap: Optional[Tonemap] = None
+    ) -> None:
+        """
+        Parameters:
+            width (int): Image width.
+            height (int): Image height.
+            tile_size (int): Edge length of the tiles dirtiness is tracked for.
+            name (Optional[str]): Attach to the existing buffer of this name instead of creating one.
+            tonemap (Optional[Tonemap]): Display settings used by update(); defaults to save_ppm's curve.
+        """
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tonemap = tonemap or Tonemap()
+        self.columns = -(-width // tile_size)
+        self.rows = -(-height // tile_size)
+
+        pixel_bytes = width * height * 4
+        size = pixel_bytes + self.columns * self.rows
+        self.owner = name is None
+        # Only the creator tracks the block, so an attached process exiting does not unlink it
+        self._memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size, track=self.owner)
+
+        self.pixels = np.ndarray((height, width, 4), dtype=np.uint8, buffer=self._memory.buf)
+        self._dirty = np.ndarray((self.rows, self.columns), dtype=np.uint8,
+                                 buffer=self._memory.buf, offset=pixel_bytes)
+        if self.owner:
+            self.pixels[...] = 0
+            self.pixels[..., 3] = 255
+            self._dirty[...] = 0
+
+    @property
+    def name(self) -> str:
+        """
+        The shared-memory name another process passes to DisplayBuffer(..., name=name).
+        """
+        return self._memory.name
+
+    def update(self, framebuffer: Framebuffer, region: Optional[Region] = None) -> None:
+        """
+        Tonemaps a region of a framebuffer (all of it by default) into the display
+        and marks the tiles it touches as dirty. Calling it for the whole frame after
+        changing self.tonemap re-displays a render without re-tracing it.
+        """
+        x0, y0, x1, y1 = region if region is not None else (0, 0, self.width, self.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        framebuffer.to_rgb8((x0, y0, x1, y1), self.tonemap, out=self.pixels[y0:y1, x0:x1, :3])
+        self.mark((x0, y0, x1, y1))
+
+    def mark(self, region: Optional[Region] = None) -> None:
+        """
+        Marks the tiles overlapping a region (all of them by default) as dirty, e.g.
+        when the UI needs a full redraw after resizing.
+        """
+        x0, y0, x1, y1 = region if region is not None else (0, 0, self.width, self.height)
+        size = self.tile_size
+        self._dirty[y0 // size:-(-y1 // size), x0 // size:-(-x1 // size)] = 1
+
+    def take_dirty(self) -> List[Region]:
+        """
+        Returns the (x0, y0, x1, y1) rectangles of the dirty tiles and clears their flags.
+        """
+        rows, columns = np.nonzero(self._dirty)
+        self._dirty[rows, columns] = 0
+        size = self.tile_size
+        return [
+            (x * size, y * size, min((x + 1) * size, self.width), min((y + 1) * size, self.height))
+            for y, x in zip(rows.tolist(), columns.tolist())
+        ]
+
+    def image(self):
+        """
+        Returns a PIL RGBA image backed by the shared buffer itself; it changes as tiles are written.
+        """
+        from PIL import Image
+
+        return Image.frombuffer("RGBA", (self.width, self.height), self._memory.buf, "raw", "RGBA", 0, 1)
+
+    def close(self) -> None:
+        """
+        Detaches from the buffer, and frees it if this side created it. Images from
+        image() must be released first.
+        """
+        # The numpy views hold exports of the buffer, which must go before it can close
+        self.pixels = self._dirty = None
+        self._memory.close()
+        if self.owner:
+            self._memory.unlink()
@@ -0,0 +1,497 @@
+"""
+Tile render farm: a coordinator splits one camera's image into tiles and hands
+them to worker processes over TCP, merging the results into a single framebuffer.
+
+Workers connect to the coordinator, receive the scene (in the scene file format)
+and camera settings once, then pull tiles. Each worker keeps up to `prefetch`
+tiles queued; when the queue of unassigned tiles runs dry, idle workers steal
+queued tiles from the busiest worker. A worker that disconnects or stops sending
+heartbeats has its tiles re-queued. The first result for a tile wins.
+
+Run a coordinator and workers on different machines (textures are loaded by path,
+so they must exist on every worker):
+
+    python -m three_dev.farm coordinator scene.3dscn --camera camera.json --port 7878 --output frame.npz
+    python -m three_dev.farm worker coordinator-host:7878
+
+or everything on this machine with N worker processes:
+
+    python -m three_dev.farm coordinator scene.3dscn --camera camera.json --local 8 --output frame.npz
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .framebuffer import Framebuffer
+from .scene import Scene
+from .scene_file import read_scene, scene_from_bytes, scene_to_bytes
+from .stats import RenderStats
+
+# Every message is: u32 header length | u32 payload length | JSON header | payload.
+# header["type"] is one of
+#   worker -> coordinator: "hello", "heartbeat", "result" (payload: tile colours then sample counts)
+#   coordinator -> worker: "job" (payload: the scene), "tile", "cancel", "shutdown"
+PREFIX = struct.Struct("!II")
+
+TileBounds = Tuple[int, int, int, int]
+
+def send_message(sock: socket.socket, header: Dict, payload=b"") -> None:
+    encoded = json.dumps(header).encode()
+    payload = memoryview(payload).cast("B")
+    sock.sendall(PREFIX.pack(len(encoded), payload.nbytes) + encoded)
+    if payload.nbytes:
+        sock.sendall(payload)
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytearray]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            return None
+        received += count
+    return buffer
+
+def recv_message(sock: socket.socket) -> Optional[Tuple[Dict, bytearray]]:
+    """
+    Reads one message; returns None once the peer has closed the connection.
+    """
+    prefix = _recv_exact(sock, PREFIX.size)
+    if prefix is None:
+        return None
+    header_length, payload_length = PREFIX.unpack(prefix)
+    header = _recv_exact(sock, header_length)
+    payload = _recv_exact(sock, payload_length)
+    if header is None or payload is None:
+        return None
+    return json.loads(header), payload
+
+def split_tiles(width: int, height: int, tile_size: int) -> List[TileBounds]:
+    """
+    Returns (x0, y0, x1, y1) tiles covering the image, row-major from the top-left.
+    """
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in range(0, height, tile_size)
+        for x in range(0, width, tile_size)
+    ]
+
+# Coordinator ------------------------------------------------------------------
+class _WorkerConnection:
+    __slots__ = ("sock", "name", "tiles", "last_seen", "send_lock")
+
+    def __init__(self, sock: socket.socket, name: str) -> None:
+        self.sock = sock
+        self.name = name
+        # Tile ids assigned and not yet returned, in the order the worker will render them
+        self.tiles: List[int] = []
+        self.last_seen = time.monotonic()
+        self.send_lock = threading.Lock()
+
+    def send(self, header: Dict, payload=b"") -> None:
+        with self.send_lock:
+            send_message(self.sock, header, payload)
+
+class Coordinator:
+    """
+    Serves one render to any number of workers.
+
+    Parameters:
+        scene (Scene): The scene to render.
+        camera (Dict): _core.Camera keyword arguments, e.g. from render.camera_settings().
+        tile_size (int): Edge length of the tiles handed out.
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one (see address).
+        prefetch (int): Tiles kept queued on each worker to hide network latency.
+        timeout (float): Seconds without a message after which a worker is presumed dead.
+        stats (bool): Collect RenderStats from the workers into framebuffer.stats.
+    """
+
+    def __init__(
+        self,
+        scene: Scene,
+        camera: Dict,
+        tile_size: int = 64,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prefetch: int = 2,
+        timeout: float = 10.0,
+        stats: bool = False
+    ) -> None:
+        from . import _core
+
+        self.camera = dict(camera)
+        size = _core.Camera(**self.camera)
+        self.width, self.height = size.image_width, size.image_height
+        self.tiles = split_tiles(self.width, self.height, tile_size)
+        self.prefetch = max(prefetch, 1)
+        self.timeout = timeout
+        self.stats = stats
+        self.scene_data = scene_to_bytes(scene)
+
+        self._listener = socket.create_server((host, port))
+        self._events: "queue.Queue[Tuple]" = queue.Queue()
+        self._workers: Dict[int, _WorkerConnection] = {}
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.getsockname()[:2]
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker = _WorkerConnection(sock, f"{address[0]}:{address[1]}")
+            threading.Thread(target=self._receive, args=(worker,), daemon=True).start()
+
+    def _receive(self, worker: _WorkerConnection) -> None:
+        # One thread per connection; everything it reads is handled on the render() thread
+        while True:
+            try:
+                message = recv_message(worker.sock)
+            except OSError:
+                message = None
+            if message is None:
+                self._events.put(("closed", worker, None, None))
+                return
+            worker.last_seen = time.monotonic()
+            header, payload = message
+            self._events.put((header["type"], worker, header, payload))
+
+    def render(
+        self,
+        framebuffer: Optional[Framebuffer] = None,
+        idle_timeout: float = 60.0,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Framebuffer:
+        """
+        Blocks until every tile has been rendered by some worker.
+
+        Parameters:
+            framebuffer (Optional[Framebuffer]): A buffer of the camera's size to fill; allocated if omitted.
+            idle_timeout (float): Give up if no worker is connected for this many seconds.
+            progress (Optional[Callable[[int, int], None]]): Called with (tiles done, tile count) after each tile.
+
+        Returns:
+            Framebuffer: The merged framebuffer; framebuffer.stats is set when stats were requested.
+
+        Raises:
+            RuntimeError: If no worker was connected for idle_timeout seconds.
+        """
+        if framebuffer is None:
+            framebuffer = Framebuffer(self.width, self.height)
+        if self.stats:
+            framebuffer.stats = RenderStats()
+
+        pending: Deque[int] = deque(range(len(self.tiles)))
+        done = set()
+        idle_since = time.monotonic()
+        start = time.perf_counter()
+
+        while len(done) < len(self.tiles):
+            try:
+                kind, worker, header, payload = self._events.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+
+            if kind == "hello":
+                self._workers[id(worker)] = worker
+                worker.name = header.get("name", worker.name)
+                job = {"type": "job", "camera": self.camera, "stats": self.stats}
+                if not self._send(worker, job, self.scene_data):
+                    continue
+            elif kind == "result":
+                tile_id = header["tile"]
+                if tile_id in worker.tiles:
+                    worker.tiles.remove(tile_id)
+                if tile_id not in done:
+                    done.add(tile_id)
+                    self._merge(framebuffer, self.tiles[tile_id], header, payload)
+                    # Tell anyone who was also given this tile not to bother
+                    for other in list(self._workers.values()):
+                        if tile_id in other.tiles:
+                            other.tiles.remove(tile_id)
+                            self._send(other, {"type": "cancel", "tile": tile_id})
+                    if progress is not None:
+                        progress(len(done), len(self.tiles))
+            elif kind == "closed":
+                self._drop(worker, pending, done)
+
+            # Workers that went quiet are treated like disconnected ones
+            now = time.monotonic()
+            for other in list(self._workers.values()):
+                if now - other.last_seen > self.timeout:
+                    self._drop(other, pending, done)
+
+            if self._workers:
+                idle_since = now
+            elif now - idle_since > idle_timeout:
+                raise RuntimeError(f"no render farm workers for {idle_timeout:.0f}s with "
+                                   f"{len(self.tiles) - len(done)} tiles left")
+
+            for other in list(self._workers.values()):
+                self._assign(other, pending, done)
+
+        for worker in list(self._workers.values()):
+            self._send(worker, {"type": "shutdown"})
+        if framebuffer.stats is not None:
+            # Wall-clock time, so rays_per_second is the throughput of the whole farm
+            framebuffer.stats.seconds = time.perf_counter() - start
+        return framebuffer
+
+    def _assign(self, worker: _WorkerConnection, pending: Deque[int], done: set) -> None:
+        while id(worker) in self._workers and len(worker.tiles) < self.prefetch:
+            if pending:
+                tile_id = pending.popleft()
+                if tile_id in done:
+                    continue
+            else:
+                # Steal the last queued tile of the busiest worker; if that worker has
+                # already started it, whichever copy finishes first is kept
+                victim = max(self._workers.values(), key=lambda other: len(other.tiles))
+                if victim is worker or len(victim.tiles) < 2:
+                    return
+                tile_id = victim.tiles.pop()
+                self._send(victim, {"type": "cancel", "tile": tile_id})
+
+            worker.tiles.append(tile_id)
+            if not self._send(worker, {"type": "tile", "tile": tile_id, "bounds": self.tiles[tile_id]}):
+                return
+
+    def _send(self, worker: _WorkerConnection, header: Dict, payload=b"") -> bool:
+        try:
+            worker.send(header, payload)
+            return True
+        except OSError:
+            # The receive thread will report the connection as closed
+            worker.sock.close()
+            return False
+
+    def _drop(self, worker: _WorkerConnection, pending: Deque[int], done: set) -> None:
+        if self._workers.pop(id(worker), None) is None:
+            return
+        # Re-queue at the front so the gap in the image is filled first
+        pending.extendleft(tile_id for tile_id in reversed(worker.tiles) if tile_id not in done)
+        worker.tiles.clear()
+        try:
+            worker.sock.close()
+        except OSError:
+            pass
+
+    def _merge(self, framebuffer: Framebuffer, bounds: TileBounds, header: Dict, payload: bytearray) -> None:
+        x0, y0, x1, y1 = bounds
+        height, width = y1 - y0, x1 - x0
+        colors = np.frombuffer(payload, dtype=np.float64, count=height * width * 3)
+        counts = np.frombuffer(payload, dtype=np.uint32, count=height * width, offset=colors.nbytes)
+        framebuffer.color[y0:y1, x0:x1] = colors.reshape(height, width, 3)
+        framebuffer.samples[y0:y1, x0:x1] = counts.reshape(height, width)
+        if framebuffer.stats is not None and header.get("stats") is not None:
+            framebuffer.stats.merge(RenderStats.from_dict(header["stats"]))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._listener.close()
+        for worker in list(self._workers.values()):
+            worker.sock.close()
+        self._workers.clear()
+
+# Worker -----------------------------------------------------------------------
+def run_worker(host: str, port: int, heartbeat: float = 1.0, name: Optional[str] = None) -> int:
+    """
+    Connects to a coordinator and renders tiles until it shuts the job down or disconnects.
+
+    Parameters:
+        host (str): Coordinator address.
+        port (int): Coordinator port.
+        heartbeat (float): Seconds between heartbeats, sent while tiles are rendering.
+        name (Optional[str]): Name reported to the coordinator; defaults to host:pid.
+
+    Returns:
+        int: The number of tiles rendered.
+    """
+    from . import _core
+    from .render import build_world
+
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_lock = threading.Lock()
+
+    def send(header: Dict, payload=b"") -> None:
+        with send_lock:
+            send_message(sock, header, payload)
+
+    send({"type": "hello", "name": name or f"{socket.gethostname()}:{os.getpid()}"})
+    message = recv_message(sock)
+    if message is None or message[0]["type"] != "job":
+        sock.close()
+        return 0
+    job, scene_data = message
+    world = build_world(scene_from_bytes(scene_data))
+    camera = _core.Camera(**job["camera"])
+    collect_stats = bool(job.get("stats"))
+
+    tiles: Deque[Tuple[int, TileBounds]] = deque()
+    ready = threading.Condition()
+    stopped = threading.Event()
+
+    def receive() -> None:
+        while not stopped.is_set():
+            try:
+                message = recv_message(sock)
+            except OSError:
+                message = None
+            with ready:
+                if message is None or message[0]["type"] == "shutdown":
+                    stopped.set()
+                elif message[0]["type"] == "tile":
+                    tiles.append((message[0]["tile"], tuple(message[0]["bounds"])))
+                elif message[0]["type"] == "cancel":
+                    for queued in list(tiles):
+                        if queued[0] == message[0]["tile"]:
+                            tiles.remove(queued)
+                ready.notify()
+
+    def beat() -> None:
+        while not stopped.wait(heartbeat):
+            try:
+                send({"type": "heartbeat"})
+            except OSError:
+                stopped.set()
+
+    threading.Thread(target=receive, daemon=True).start()
+    threading.Thread(target=beat, daemon=True).start()
+
+    rendered = 0
+    while True:
+        with ready:
+            while not tiles and not stopped.is_set():
+                ready.wait()
+            if stopped.is_set():
+                break
+            tile_id, (x0, y0, x1, y1) = tiles.popleft()
+
+        color = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float64)
+        samples = np.empty((y1 - y0, x1 - x0), dtype=np.uint32)
+        stats = _core.render_tile(world, camera, (x0, y0, x1, y1), color, samples, stats=collect_stats)
+        try:
+            send({"type": "result", "tile": tile_id, "stats": stats}, color.tobytes() + samples.tobytes())
+        except OSError:
+            break
+        rendered += 1
+
+    stopped.set()
+    sock.close()
+    return rendered
+
+# Local farm -------------------------------------------------------------------
+def spawn_workers(address: Tuple[str, int], count: int) -> List[subprocess.Popen]:
+    """
+    Starts `count` worker processes on this machine connected to `address`.
+    """
+    # Make sure the children import this copy of the package
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    host, port = address
+    return [
+        subprocess.Popen([sys.executable, "-m", "three_dev.farm", "worker", f"{host}:{port}"], env=env)
+        for _ in range(count)
+    ]
+
+def render_local(
+    scene: Scene,
+    camera: Dict,
+    workers: Optional[int] = None,
+    framebuffer: Optional[Framebuffer] = None,
+    **options
+) -> Framebuffer:
+    """
+    Renders through a coordinator on the loopback interface with local worker processes.
+    Useful for testing the farm, and as a multi-process renderer on one machine.
+
+    Parameters:
+        scene (Scene): The scene to render.
+        camera (Dict): _core.Camera keyword arguments, e.g. from render.camera_settings().
+        workers (Optional[int]): Number of worker processes; defaults to the CPU count.
+        framebuffer (Optional[Framebuffer]): A buffer of the camera's size to fill; allocated if omitted.
+        **options: Passed to Coordinator (tile_size, prefetch, timeout, stats).
+
+    Returns:
+        Framebuffer: The merged framebuffer.
+    """
+    coordinator = Coordinator(scene, camera, host="127.0.0.1", port=0, **options)
+    processes = spawn_workers(coordinator.address, workers or os.cpu_count() or 1)
+    try:
+        return coordinator.render(framebuffer)
+    finally:
+        coordinator.close()
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m three_dev.farm", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="serve a render to workers")
+    coordinator.add_argument("scene", help="scene file written by three_dev.write_scene")
+    coordinator.add_argument("--camera", required=True, help="JSON file of _core.Camera keyword arguments")
+    coordinator.add_argument("--output", required=True, help=".npz file for the summed colours and sample counts")
+    coordinator.add_argument("--host", default="0.0.0.0")
+    coordinator.add_argument("--port", type=int, default=7878)
+    coordinator.add_argument("--tile-size", type=int, default=64)
+    coordinator.add_argument("--local", type=int, default=0, metavar="N", help="also start N local workers")
+    coordinator.add_argument("--stats", action="store_true", help="collect and print render statistics")
+
+    worker = commands.add_parser("worker", help="render tiles for a coordinator")
+    worker.add_argument("address", help="coordinator host:port")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        host, _, port = args.address.rpartition(":")
+        run_worker(host, int(port))
+        return
+
+    with open(args.camera) as f:
+        camera = json.load(f)
+    farm = Coordinator(read_scene(args.scene), camera, tile_size=args.tile_size,
+                       host=args.host, port=args.port, stats=args.stats)
+    print(f"Coordinator listening on {farm.address[0]}:{farm.address[1]}, {len(farm.tiles)} tiles")
+    processes = spawn_workers(("127.0.0.1", farm.address[1]), args.local) if args.local else []
+    try:
+        framebuffer = farm.render(progress=lambda done, total: print(f"\r{done}/{total} tiles", end="", flush=True))
+    finally:
+        farm.close()
+        for process in processes:
+            process.wait()
+    print()
+
+    np.savez(args.output, color=framebuffer.color, samples=framebuffer.samples)
+    if framebuffer.stats is not None:
+        print(framebuffer.stats.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from .scene_file import read_arrays, write_arrays
+from .stats import RenderStats
+from .tonemap import Tonemap
+
+class Framebuffer:
+    """
+    The renderer's float accumulation buffer: summed sample colours plus the
+    number of samples behind each pixel, so pixels rendered with different
+    sample counts (adaptive sampling, resumed renders) average correctly.
+
+    The albedo and normal guide buffers are only allocated when the denoiser needs
+    them, and stats is only set by renders that asked for instrumentation.
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.color = np.zeros((height, width, 3), dtype=np.float64)
+        self.samples = np.zeros((height, width), dtype=np.uint32)
+        self.albedo: Optional[np.ndarray] = None
+        self.normal: Optional[np.ndarray] = None
+        self.stats: Optional[RenderStats] = None
+
+    def allocate_aux(self) -> None:
+        """
+        Allocates the first-hit albedo and normal buffers if they are missing.
+        """
+        if self.albedo is None:
+            self.albedo = np.zeros_like(self.color)
+            self.normal = np.zeros_like(self.color)
+
+    @property
+    def width(self) -> int:
+        return self.color.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.color.shape[0]
+
+    def mean(self, region: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        """
+        Returns the linear HDR image, (height, width, 3), averaging each pixel over its own sample count.
+        With an (x0, y0, x1, y1) region, only that rectangle is computed.
+        """
+        color, samples = self.color, self.samples
+        if region is not None:
+            x0, y0, x1, y1 = region
+            color, samples = color[y0:y1, x0:x1], samples[y0:y1, x0:x1]
+        return color / np.maximum(samples, 1)[..., None]
+
+    def sample_heatmap(self) -> np.ndarray:
+        """
+        Returns an 8-bit (height, width) map of samples per pixel, scaled so the
+        most-sampled pixel is white. Useful for inspecting where adaptive sampling spent its budget.
+        """
+        peak = max(int(self.samples.max()), 1)
+        return (self.samples * (255.0 / peak)).astype(np.uint8)
+
+    def to_rgb8(
+        self,
+        region: Optional[Tuple[int, int, int, int]] = None,
+        tonemap: Optional[Tonemap] = None,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Returns the image, or an (x0, y0, x1, y1) region of it, as uint8 RGB. The
+        default Tonemap has the same gamma-2 curve as the renderer's save_ppm.
+        `out` may be given to write into existing memory, e.g. a display buffer.
+        """
+        color, samples, origin = self.color, self.samples, (0, 0)
+        if region is not None:
+            x0, y0, x1, y1 = region
+            color, samples, origin = color[y0:y1, x0:x1], samples[y0:y1, x0:x1], (x0, y0)
+        return (tonemap or Tonemap()).apply(color, out=out, origin=origin, samples=samples)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Caches the framebuffer (colours, sample counts and any aux buffers) to a file.
+        """
+        arrays = {"color": self.color, "samples": self.samples}
+        if self.albedo is not None:
+            arrays.update(albedo=self.albedo, normal=self.normal)
+        write_arrays(path, arrays, framebuffer=True)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Framebuffer":
+        """
+        Loads a framebuffer written by save() into memory.
+        """
+        arrays, header = read_arrays(path)
+        if not header.get("framebuffer"):
+            raise ValueError(f"{path} is not a cached framebuffer")
+        framebuffer = cls.__new__(cls)
+        framebuffer.color = np.array(arrays["color"])
+        framebuffer.samples = np.array(arrays["samples"])
+        framebuffer.albedo = np.array(arrays["albedo"]) if "albedo" in arrays else None
+        framebuffer.normal = np.array(arrays["normal"]) if "normal" in arrays else None
+        framebuffer.stats = None
+        return framebuffer
@@ -0,0 +1,69 @@
+"""
+Writes 8-bit RGB images, e.g. Framebuffer.to_rgb8(), as PNG or binary PPM with
+only the standard library and NumPy, so headless renders need no imaging package.
+"""
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+FORMATS = (".png", ".ppm")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def encode_png(pixels: np.ndarray, level: int = 6) -> bytes:
+    """
+    Encodes a (height, width, 3) uint8 image as a PNG.
+    """
+    height, width = pixels.shape[:2]
+    # Every row is prefixed with its filter type, 0 (none)
+    rows = np.zeros((height, 1 + width * 3), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+def encode_ppm(pixels: np.ndarray) -> bytes:
+    """
+    Encodes a (height, width, 3) uint8 image as a binary PPM.
+    """
+    height, width = pixels.shape[:2]
+    return b"P6\n%d %d\n255\n" % (width, height) + np.ascontiguousarray(pixels).tobytes()
+
+def write_image(path: Union[str, Path], pixels: np.ndarray) -> None:
+    """
+    Writes an image in the format its suffix names. The file is written beside the
+    destination and renamed into place, so a reader never sees half an image.
+
+    Parameters:
+        path (str | Path): Destination, ending in one of FORMATS.
+        pixels (np.ndarray): (height, width, 3) uint8 RGB.
+
+    Raises:
+        ValueError: If the suffix is not one of FORMATS.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".png":
+        data = encode_png(pixels)
+    elif suffix == ".ppm":
+        data = encode_ppm(pixels)
+    else:
+        raise ValueError(f"{path}: images are written as {' or '.join(FORMATS)}")
+
+    partial = path.with_name(f".{path.name}.{os.getpid()}")
+    try:
+        partial.write_bytes(data)
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
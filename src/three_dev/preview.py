@@ -0,0 +1,238 @@
+import math
+import random
+import time
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import _core
+from .framebuffer import Framebuffer
+from .tonemap import Tonemap
+
+PATH = "path"
+SHADED = "shaded"
+
+class PreviewRenderer:
+    """
+    Interactive preview for placing the camera.
+
+    While the camera moves, each frame is a cheap pass (1 spp path tracing with a
+    shallow depth, or albedo/normal shading) at whatever fraction of the resolution
+    fits the frame-time budget; the fraction is re-estimated from every frame's
+    timing. Once the camera is idle, the full-resolution image is refined one
+    sample per pixel at a time, in bands of rows that fit the budget, with the
+    cheap frame filling in pixels the refinement has not reached yet.
+
+    The displayed image is composited and tonemapped at the view size (the full
+    resolution scaled down to fit set_view()), and after refining only the rows
+    of it covering the refined bands are redone. Compositing and drawing count
+    against the budget along with the rendering.
+    """
+
+    def __init__(
+        self,
+        world: _core.World,
+        settings: Dict,
+        budget: float = 0.05,
+        mode: str = PATH,
+        preview_depth: int = 4,
+        max_samples: int = 64,
+        min_scale: float = 0.05
+    ) -> None:
+        """
+        Parameters:
+            world (_core.World): The world to preview.
+            settings (Dict): _core.Camera keyword arguments for the full-quality camera.
+            budget (float): Target seconds per step().
+            mode (str): PATH for 1 spp path tracing, SHADED for albedo/normal shading.
+            preview_depth (int): Bounce limit of the cheap PATH frames.
+            max_samples (int): Samples per pixel at which idle refinement stops.
+            min_scale (float): Smallest fraction of the resolution a cheap frame may use.
+        """
+        if mode not in (PATH, SHADED):
+            raise ValueError(f"mode must be {PATH!r} or {SHADED!r}")
+        self.world = world
+        self.budget = budget
+        self.mode = mode
+        self.preview_depth = preview_depth
+        self.max_samples = max_samples
+        self.min_scale = min_scale
+        self.scale = 0.25
+        self.tonemap = Tonemap()
+
+        self.settings: Dict = {}
+        self.camera: Optional[_core.Camera] = None
+        self.framebuffer: Optional[Framebuffer] = None
+        self._preview: Optional[np.ndarray] = None
+        self._row = 0
+        self._sample = 0
+        self._seconds_per_pixel: Optional[float] = None
+        # Seconds of the last step spent compositing and drawing rather than rendering
+        self._overhead = 0.0
+        self.view: Optional[Tuple[int, int]] = None
+        self._image: Optional[np.ndarray] = None
+        self._image_tonemap: Optional[Tonemap] = None
+        # Framebuffer rows [start, end) changed since the image was last composited
+        self._dirty: List[Tuple[int, int]] = []
+        self.set_camera(**settings)
+
+    def set_camera(self, **changes) -> None:
+        """
+        Updates camera settings (e.g. look_from, look_at, focus_distance, aperture)
+        and restarts the preview from a cheap frame.
+        """
+        self.settings.update(changes)
+        # Refinement is progressive sampling, which adaptive sampling would fight
+        self.settings["noise_threshold"] = None
+        self.settings.setdefault("seed", random.getrandbits(63))
+        self.camera = _core.Camera(**self.settings)
+        self.framebuffer = Framebuffer(self.camera.image_width, self.camera.image_height)
+        self._preview = None
+        self._row = 0
+        self._sample = 0
+
+    def set_view(self, width: int, height: int) -> None:
+        """
+        Sets the largest size the image is shown at, e.g. the canvas; the image is
+        composited at the full resolution scaled down to fit it.
+        """
+        self.view = (width, height)
+
+    @property
+    def converged(self) -> bool:
+        return self._sample >= self.max_samples
+
+    def step(self, draw: Optional[Callable[[np.ndarray], None]] = None) -> Optional[np.ndarray]:
+        """
+        Does about one budget's worth of work, including compositing and drawing.
+
+        Parameters:
+            draw (Optional[Callable[[np.ndarray], None]]): Shows the image, e.g. on a
+                canvas; it is timed with the step, so the budget covers the whole frame.
+
+        Returns:
+            Optional[np.ndarray]: The updated (height, width, 3) uint8 image at the
+            view size, or None once refinement has converged.
+        """
+        start = time.perf_counter()
+        fast = self._preview is None
+        if fast:
+            rendering = self._fast_frame()
+        elif not self.converged:
+            # Leaves time for the compositing and drawing the last step needed
+            self._refine(start + max(self.budget - self._overhead, 0.0))
+        else:
+            return None
+
+        composing = time.perf_counter()
+        image = self.image()
+        if draw is not None:
+            draw(image)
+        self._overhead = time.perf_counter() - composing
+
+        if fast:
+            # Rendering time scales with the square of the resolution fraction; the
+            # compositing and drawing at the view size do not
+            available = max(self.budget - self._overhead, 0.1 * self.budget)
+            self.scale *= math.sqrt(available / max(rendering, 1e-4))
+            self.scale = min(max(self.scale, self.min_scale), 1.0)
+        return image
+
+    def _fast_frame(self) -> float:
+        # Returns the seconds spent rendering
+        width = max(16, int(self.settings["image_width"] * self.scale))
+        camera = _core.Camera(**{
+            **self.settings,
+            "image_width": width,
+            "samples_per_pixel": 1,
+            "max_depth": self.preview_depth
+        })
+        start = time.perf_counter()
+        if self.mode == PATH:
+            framebuffer = Framebuffer(camera.image_width, camera.image_height)
+            _core.render(self.world, camera, framebuffer.color, framebuffer.samples)
+            self._preview = framebuffer.mean()
+        else:
+            albedo = np.empty((camera.image_height, camera.image_width, 3))
+            normal = np.empty_like(albedo)
+            _core.render_aux(self.world, camera, albedo, normal, samples=1)
+            forward = np.subtract(self.settings["look_at"], self.settings["look_from"], dtype=np.float64)
+            forward /= np.linalg.norm(forward)
+            # Head-light shading: surfaces facing the camera are brightest; misses keep the sky colour
+            facing = np.abs(normal @ forward)
+            self._preview = albedo * np.where(np.any(normal, axis=2), 0.2 + 0.8 * facing, 1.0)[..., None]
+        self._dirty = [(0, self.framebuffer.height)]
+        return time.perf_counter() - start
+
+    def _refine(self, deadline: float) -> None:
+        # One band of rows at a time, sized from the measured cost per pixel to fit the budget
+        width, height = self.camera.image_width, self.camera.image_height
+        while not self.converged:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0.0 and self._dirty:
+                break
+            if self._seconds_per_pixel is None:
+                rows = 1
+            else:
+                rows = int(remaining / (self._seconds_per_pixel * width))
+            rows = min(max(rows, 1), height - self._row)
+
+            # Timed with the accumulation, which is part of every band's cost
+            start = time.perf_counter()
+            tile = (0, self._row, width, self._row + rows)
+            color = np.empty((rows, width, 3), dtype=np.float64)
+            samples = np.empty((rows, width), dtype=np.uint32)
+            _core.render_tile(self.world, self.camera, tile, color, samples,
+                              first_sample=self._sample, samples=1)
+            self.framebuffer.color[self._row:self._row + rows] += color
+            self.framebuffer.samples[self._row:self._row + rows] += samples
+            self._seconds_per_pixel = (time.perf_counter() - start) / (rows * width)
+
+            self._dirty.append((self._row, self._row + rows))
+            self._row += rows
+            if self._row >= height:
+                self._row = 0
+                self._sample += 1
+
+    def _view_size(self) -> Tuple[int, int]:
+        width, height = self.framebuffer.width, self.framebuffer.height
+        if self.view is None:
+            return width, height
+        fit = min(1.0, self.view[0] / width, self.view[1] / height)
+        return max(1, int(width * fit)), max(1, int(height * fit))
+
+    def image(self) -> np.ndarray:
+        """
+        Returns the current preview as (height, width, 3) uint8 at the view size.
+        """
+        height, width = self.framebuffer.height, self.framebuffer.width
+        view_width, view_height = self._view_size()
+        if (self._image is None or self._image.shape[:2] != (view_height, view_width)
+                or self._image_tonemap != self.tonemap):
+            self._image = np.empty((view_height, view_width, 3), dtype=np.uint8)
+            self._image_tonemap = replace(self.tonemap)
+            self._dirty = [(0, height)]
+
+        # Nearest-neighbour sampling of the framebuffer, and of the cheap frame for rows
+        # refinement has not reached; refinement goes row by row, so until its first pass
+        # ends the refined pixels are the rows above the current band
+        rows = np.arange(view_height) * height // view_height
+        columns = np.arange(view_width) * width // view_width
+        refined = height if self._sample > 0 else self._row
+        cheap = None
+        for start, end in self._dirty:
+            # rows is sorted, so the view rows showing framebuffer rows [start, end) are a slice
+            y0, split, y1 = np.searchsorted(rows, (start, max(start, min(end, refined)), end))
+            if y0 < split:
+                band = rows[y0:split, None]
+                self.tonemap.apply(self.framebuffer.color[band, columns], out=self._image[y0:split],
+                                   origin=(0, int(y0)), samples=self.framebuffer.samples[band, columns])
+            if split < y1:
+                if cheap is None:
+                    # The cheap frame is smaller than the view, so it is tonemapped before scaling
+                    cheap = self.tonemap.apply(self._preview)
+                    cheap_columns = columns * cheap.shape[1] // width
+                self._image[split:y1] = cheap[rows[split:y1, None] * cheap.shape[0] // height, cheap_columns]
+        self._dirty = []
+        return self._image
@@ -0,0 +1,236 @@
+import numpy as np
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Sequence, Tuple
+
+from . import _core
+from .framebuffer import Framebuffer
+from .scene import Scene
+from .scene_diff import KINDS, SceneDiff
+from .stats import RenderStats
+
+if TYPE_CHECKING:
+    # Only the UI passes one; its shared memory support is slow to import for headless renders
+    from .display import DisplayBuffer
+
+def build_world(scene: Scene) -> _core.World:
+    """
+    Builds the renderer's world from a scene. The column buffers are read in
+    place by the bindings; no intermediate Python objects are created. The
+    renderer caches decoded environment maps, so rebuilding a world with the
+    same background does not decode it again.
+    """
+    return _core.World(
+        **scene.arrays(),
+        texture_paths=scene.textures,
+        background=scene.background,
+        background_intensity=scene.background_intensity
+    )
+
+def update_world(world: _core.World, scene: Scene, diff: SceneDiff) -> _core.World:
+    """
+    Brings a world up to date with a scene it was built from an earlier state of.
+
+    Only the added and modified objects are sent to the renderer, which refits
+    its acceleration structure around them instead of rebuilding it, so editing
+    a few objects in a large scene takes milliseconds.
+
+    Parameters:
+        world (_core.World): The world to update; it is modified in place.
+        scene (Scene): The current state of the scene.
+        diff (SceneDiff): diff_scenes(state the world was built from, scene).
+
+    Returns:
+        _core.World: world, or a new world if the diff needs a rebuild.
+    """
+    if diff.rebuild:
+        return build_world(scene)
+    if not diff:
+        return world
+
+    rows = {kind: np.concatenate((diff.added[kind], diff.modified[kind])) for kind in KINDS}
+    columns = {}
+    for name, column in scene.arrays().items():
+        kind = next((kind for kind in KINDS if name.startswith(kind)), None)
+        # Materials are few and are sent whole; object columns only for the changed rows
+        columns[name] = column if kind is None else column[rows[kind]]
+    world.update(**columns, removed=diff.removed)
+    return world
+
+def _aspect_ratio(value) -> float:
+    # The settings menu stores ratios as "16:9" strings; the table default is a float
+    if isinstance(value, str) and ":" in value:
+        width, height = value.split(":")
+        return float(width) / float(height)
+    return float(value)
+
+def camera_settings(
+    preferences: Dict,
+    look_from: Sequence[float],
+    look_at: Sequence[float],
+    up: Sequence[float] = (0.0, 1.0, 0.0)
+) -> Dict:
+    """
+    Converts a render_preferences row (see DataManager.get_user_section) into
+    _core.Camera keyword arguments. The result is plain JSON-serialisable data,
+    so it can be stored or sent to render farm workers.
+    Adaptive sampling is used when the row has adaptive_sampling set.
+
+    Parameters:
+        preferences (Dict): A render_preferences row.
+        look_from (Sequence[float]): Camera position.
+        look_at (Sequence[float]): Point the camera looks at.
+        up (Sequence[float]): Camera up vector.
+
+    Returns:
+        Dict: Keyword arguments for _core.Camera.
+    """
+    adaptive = bool(preferences.get("adaptive_sampling"))
+    return {
+        "image_width": int(preferences["image_width"]),
+        "aspect_ratio": _aspect_ratio(preferences["aspect_ratio"]),
+        "samples_per_pixel": int(preferences["samples_per_pixel"]),
+        "max_depth": int(preferences["max_depth"]),
+        "look_from": [float(value) for value in look_from],
+        "look_at": [float(value) for value in look_at],
+        "up": [float(value) for value in up],
+        "focus_distance": float(preferences["focus_distance"]),
+        "aperture": float(preferences["aperture"]),
+        "noise_threshold": float(preferences["noise_threshold"]) if adaptive else None,
+        "min_samples": int(preferences.get("min_samples", 16)),
+        "max_samples": int(preferences.get("max_samples", 1024))
+    }
+
+def camera_from_preferences(
+    preferences: Dict,
+    look_from: Sequence[float],
+    look_at: Sequence[float],
+    up: Sequence[float] = (0.0, 1.0, 0.0)
+) -> _core.Camera:
+    """
+    Creates a camera from a render_preferences row; see camera_settings().
+    """
+    return _core.Camera(**camera_settings(preferences, look_from, look_at, up))
+
+def render(
+    scene: Scene,
+    camera: _core.Camera,
+    framebuffer: Optional[Framebuffer] = None,
+    world: Optional[_core.World] = None,
+    aux: bool = False,
+    stats: bool = False,
+    packets: bool = False
+) -> Framebuffer:
+    """
+    Renders a scene into a float framebuffer.
+
+    Parameters:
+        scene (Scene): The scene to render.
+        camera (_core.Camera): The camera to render through.
+        framebuffer (Optional[Framebuffer]): A buffer of the camera's size to fill; allocated if omitted.
+        world (Optional[_core.World]): A world already built from the scene, to skip rebuilding it.
+        aux (bool): Also fill the albedo and normal buffers used by three_dev.denoise.
+        stats (bool): Collect ray-tracing counters into framebuffer.stats. Off by
+            default; the uninstrumented tracing path is used when disabled.
+        packets (bool): Trace camera rays in single-precision packets, which is faster
+            and differs from the default only at a few silhouette pixels. Not
+            available with stats or adaptive sampling.
+
+    Returns:
+        Framebuffer: Summed sample colours and per-pixel sample counts.
+    """
+    if framebuffer is None:
+        framebuffer = Framebuffer(camera.image_width, camera.image_height)
+    if world is None:
+        world = build_world(scene)
+
+    counters = _core.render(world, camera, framebuffer.color, framebuffer.samples, stats=stats, packets=packets)
+    framebuffer.stats = RenderStats.from_dict(counters) if counters is not None else None
+    if aux:
+        framebuffer.allocate_aux()
+        _core.render_aux(world, camera, framebuffer.albedo, framebuffer.normal)
+    return framebuffer
+
+Region = Tuple[int, int, int, int]
+
+def _clip(region: Region, width: int, height: int) -> Region:
+    x0, y0, x1, y1 = region
+    x0, x1 = sorted((max(0, min(int(x0), width)), max(0, min(int(x1), width))))
+    y0, y1 = sorted((max(0, min(int(y0), height)), max(0, min(int(y1), height))))
+    return x0, y0, x1, y1
+
+def render_region(
+    world: _core.World,
+    camera: _core.Camera,
+    framebuffer: Framebuffer,
+    region: Region,
+    refine: bool = False,
+    tile_size: int = 64,
+    display: Optional["DisplayBuffer"] = None,
+    stats: Optional[RenderStats] = None
+) -> int:
+    """
+    Renders only a pixel rectangle and composites it into an existing framebuffer,
+    so the cost scales with the rectangle's area rather than the image's.
+
+    By default the rectangle is replaced, e.g. after an edit that only affects
+    that part of the frame. Sample indices start from 0, so with the seeded camera
+    that rendered the framebuffer, unchanged pixels come out identical and the
+    patch composites without seams. With refine=True, samples_per_pixel more
+    samples are added instead, continuing the sample sequence of the pixels there.
+
+    Parameters:
+        world (_core.World): The world to render.
+        camera (_core.Camera): The camera the framebuffer was rendered with.
+        framebuffer (Framebuffer): The cached full-frame framebuffer to update.
+        region (Tuple[int, int, int, int]): (x0, y0, x1, y1) in pixels, clipped to the image.
+        refine (bool): Add samples rather than replacing the region.
+        tile_size (int): The region is rendered in tiles of this size.
+        display (Optional[DisplayBuffer]): Updated as each tile finishes, so the UI can show progress.
+        stats (Optional[RenderStats]): Every tile's ray-tracing counters are merged into it.
+
+    Returns:
+        int: The number of pixels rendered.
+
+    Raises:
+        ValueError: If refine is used with an adaptive camera, whose tiles are rendered in one pass.
+    """
+    x0, y0, x1, y1 = _clip(region, framebuffer.width, framebuffer.height)
+    for ty in range(y0, y1, tile_size):
+        for tx in range(x0, x1, tile_size):
+            tile = (tx, ty, min(tx + tile_size, x1), min(ty + tile_size, y1))
+            window = (slice(tile[1], tile[3]), slice(tile[0], tile[2]))
+            color = np.empty((tile[3] - tile[1], tile[2] - tile[0], 3), dtype=np.float64)
+            samples = np.empty(color.shape[:2], dtype=np.uint32)
+
+            if refine:
+                first_sample = int(framebuffer.samples[window].max())
+                counters = _core.render_tile(world, camera, tile, color, samples, stats=stats is not None,
+                                             first_sample=first_sample, samples=camera.samples_per_pixel)
+                framebuffer.color[window] += color
+                framebuffer.samples[window] += samples
+            else:
+                counters = _core.render_tile(world, camera, tile, color, samples, stats=stats is not None)
+                framebuffer.color[window] = color
+                framebuffer.samples[window] = samples
+            if counters is not None:
+                stats.merge(RenderStats.from_dict(counters))
+            if display is not None:
+                display.update(framebuffer, tile)
+
+    return (x1 - x0) * (y1 - y0)
+
+def render_tiles(
+    world: _core.World,
+    camera: _core.Camera,
+    framebuffer: Framebuffer,
+    tiles: Iterable[Region],
+    refine: bool = False,
+    display: Optional["DisplayBuffer"] = None,
+    stats: Optional[RenderStats] = None
+) -> int:
+    """
+    Renders a list of (x0, y0, x1, y1) rectangles into a framebuffer; see render_region().
+
+    Returns:
+        int: The number of pixels rendered.
+    """
+    return sum(render_region(world, camera, framebuffer, tile, refine, display=display, stats=stats) for tile in tiles)
@@ -0,0 +1,630 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Material kinds, kept in step with src/lib.rs
+LAMBERTIAN = 0
+METAL = 1
+DIELECTRIC = 2
+
+class ColumnTable:
+    """
+    Named NumPy columns that share a row count and grow together by doubling.
+
+    Rows live in preallocated arrays, so appending an object costs a slice
+    assignment rather than a Python object. Only the filled rows are exposed.
+    """
+
+    def __init__(self, capacity: int = 64, **columns: Tuple[Tuple[int, ...], type]) -> None:
+        """
+        Parameters:
+            capacity (int): Number of rows to allocate up front.
+            **columns: Column name -> (row shape, dtype), e.g. geometry=((4,), np.float64).
+        """
+        self._columns = {
+            name: np.zeros((capacity, *shape), dtype=dtype)
+            for name, (shape, dtype) in columns.items()
+        }
+        self._size = 0
+        # Rows written since take_dirty(), or None while writes are not tracked
+        self._dirty: Optional[List[Union[int, range]]] = None
+
+    @classmethod
+    def from_arrays(cls, **arrays: np.ndarray) -> "ColumnTable":
+        """
+        Adopts existing arrays (e.g. memory-mapped from a scene file) as full columns without copying.
+        """
+        sizes = {len(array) for array in arrays.values()}
+        if len(sizes) > 1:
+            raise ValueError("columns must have the same number of rows")
+
+        table = cls.__new__(cls)
+        table._columns = dict(arrays)
+        table._size = sizes.pop() if sizes else 0
+        table._dirty = None
+        return table
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._columns)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns a view of the filled rows of a column. Writes go straight into the table.
+        """
+        return self._columns[name][:self._size]
+
+    def reserve(self, rows: int) -> None:
+        """
+        Ensures there is room for `rows` more rows, doubling capacity as needed.
+        """
+        needed = self._size + rows
+        capacity = len(next(iter(self._columns.values()))) if self._columns else 0
+        if needed <= capacity:
+            return
+
+        capacity = max(capacity, 64)
+        while capacity < needed:
+            capacity *= 2
+
+        for name, data in self._columns.items():
+            grown = np.zeros((capacity, *data.shape[1:]), dtype=data.dtype)
+            grown[:self._size] = data[:self._size]
+            self._columns[name] = grown
+
+    def grow(self, rows: int) -> None:
+        """
+        Extends the table to `rows` rows if it is shorter; the new rows are zeros.
+        """
+        if rows <= self._size:
+            return
+        self.reserve(rows - self._size)
+        for data in self._columns.values():
+            data[self._size:rows] = 0
+        self._size = rows
+
+    def track(self, enabled: bool = True) -> None:
+        """
+        Starts or stops recording which rows are written, for take_dirty().
+        """
+        self._dirty = [] if enabled else None
+
+    def mark(self, rows: Union[int, range, np.ndarray]) -> None:
+        """
+        Records rows as written. append, extend and the handles mark their own
+        writes; code that writes through column() views marks the rows it changed.
+        """
+        if self._dirty is not None:
+            self._dirty.append(rows)
+
+    def take_dirty(self) -> np.ndarray:
+        """
+        Returns the sorted indices of the rows written since the last call, and forgets them.
+        """
+        if not self._dirty:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate([
+            np.arange(entry.start, entry.stop) if isinstance(entry, range) else np.atleast_1d(entry)
+            for entry in self._dirty
+        ]).astype(np.int64))
+        self._dirty = []
+        return rows
+
+    def append(self, **values) -> int:
+        """
+        Appends one row and returns its index.
+        """
+        self.reserve(1)
+        index = self._size
+        for name, data in self._columns.items():
+            data[index] = values[name]
+        self._size += 1
+        self.mark(index)
+        return index
+
+    def extend(self, **values) -> np.ndarray:
+        """
+        Appends many rows at once from array-likes and returns their indices.
+        """
+        count = len(np.asarray(next(iter(values.values()))))
+        self.reserve(count)
+        start = self._size
+        for name, data in self._columns.items():
+            data[start:start + count] = values[name]
+        self._size += count
+        self.mark(range(start, start + count))
+        return np.arange(start, start + count)
+
+class _Handle:
+    """
+    A lightweight proxy for one row of a ColumnTable. Holds no data of its own.
+    """
+    __slots__ = ("_table", "index")
+
+    def __init__(self, table: ColumnTable, index: int) -> None:
+        self._table = table
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.index})"
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other._table is self._table and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self._table), self.index))
+
+    def _get(self, column: str, start: int, stop: int) -> np.ndarray:
+        return self._table.column(column)[self.index, start:stop]
+
+    def _set(self, column: str, start: int, stop: int, value) -> None:
+        self._table.column(column)[self.index, start:stop] = value
+        self._table.mark(self.index)
+
+class MaterialHandle(_Handle):
+    __slots__ = ()
+
+    @property
+    def kind(self) -> int:
+        return int(self._table.column("kind")[self.index])
+
+    @property
+    def albedo(self) -> np.ndarray:
+        return self._get("params", 0, 3)
+
+    @albedo.setter
+    def albedo(self, value: Sequence[float]) -> None:
+        self._set("params", 0, 3, value)
+
+    @property
+    def parameter(self) -> float:
+        """Fuzz for metals, refractive index for dielectrics; unused for Lambertians."""
+        return float(self._table.column("params")[self.index, 3])
+
+    @parameter.setter
+    def parameter(self, value: float) -> None:
+        self._set("params", 3, 4, value)
+
+    @property
+    def texture(self) -> int:
+        return int(self._table.column("texture")[self.index])
+
+class _PrimitiveHandle(_Handle):
+    __slots__ = ()
+
+    @property
+    def id(self) -> int:
+        """The stable id that identifies this primitive across versions of the scene."""
+        return int(self._table.column("id")[self.index])
+
+    @property
+    def group(self) -> int:
+        """The instancing group this primitive belongs to, or -1 if it is placed in the world directly."""
+        return int(self._table.column("group")[self.index])
+
+    @property
+    def material(self) -> int:
+        return int(self._table.column("material")[self.index])
+
+    @material.setter
+    def material(self, material: Union["MaterialHandle", int]) -> None:
+        self._table.column("material")[self.index] = _material_index(material)
+        self._table.mark(self.index)
+
+class SphereHandle(_PrimitiveHandle):
+    __slots__ = ()
+
+    @property
+    def center(self) -> np.ndarray:
+        return self._get("geometry", 0, 3)
+
+    @center.setter
+    def center(self, value: Sequence[float]) -> None:
+        self._set("geometry", 0, 3, value)
+
+    @property
+    def radius(self) -> float:
+        return float(self._table.column("geometry")[self.index, 3])
+
+    @radius.setter
+    def radius(self, value: float) -> None:
+        self._set("geometry", 3, 4, value)
+
+class QuadHandle(_PrimitiveHandle):
+    __slots__ = ()
+
+    @property
+    def origin(self) -> np.ndarray:
+        return self._get("geometry", 0, 3)
+
+    @origin.setter
+    def origin(self, value: Sequence[float]) -> None:
+        self._set("geometry", 0, 3, value)
+
+    @property
+    def u(self) -> np.ndarray:
+        return self._get("geometry", 3, 6)
+
+    @u.setter
+    def u(self, value: Sequence[float]) -> None:
+        self._set("geometry", 3, 6, value)
+
+    @property
+    def v(self) -> np.ndarray:
+        return self._get("geometry", 6, 9)
+
+    @v.setter
+    def v(self, value: Sequence[float]) -> None:
+        self._set("geometry", 6, 9, value)
+
+class CuboidHandle(_PrimitiveHandle):
+    __slots__ = ()
+
+    @property
+    def center(self) -> np.ndarray:
+        return self._get("geometry", 0, 3)
+
+    @center.setter
+    def center(self, value: Sequence[float]) -> None:
+        self._set("geometry", 0, 3, value)
+
+    @property
+    def dimensions(self) -> np.ndarray:
+        return self._get("geometry", 3, 6)
+
+    @dimensions.setter
+    def dimensions(self, value: Sequence[float]) -> None:
+        self._set("geometry", 3, 6, value)
+
+class InstanceHandle(_Handle):
+    __slots__ = ()
+
+    @property
+    def id(self) -> int:
+        """The stable id that identifies this instance across versions of the scene."""
+        return int(self._table.column("id")[self.index])
+
+    @property
+    def group(self) -> int:
+        return int(self._table.column("group")[self.index])
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The 3x3 linear part of the instance transform (a copy; assign to change it)."""
+        return self._get("transform", 0, 9).reshape(3, 3).T
+
+    @matrix.setter
+    def matrix(self, value: np.ndarray) -> None:
+        self._set("transform", 0, 9, np.asarray(value, dtype=np.float64).T.ravel())
+
+    @property
+    def translation(self) -> np.ndarray:
+        return self._get("transform", 9, 12)
+
+    @translation.setter
+    def translation(self, value: Sequence[float]) -> None:
+        self._set("transform", 9, 12, value)
+
+    @property
+    def material(self) -> int:
+        """The material override for every primitive in the group, or -1 to keep their own."""
+        return int(self._table.column("material")[self.index])
+
+    @material.setter
+    def material(self, material: Union[MaterialHandle, int]) -> None:
+        self._table.column("material")[self.index] = _material_index(material)
+        self._table.mark(self.index)
+
+def affine_columns(
+    translation: Sequence[float] = (0.0, 0.0, 0.0),
+    rotation: Optional[np.ndarray] = None,
+    scale: Union[float, Sequence[float]] = 1.0
+) -> np.ndarray:
+    """
+    Packs a transform into the 12 column-major values the renderer reads (3x3 matrix columns, then translation).
+
+    Parameters:
+        translation (Sequence[float]): Offset applied after rotation and scale.
+        rotation (Optional[np.ndarray]): A 3x3 rotation matrix; identity if omitted.
+        scale (float | Sequence[float]): Uniform or per-axis scale, applied first.
+
+    Returns:
+        np.ndarray: The packed transform.
+    """
+    linear = np.eye(3) if rotation is None else np.asarray(rotation, dtype=np.float64)
+    linear = linear * np.broadcast_to(np.asarray(scale, dtype=np.float64), 3)
+    return np.concatenate((linear.T.ravel(), np.asarray(translation, dtype=np.float64)))
+
+def _material_index(material: Union[MaterialHandle, int, np.ndarray]):
+    return material.index if isinstance(material, MaterialHandle) else material
+
+class Scene:
+    """
+    A columnar scene model. Every primitive kind is a ColumnTable of NumPy
+    columns, and the handles returned by the add_* methods are __slots__
+    proxies that read and write those columns in place.
+
+    Cuboids are stored as (center, dimensions) and expanded into six quads by
+    the renderer's create_cuboid.
+
+    Repeated geometry is instanced: primitives added with a group index form a
+    shared prototype that is never rendered directly, and each row of the
+    instances table places that prototype with its own transform. Memory grows
+    with the unique geometry, not the number of copies.
+
+    Every primitive and instance gets an id, unique within the scene and kept
+    when the scene is saved and reloaded, so two versions of a scene can be
+    compared object by object (see scene_diff).
+    """
+
+    def __init__(self) -> None:
+        self.materials = ColumnTable(
+            kind=((), np.uint8),
+            params=((4,), np.float64),  # r, g, b, fuzz or refractive index
+            texture=((), np.int32)      # index into self.textures, -1 for a solid colour
+        )
+        self.spheres = ColumnTable(
+            geometry=((4,), np.float64), material=((), np.int32), group=((), np.int32), id=((), np.int64)
+        )
+        self.quads = ColumnTable(
+            geometry=((9,), np.float64), material=((), np.int32), group=((), np.int32), id=((), np.int64)
+        )
+        self.cuboids = ColumnTable(
+            geometry=((6,), np.float64), material=((), np.int32), group=((), np.int32), id=((), np.int64)
+        )
+        self.instances = ColumnTable(
+            group=((), np.int32),
+            transform=((12,), np.float64),  # column-major 3x4 affine, see affine_columns
+            material=((), np.int32),        # override for the whole group, -1 to keep the group's own
+            id=((), np.int64)
+        )
+        self.textures: List[str] = []
+        self.group_count = 0
+        self.next_id = 0
+        # Environment map lighting the scene; None for the renderer's sky gradient
+        self.background: Optional[str] = None
+        self.background_intensity = 1.0
+
+    def _new_ids(self, count: int) -> np.ndarray:
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        return ids
+
+    def set_background(self, path: Optional[str], intensity: float = 1.0) -> None:
+        """
+        Lights the scene with an equirectangular environment map (.hdr and .exr are
+        read as linear radiance, other images as gamma-2 encoded), scaled by
+        intensity. Pass None to go back to the sky gradient.
+        """
+        self.background = path
+        self.background_intensity = float(intensity)
+
+    # Materials ----------------------------------------------------------------
+    def add_texture(self, path: str) -> int:
+        """
+        Registers an image texture and returns its index, reusing an existing entry for the same path.
+        """
+        if path in self.textures:
+            return self.textures.index(path)
+        self.textures.append(path)
+        return len(self.textures) - 1
+
+    def add_lambertian(self, albedo: Sequence[float] = (0.5, 0.5, 0.5),
+                       texture: Optional[str] = None) -> MaterialHandle:
+        texture_index = self.add_texture(texture) if texture else -1
+        index = self.materials.append(kind=LAMBERTIAN, params=(*albedo, 0.0), texture=texture_index)
+        return MaterialHandle(self.materials, index)
+
+    def add_metal(self, albedo: Sequence[float], fuzz: float = 0.0) -> MaterialHandle:
+        index = self.materials.append(kind=METAL, params=(*albedo, min(max(fuzz, 0.0), 1.0)), texture=-1)
+        return MaterialHandle(self.materials, index)
+
+    def add_dielectric(self, refractive_index: float,
+                       albedo: Sequence[float] = (1.0, 1.0, 1.0)) -> MaterialHandle:
+        index = self.materials.append(kind=DIELECTRIC, params=(*albedo, refractive_index), texture=-1)
+        return MaterialHandle(self.materials, index)
+
+    # Primitives ---------------------------------------------------------------
+    def add_sphere(self, center: Sequence[float], radius: float,
+                   material: Union[MaterialHandle, int], group: int = -1) -> SphereHandle:
+        index = self.spheres.append(
+            geometry=(*center, radius), material=_material_index(material), group=group, id=self._new_ids(1)[0]
+        )
+        return SphereHandle(self.spheres, index)
+
+    def add_quad(self, origin: Sequence[float], u: Sequence[float], v: Sequence[float],
+                 material: Union[MaterialHandle, int], group: int = -1) -> QuadHandle:
+        index = self.quads.append(
+            geometry=(*origin, *u, *v), material=_material_index(material), group=group, id=self._new_ids(1)[0]
+        )
+        return QuadHandle(self.quads, index)
+
+    def add_cuboid(self, center: Sequence[float], dimensions: Sequence[float],
+                   material: Union[MaterialHandle, int], group: int = -1) -> CuboidHandle:
+        index = self.cuboids.append(
+            geometry=(*center, *dimensions), material=_material_index(material), group=group, id=self._new_ids(1)[0]
+        )
+        return CuboidHandle(self.cuboids, index)
+
+    def add_spheres(self, centers: np.ndarray, radii: np.ndarray,
+                    materials: Union[MaterialHandle, int, np.ndarray], group: int = -1) -> np.ndarray:
+        """
+        Adds many spheres in one vectorised write.
+
+        Parameters:
+            centers (np.ndarray): (n, 3) sphere centres.
+            radii (np.ndarray): (n,) radii.
+            materials: One material for every sphere, or an (n,) array of material indices.
+            group (int): Instancing group to add the spheres to, or -1 for the world.
+
+        Returns:
+            np.ndarray: The indices of the new spheres.
+        """
+        centers = np.asarray(centers, dtype=np.float64)
+        geometry = np.column_stack((centers, np.broadcast_to(radii, len(centers))))
+        return self.spheres.extend(
+            geometry=geometry,
+            material=np.broadcast_to(_material_index(materials), len(centers)),
+            group=group,
+            id=self._new_ids(len(centers))
+        )
+
+    # Instancing ---------------------------------------------------------------
+    def add_group(self) -> int:
+        """
+        Starts a new instancing group. Pass the returned index as `group` to the
+        add_* methods to build its geometry, then place copies with add_instance.
+        """
+        self.group_count += 1
+        return self.group_count - 1
+
+    def add_instance(
+        self,
+        group: int,
+        translation: Sequence[float] = (0.0, 0.0, 0.0),
+        rotation: Optional[np.ndarray] = None,
+        scale: Union[float, Sequence[float]] = 1.0,
+        material: Optional[Union[MaterialHandle, int]] = None
+    ) -> InstanceHandle:
+        """
+        Places a copy of a group's geometry. The renderer intersects rays with the
+        shared geometry in object space, so a copy costs one row here.
+
+        Parameters:
+            group (int): Group created by add_group.
+            translation, rotation, scale: The instance transform, see affine_columns.
+            material (Optional[MaterialHandle | int]): Overrides every material in the group.
+
+        Returns:
+            InstanceHandle: A handle to the new instance.
+        """
+        index = self.instances.append(
+            group=group,
+            transform=affine_columns(translation, rotation, scale),
+            material=-1 if material is None else _material_index(material),
+            id=self._new_ids(1)[0]
+        )
+        return InstanceHandle(self.instances, index)
+
+    def add_instances(self, group: int, translations: np.ndarray,
+                      material: Optional[Union[MaterialHandle, int, np.ndarray]] = None) -> np.ndarray:
+        """
+        Places many translated copies of a group in one vectorised write and returns their indices.
+        """
+        translations = np.asarray(translations, dtype=np.float64)
+        transforms = np.tile(affine_columns(), (len(translations), 1))
+        transforms[:, 9:12] = translations
+        return self.instances.extend(
+            group=np.broadcast_to(group, len(translations)),
+            transform=transforms,
+            material=np.broadcast_to(-1 if material is None else _material_index(material), len(translations)),
+            id=self._new_ids(len(translations))
+        )
+
+    def sphere(self, index: int) -> SphereHandle:
+        return SphereHandle(self.spheres, index)
+
+    def quad(self, index: int) -> QuadHandle:
+        return QuadHandle(self.quads, index)
+
+    def cuboid(self, index: int) -> CuboidHandle:
+        return CuboidHandle(self.cuboids, index)
+
+    def material(self, index: int) -> MaterialHandle:
+        return MaterialHandle(self.materials, index)
+
+    def instance(self, index: int) -> InstanceHandle:
+        return InstanceHandle(self.instances, index)
+
+    # Hand-off -----------------------------------------------------------------
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns views of every column, named as the renderer's World constructor expects.
+        Nothing is copied; the views stay valid until the next append grows a table.
+        """
+        return {
+            "spheres": self.spheres.column("geometry"),
+            "sphere_materials": self.spheres.column("material"),
+            "sphere_groups": self.spheres.column("group"),
+            "sphere_ids": self.spheres.column("id"),
+            "quads": self.quads.column("geometry"),
+            "quad_materials": self.quads.column("material"),
+            "quad_groups": self.quads.column("group"),
+            "quad_ids": self.quads.column("id"),
+            "cuboids": self.cuboids.column("geometry"),
+            "cuboid_materials": self.cuboids.column("material"),
+            "cuboid_groups": self.cuboids.column("group"),
+            "cuboid_ids": self.cuboids.column("id"),
+            "material_kinds": self.materials.column("kind"),
+            "material_params": self.materials.column("params"),
+            "material_textures": self.materials.column("texture"),
+            "instance_groups": self.instances.column("group"),
+            "instance_transforms": self.instances.column("transform"),
+            "instance_materials": self.instances.column("material"),
+            "instance_ids": self.instances.column("id"),
+        }
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays: Dict[str, np.ndarray],
+        textures: Sequence[str] = (),
+        background: Optional[str] = None,
+        background_intensity: float = 1.0
+    ) -> "Scene":
+        """
+        Builds a scene around existing arrays (the inverse of arrays()) without copying them.
+        Arrays saved before scenes had ids are given fresh ones.
+        """
+        scene = cls.__new__(cls)
+        scene.next_id = max(
+            (int(arrays[name].max()) + 1 for name in
+             ("sphere_ids", "quad_ids", "cuboid_ids", "instance_ids") if len(arrays.get(name, ()))),
+            default=0
+        )
+
+        def ids(kind: str) -> np.ndarray:
+            name = f"{kind}_ids"
+            if name in arrays:
+                return arrays[name]
+            rows = len(arrays["instance_groups"] if kind == "instance" else arrays[f"{kind}s"])
+            return scene._new_ids(rows)
+
+        scene.materials = ColumnTable.from_arrays(
+            kind=arrays["material_kinds"],
+            params=arrays["material_params"],
+            texture=arrays["material_textures"]
+        )
+        for kind in ("sphere", "quad", "cuboid"):
+            setattr(scene, f"{kind}s", ColumnTable.from_arrays(
+                geometry=arrays[f"{kind}s"],
+                material=arrays[f"{kind}_materials"],
+                group=arrays[f"{kind}_groups"],
+                id=ids(kind)
+            ))
+        scene.instances = ColumnTable.from_arrays(
+            group=arrays["instance_groups"],
+            transform=arrays["instance_transforms"],
+            material=arrays["instance_materials"],
+            id=ids("instance")
+        )
+        scene.textures = list(textures)
+        scene.background = background
+        scene.background_intensity = float(background_intensity)
+        scene.group_count = max(
+            (int(table.column("group").max()) + 1 for table in
+             (scene.spheres, scene.quads, scene.cuboids, scene.instances) if len(table)),
+            default=0
+        )
+        return scene
+
+    def __len__(self) -> int:
+        """The number of top-level objects the renderer will intersect (group geometry is counted once per instance)."""
+        return (
+            int((self.spheres.column("group") < 0).sum())
+            + int((self.quads.column("group") < 0).sum())
+            + 6 * int((self.cuboids.column("group") < 0).sum())
+            + len(self.instances)
+        )
@@ -0,0 +1,135 @@
+"""
+Differences between two states of a scene, matched by the stable ids the Scene
+gives every primitive and instance.
+
+A diff lists the objects added, removed and modified between the states, so a
+world built from the old state can be updated in place (render.update_world)
+rather than rebuilt when a few objects change. The comparison is vectorised
+over the columns, and when no object was added or removed, which is the usual
+edit, the rows line up and are compared without matching ids at all.
+"""
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+
+from .scene import ColumnTable, Scene
+
+# Object kinds, named as in Scene.arrays() (sphere_ids, instance_transforms, ...)
+KINDS = ("sphere", "quad", "cuboid", "instance")
+
+def _empty() -> Dict[str, np.ndarray]:
+    return {kind: np.empty(0, dtype=np.int64) for kind in KINDS}
+
+@dataclass
+class SceneDiff:
+    """
+    added and modified map each kind to row indices into the new scene; removed
+    holds the ids of objects that are gone. rebuild is set when something changed
+    that an update cannot express (group geometry, textures, the background or a
+    removed material), in which case the world has to be built again.
+    """
+    added: Dict[str, np.ndarray] = field(default_factory=_empty)
+    modified: Dict[str, np.ndarray] = field(default_factory=_empty)
+    removed: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    rebuild: bool = False
+
+    def __len__(self) -> int:
+        """The number of objects added, modified or removed."""
+        return sum(len(rows) for rows in self.added.values()) + sum(
+            len(rows) for rows in self.modified.values()
+        ) + len(self.removed)
+
+    def __bool__(self) -> bool:
+        return self.rebuild or len(self) > 0
+
+def snapshot(scene: Scene) -> Scene:
+    """
+    Copies a scene's columns, to diff against after it has been edited in place.
+    """
+    arrays = {name: np.array(column) for name, column in scene.arrays().items()}
+    return Scene.from_arrays(arrays, scene.textures, scene.background, scene.background_intensity)
+
+def _table(scene: Scene, kind: str) -> ColumnTable:
+    return getattr(scene, f"{kind}s")
+
+def _changed_materials(old: Scene, new: Scene) -> np.ndarray:
+    # Indices of materials whose kind, parameters or texture differ; materials are only ever appended
+    count = len(old.materials)
+    changed = np.zeros(count, dtype=bool)
+    for name in old.materials.names:
+        before = old.materials.column(name)
+        after = new.materials.column(name)[:count]
+        differs = before != after
+        changed |= differs.reshape(count, -1).any(axis=1)
+    return np.flatnonzero(changed)
+
+def diff_scenes(old: Scene, new: Scene) -> SceneDiff:
+    """
+    Compares two states of a scene.
+
+    Parameters:
+        old (Scene): The state a world was built from, e.g. the previous version or a snapshot().
+        new (Scene): The current state.
+
+    Returns:
+        SceneDiff: What changed from old to new.
+    """
+    diff = SceneDiff()
+    if (
+        old.textures != new.textures
+        or old.background != new.background
+        or old.background_intensity != new.background_intensity
+        or len(new.materials) < len(old.materials)
+    ):
+        diff.rebuild = True
+        return diff
+    changed_materials = _changed_materials(old, new)
+
+    removed = []
+    for kind in KINDS:
+        before, after = _table(old, kind), _table(new, kind)
+        data = "transform" if kind == "instance" else "geometry"
+        old_ids, new_ids = before.column("id"), after.column("id")
+
+        if np.array_equal(old_ids, new_ids):
+            # The rows line up; slices compare the columns without copying them
+            old_rows = new_rows = slice(None)
+            added_rows = np.empty(0, dtype=np.int64)
+            removed_rows = np.empty(0, dtype=np.int64)
+        else:
+            _, old_rows, new_rows = np.intersect1d(old_ids, new_ids, assume_unique=True, return_indices=True)
+            kept = np.zeros(len(new_ids), dtype=bool)
+            kept[new_rows] = True
+            added_rows = np.flatnonzero(~kept)
+            kept = np.zeros(len(old_ids), dtype=bool)
+            kept[old_rows] = True
+            removed_rows = np.flatnonzero(~kept)
+
+        materials = after.column("material")[new_rows]
+        modified = (
+            (before.column(data)[old_rows] != after.column(data)[new_rows]).any(axis=1)
+            | (before.column("material")[old_rows] != materials)
+            | (before.column("group")[old_rows] != after.column("group")[new_rows])
+        )
+        if len(changed_materials):
+            modified |= np.isin(materials, changed_materials)
+        modified_rows = np.flatnonzero(modified) if isinstance(new_rows, slice) else new_rows[modified]
+
+        if kind != "instance":
+            # Primitives in a group are the shared geometry of its instances, which an update cannot change
+            touched = np.concatenate((
+                after.column("group")[added_rows],
+                after.column("group")[modified_rows],
+                before.column("group")[removed_rows]
+            ))
+            if (touched >= 0).any():
+                diff.rebuild = True
+                return diff
+
+        diff.added[kind] = added_rows
+        diff.modified[kind] = modified_rows
+        removed.append(old_ids[removed_rows])
+
+    diff.removed = np.concatenate(removed)
+    return diff
@@ -0,0 +1,195 @@
+import json
+import struct
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, Tuple, Union
+
+from .scene import Scene
+
+# File layout:
+#   MAGIC | u32 header length | JSON header | padding | array blocks
+# Every array block starts on an ALIGNMENT boundary so it can be memory-mapped in place.
+MAGIC = b"3DEVSCN\0"
+VERSION = 1
+ALIGNMENT = 64
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def _layout(specs: Dict[str, Tuple[Tuple[int, ...], np.dtype]], metadata: Dict) -> Tuple[bytes, Dict, int, int]:
+    # Takes name -> (shape, dtype); returns the file prefix (magic, length, header),
+    # the array entries, where the array blocks start and the total size
+    entries = {}
+    offset = 0
+    for name, (shape, dtype) in specs.items():
+        dtype = np.dtype(dtype)
+        entries[name] = {"dtype": dtype.str, "shape": list(shape), "offset": offset}
+        offset = _align(offset + int(np.prod(shape)) * dtype.itemsize)
+
+    header = json.dumps({"version": VERSION, "arrays": entries, **metadata}).encode()
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    data_start = _align(len(prefix))
+    return prefix, entries, data_start, data_start + offset
+
+def _specs(arrays: Dict[str, np.ndarray]) -> Dict[str, Tuple[Tuple[int, ...], np.dtype]]:
+    for name, array in arrays.items():
+        if not array.flags.c_contiguous:
+            raise ValueError(f"{name} must be C-contiguous")
+    return {name: (array.shape, array.dtype) for name, array in arrays.items()}
+
+def _parse_header(read: Callable[[int], bytes], source: str) -> Tuple[Dict, int]:
+    # Reads the prefix through `read`; returns the header and where the array blocks start
+    if read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{source} is not a 3Dev scene file")
+    (header_length,) = struct.unpack("<I", read(4))
+    header = json.loads(read(header_length))
+
+    if header.pop("version") > VERSION:
+        raise ValueError(f"{source} was written by a newer version of 3Dev")
+    return header, _align(len(MAGIC) + 4 + header_length)
+
+def write_arrays(path: Union[str, Path], arrays: Dict[str, np.ndarray], **metadata) -> None:
+    """
+    Writes named arrays to a scene file straight from their buffers, without copying them.
+
+    Parameters:
+        path (str | Path): Destination file.
+        arrays (Dict[str, np.ndarray]): C-contiguous arrays to store.
+        **metadata: Extra JSON-serialisable header entries (e.g. textures).
+    """
+    prefix, entries, data_start, size = _layout(_specs(arrays), metadata)
+
+    with open(path, "wb") as f:
+        f.write(prefix)
+        for name, array in arrays.items():
+            if not array.nbytes:
+                continue
+            f.seek(data_start + entries[name]["offset"])
+            f.write(memoryview(array).cast("B"))
+        f.truncate(size)
+
+def allocate_arrays(path: Union[str, Path], specs: Dict[str, Tuple[Tuple[int, ...], type]], **metadata) -> None:
+    """
+    Creates a file in the scene file layout whose arrays are all zeros, without
+    writing them: the file is extended to its full size, so it stays sparse until
+    the arrays are filled through read_arrays(path, mode="r+").
+
+    Parameters:
+        path (str | Path): Destination file.
+        specs (Dict[str, Tuple[Tuple[int, ...], type]]): Array name -> (shape, dtype).
+        **metadata: Extra JSON-serialisable header entries.
+    """
+    prefix, _, _, size = _layout(specs, metadata)
+    with open(path, "wb") as f:
+        f.write(prefix)
+        f.truncate(size)
+
+def read_arrays(path: Union[str, Path], mode: str = "r") -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Memory-maps every array in a scene file.
+
+    Parameters:
+        path (str | Path): Scene file to read.
+        mode (str): np.memmap mode; "r" for read-only views, "c" for copy-on-write,
+            "r+" to write through to the file.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Dict]: The arrays and the remaining header entries.
+    """
+    with open(path, "rb") as f:
+        header, data_start = _parse_header(f.read, str(path))
+
+    arrays = {}
+    for name, entry in header.pop("arrays").items():
+        shape = tuple(entry["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=entry["dtype"])
+            continue
+        arrays[name] = np.memmap(
+            path,
+            dtype=entry["dtype"],
+            mode=mode,
+            offset=data_start + entry["offset"],
+            shape=shape
+        )
+    return arrays, header
+
+def dump_arrays(arrays: Dict[str, np.ndarray], **metadata) -> bytearray:
+    """
+    Serialises named arrays to an in-memory scene file, e.g. to send over a socket.
+    The layout is identical to write_arrays().
+    """
+    prefix, entries, data_start, size = _layout(_specs(arrays), metadata)
+    data = bytearray(size)
+    data[:len(prefix)] = prefix
+    for name, array in arrays.items():
+        start = data_start + entries[name]["offset"]
+        data[start:start + array.nbytes] = memoryview(array).cast("B") if array.nbytes else b""
+    return data
+
+def load_arrays(data: Union[bytes, bytearray, memoryview]) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Reads arrays serialised by dump_arrays(). The arrays are views into `data`, not copies.
+    """
+    view = memoryview(data)
+    position = 0
+
+    def read(count: int) -> bytes:
+        nonlocal position
+        chunk = view[position:position + count].tobytes()
+        position += count
+        return chunk
+
+    header, data_start = _parse_header(read, "buffer")
+    arrays = {}
+    for name, entry in header.pop("arrays").items():
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(
+            view, dtype=dtype, count=count, offset=data_start + entry["offset"]
+        ).reshape(shape)
+    return arrays, header
+
+def _scene_metadata(scene: Scene) -> Dict:
+    # The parts of a scene that are not columns, stored in the file header
+    return {
+        "textures": scene.textures,
+        "background": scene.background,
+        "background_intensity": scene.background_intensity
+    }
+
+def _scene(arrays: Dict[str, np.ndarray], header: Dict) -> Scene:
+    return Scene.from_arrays(
+        arrays,
+        header.get("textures", []),
+        header.get("background"),
+        header.get("background_intensity", 1.0)
+    )
+
+def write_scene(scene: Scene, path: Union[str, Path]) -> None:
+    """
+    Saves a scene to disk, writing its column buffers directly.
+    """
+    write_arrays(path, scene.arrays(), **_scene_metadata(scene))
+
+def read_scene(path: Union[str, Path]) -> Scene:
+    """
+    Loads a scene saved by write_scene. Columns are mapped copy-on-write, so the
+    file is only read as pages are touched and edits never reach the file.
+    """
+    arrays, header = read_arrays(path, mode="c")
+    return _scene(arrays, header)
+
+def scene_to_bytes(scene: Scene) -> bytearray:
+    """
+    Serialises a scene in the scene file format, without touching the disk.
+    """
+    return dump_arrays(scene.arrays(), **_scene_metadata(scene))
+
+def scene_from_bytes(data: Union[bytes, bytearray, memoryview]) -> Scene:
+    """
+    Loads a scene serialised by scene_to_bytes(). The columns are views into `data`.
+    """
+    arrays, header = load_arrays(data)
+    return _scene(arrays, header)
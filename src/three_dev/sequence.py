@@ -0,0 +1,228 @@
+"""
+Image sequences along a camera path: turntables orbiting the scene and
+keyframed camera moves, written as numbered images with per-frame statistics.
+
+Frames are independent, so they are spread over worker processes, each of which
+renders whole frames. Only the camera moves between frames, so every worker
+builds the world once (decoding the textures and building the BVH) and renders
+all of its frames from it; a scene file is memory-mapped read-only by every
+worker rather than copied. Frames whose camera repeats an earlier frame's, e.g.
+a hold between two keyframes, are copied instead of rendered again.
+"""
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .scene import Scene
+from .scene_file import read_scene, scene_from_bytes, scene_to_bytes
+from .stats import RenderStats
+from .tonemap import Tonemap
+
+# Replaced by the zero-padded frame number in output patterns, e.g. "frames/turntable_####.png"
+FRAME_PLACEHOLDER = re.compile(r"#+")
+
+@dataclass
+class FrameResult:
+    """
+    One frame of a sequence. seconds is its render time in its worker; a frame
+    copied from an earlier frame with the same camera names it in reused_from,
+    and a frame left as it was by skip_existing has skipped set.
+    """
+    frame: int
+    path: Path
+    camera: Dict
+    seconds: float = 0.0
+    stats: Optional[RenderStats] = None
+    reused_from: Optional[int] = None
+    skipped: bool = False
+
+def turntable(
+    look_from: Sequence[float],
+    look_at: Sequence[float],
+    frames: int,
+    degrees: float = 360.0,
+    up: Sequence[float] = (0.0, 1.0, 0.0)
+) -> List[Dict]:
+    """
+    Orbits the camera around the point it looks at, about the up axis.
+
+    Frames are evenly spaced and the last stops one step short of `degrees`, so a
+    full turn loops without repeating a frame.
+
+    Returns:
+        List[Dict]: look_from and look_at of each frame, to apply on top of the camera settings.
+    """
+    center = np.asarray(look_at, dtype=np.float64)
+    axis = np.asarray(up, dtype=np.float64)
+    axis /= np.linalg.norm(axis)
+    offset = np.asarray(look_from, dtype=np.float64) - center
+
+    path = []
+    for frame in range(frames):
+        angle = math.radians(degrees) * frame / frames
+        # Rodrigues' rotation of the offset about the axis
+        rotated = (
+            offset * math.cos(angle)
+            + np.cross(axis, offset) * math.sin(angle)
+            + axis * np.dot(axis, offset) * (1.0 - math.cos(angle))
+        )
+        path.append({"look_from": (center + rotated).tolist(), "look_at": center.tolist()})
+    return path
+
+def keyframes(keys: Sequence[Dict], frames: Optional[int] = None) -> List[Dict]:
+    """
+    Interpolates camera settings linearly between keyframes.
+
+    Parameters:
+        keys (Sequence[Dict]): Each has a "frame" number and values for the same camera
+            settings, e.g. {"frame": 0, "look_from": [13, 2, 3], "aperture": 0.1}.
+        frames (Optional[int]): Length of the sequence; by default up to the last key.
+            Settings hold their first and last keys' values outside the keys.
+
+    Returns:
+        List[Dict]: The camera settings of each frame.
+
+    Raises:
+        ValueError: If there are no keys or they set different camera settings.
+    """
+    keys = sorted(keys, key=lambda key: key["frame"])
+    if not keys:
+        raise ValueError("a camera path needs at least one keyframe")
+    names = set(keys[0]) - {"frame"}
+    for key in keys:
+        if set(key) - {"frame"} != names:
+            raise ValueError(f"keyframe {key['frame']} sets {sorted(set(key) - {'frame'})}, not {sorted(names)}")
+    if frames is None:
+        frames = int(keys[-1]["frame"]) + 1
+
+    path = []
+    for frame in range(frames):
+        after = next((index for index, key in enumerate(keys) if key["frame"] >= frame), len(keys) - 1)
+        start, end = keys[max(after - 1, 0)], keys[after]
+        span = end["frame"] - start["frame"]
+        t = min(max((frame - start["frame"]) / span, 0.0), 1.0) if span > 0 else 1.0
+        settings = {}
+        for name in names:
+            a, b = np.asarray(start[name], dtype=np.float64), np.asarray(end[name], dtype=np.float64)
+            value = a + (b - a) * t
+            settings[name] = value.tolist()
+            if isinstance(start[name], int) and isinstance(end[name], int):
+                settings[name] = round(settings[name])
+        path.append(settings)
+    return path
+
+def frame_path(pattern: Union[str, Path], frame: int) -> Path:
+    """
+    The file of one frame: the last run of # in the pattern becomes the frame number,
+    zero-padded to its length, or _0000 is added before the suffix if there is none.
+    """
+    pattern = str(pattern)
+    runs = list(FRAME_PLACEHOLDER.finditer(pattern))
+    if not runs:
+        path = Path(pattern)
+        return path.with_name(f"{path.stem}_{frame:04d}{path.suffix}")
+    run = runs[-1]
+    return Path(pattern[:run.start()] + f"{frame:0{run.end() - run.start()}d}" + pattern[run.end():])
+
+# Worker processes -------------------------------------------------------------
+_worker: Dict = {}
+
+def _start_worker(scene: Union[str, bytes], tonemap: Tonemap, stats: bool) -> None:
+    # Runs once per worker: the world is reused for every frame the worker renders
+    from .render import build_world
+
+    loaded = read_scene(scene) if isinstance(scene, str) else scene_from_bytes(scene)
+    _worker.update(scene=loaded, world=build_world(loaded), tonemap=tonemap, stats=stats)
+
+def _render_frame(task: Tuple[int, Dict, str]) -> Tuple[int, float, Optional[Dict]]:
+    from . import _core
+    from .image import write_image
+    from .render import render
+
+    frame, camera, path = task
+    started = time.perf_counter()
+    framebuffer = render(_worker["scene"], _core.Camera(**camera), world=_worker["world"], stats=_worker["stats"])
+    seconds = time.perf_counter() - started
+    write_image(path, framebuffer.to_rgb8(tonemap=_worker["tonemap"]))
+    return frame, seconds, framebuffer.stats.to_dict() if framebuffer.stats is not None else None
+
+def render_sequence(
+    scene: Union[str, Path, Scene],
+    camera: Dict,
+    path: Sequence[Dict],
+    output: Union[str, Path],
+    workers: Optional[int] = None,
+    tonemap: Optional[Tonemap] = None,
+    stats: bool = False,
+    skip_existing: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> List[FrameResult]:
+    """
+    Renders a frame for every step of a camera path, in parallel across processes.
+
+    Parameters:
+        scene (str | Path | Scene): A scene file, which the workers map read-only, or a
+            scene, which is serialised once and sent to each worker.
+        camera (Dict): _core.Camera keyword arguments shared by all frames, e.g. from
+            render.camera_settings(). Every frame uses the same seed, chosen at random if
+            none is given, so the noise does not flicker from frame to frame.
+        path (Sequence[Dict]): Camera settings of each frame, from turntable() or keyframes().
+        output (str | Path): Image file pattern (.png or .ppm); see frame_path().
+        workers (Optional[int]): Worker processes; defaults to the CPU count.
+        tonemap (Optional[Tonemap]): Display settings for every frame.
+        stats (bool): Collect RenderStats for every frame.
+        skip_existing (bool): Leave frames whose image already exists, e.g. to resume a sequence.
+        progress (Optional[Callable[[int, int], None]]): Called with (frames done, frame count).
+
+    Returns:
+        List[FrameResult]: One result per frame, in frame order.
+    """
+    base = dict(camera)
+    if base.get("seed") is None:
+        base["seed"] = random.getrandbits(63)
+
+    results = []
+    first: Dict[str, int] = {}
+    tasks = []
+    for frame, settings in enumerate(path):
+        frame_camera = {**base, **settings}
+        result = FrameResult(frame, frame_path(output, frame), frame_camera)
+        results.append(result)
+        result.path.parent.mkdir(parents=True, exist_ok=True)
+        if skip_existing and result.path.exists():
+            result.skipped = True
+            continue
+        key = json.dumps(frame_camera, sort_keys=True)
+        if key in first:
+            result.reused_from = first[key]
+            continue
+        first[key] = frame
+        tasks.append((frame, frame_camera, str(result.path)))
+
+    done = len(results) - len(tasks)
+    if tasks:
+        source = str(scene) if isinstance(scene, (str, Path)) else bytes(scene_to_bytes(scene))
+        count = min(workers or os.cpu_count() or 1, len(tasks))
+        with multiprocessing.Pool(count, _start_worker, (source, tonemap or Tonemap(), stats)) as pool:
+            for frame, seconds, counters in pool.imap_unordered(_render_frame, tasks):
+                results[frame].seconds = seconds
+                if counters is not None:
+                    results[frame].stats = RenderStats.from_dict(counters)
+                done += 1
+                if progress is not None:
+                    progress(done, len(results))
+
+    for result in results:
+        if result.reused_from is not None:
+            shutil.copyfile(results[result.reused_from].path, result.path)
+    return results
@@ -0,0 +1,95 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Tuple
+
+# (x0, y0, x1, y1, seconds) of a rendered tile
+TileTime = Tuple[int, int, int, int, float]
+
+@dataclass
+class RenderStats:
+    """
+    Ray-tracing counters collected by render(..., stats=True).
+
+    depth_histogram[n] counts camera paths that ended after n bounces (by
+    missing, being absorbed, or, in the last bin, reaching max_depth).
+    scatter_counts maps material kind names to the number of scattering events.
+    shadow_rays are traced towards environment map samples.
+    """
+    primary_rays: int = 0
+    secondary_rays: int = 0
+    shadow_rays: int = 0
+    intersection_tests: int = 0
+    max_depth_hits: int = 0
+    depth_histogram: List[int] = field(default_factory=list)
+    scatter_counts: Dict[str, int] = field(default_factory=dict)
+    tile_times: List[TileTime] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "RenderStats":
+        """
+        Creates stats from the dict returned by _core.render or to_dict().
+        """
+        return cls(
+            primary_rays=int(values["primary_rays"]),
+            secondary_rays=int(values["secondary_rays"]),
+            shadow_rays=int(values.get("shadow_rays", 0)),
+            intersection_tests=int(values["intersection_tests"]),
+            max_depth_hits=int(values["max_depth_hits"]),
+            depth_histogram=list(values["depth_histogram"]),
+            scatter_counts=dict(values["scatter_counts"]),
+            tile_times=[tuple(tile) for tile in values["tile_times"]],
+            seconds=float(values["seconds"])
+        )
+
+    @property
+    def rays(self) -> int:
+        return self.primary_rays + self.secondary_rays + self.shadow_rays
+
+    @property
+    def rays_per_second(self) -> float:
+        return self.rays / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def tests_per_ray(self) -> float:
+        return self.intersection_tests / self.rays if self.rays else 0.0
+
+    def merge(self, other: "RenderStats") -> None:
+        """
+        Adds the counters of another render with the same max_depth, e.g. a separately rendered tile.
+        """
+        self.primary_rays += other.primary_rays
+        self.secondary_rays += other.secondary_rays
+        self.shadow_rays += other.shadow_rays
+        self.intersection_tests += other.intersection_tests
+        self.max_depth_hits += other.max_depth_hits
+        if len(self.depth_histogram) < len(other.depth_histogram):
+            self.depth_histogram.extend([0] * (len(other.depth_histogram) - len(self.depth_histogram)))
+        for depth, count in enumerate(other.depth_histogram):
+            self.depth_histogram[depth] += count
+        for kind, count in other.scatter_counts.items():
+            self.scatter_counts[kind] = self.scatter_counts.get(kind, 0) + count
+        self.tile_times.extend(other.tile_times)
+        self.seconds += other.seconds
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def summary(self) -> str:
+        """
+        Returns a short human-readable report of the headline numbers.
+        """
+        slowest = max((tile[4] for tile in self.tile_times), default=0.0)
+        scatters = ", ".join(f"{kind} {count}" for kind, count in self.scatter_counts.items())
+        return (
+            f"{self.rays} rays ({self.primary_rays} primary, {self.secondary_rays} secondary, "
+            f"{self.shadow_rays} shadow) "
+            f"in {self.seconds:.2f}s, {self.rays_per_second / 1e6:.2f} Mrays/s\n"
+            f"{self.tests_per_ray:.1f} intersection tests per ray, "
+            f"{self.max_depth_hits} paths cut off at max depth\n"
+            f"scatters: {scatters}\n"
+            f"{len(self.tile_times)} tiles, slowest {slowest * 1000:.1f}ms"
+        )
@@ -0,0 +1,169 @@
+"""
+Parameter sweeps: one scene rendered at every combination of some camera
+settings, e.g. three apertures times two focus distances, to compare them.
+
+Camera settings do not touch the world, so its textures and acceleration
+structure are built once and shared by every combination. The tiles of all
+combinations go through one thread pool (the renderer releases the GIL while
+tracing and worlds can be read from several threads at once), queued
+combination by combination so early results finish first and the pool never
+drains between combinations. contact_sheet() lays the results out side by side.
+"""
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .framebuffer import Framebuffer
+from .scene import Scene
+from .stats import RenderStats
+from .tonemap import Tonemap
+
+# Camera settings a sweep is usually over, though any _core.Camera keyword argument works
+SWEEPABLE = ("aperture", "focus_distance", "samples_per_pixel", "image_width")
+
+@dataclass
+class SweepResult:
+    """
+    One combination of a sweep. settings holds the swept values and camera the
+    full camera settings they were rendered with. seconds is the tracing time
+    summed over the combination's tiles, i.e. its cost on one core, which is
+    comparable between combinations even though they render concurrently.
+    """
+    settings: Dict
+    camera: Dict
+    framebuffer: Framebuffer
+    seconds: float = 0.0
+
+def combinations(parameters: Dict[str, Sequence]) -> List[Dict]:
+    """
+    Lists every combination of the parameter values, varying the last parameter fastest.
+    """
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*parameters.values())]
+
+def render_sweep(
+    scene: Scene,
+    camera: Dict,
+    parameters: Dict[str, Sequence],
+    workers: Optional[int] = None,
+    tile_size: int = 32,
+    world=None,
+    stats: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> List[SweepResult]:
+    """
+    Renders a scene at every combination of the given camera settings.
+
+    Parameters:
+        scene (Scene): The scene to render.
+        camera (Dict): _core.Camera keyword arguments shared by all combinations, e.g. from
+            render.camera_settings(). Every combination uses the same seed, chosen at random
+            if none is given, so differences between images come from the settings, not the noise.
+        parameters (Dict[str, Sequence]): Values to try for each swept camera setting.
+        workers (Optional[int]): Threads tracing tiles; defaults to the CPU count.
+        tile_size (int): Edge length of the tiles handed to the threads.
+        world (Optional[_core.World]): A world already built from the scene, to skip building it.
+        stats (bool): Collect RenderStats into each framebuffer.stats.
+        progress (Optional[Callable[[int, int], None]]): Called with (tiles done, tile count).
+
+    Returns:
+        List[SweepResult]: One result per combination, in the order of combinations().
+    """
+    from . import _core
+    from .farm import split_tiles
+    from .render import build_world
+
+    if world is None:
+        world = build_world(scene)
+    base = dict(camera)
+    if base.get("seed") is None:
+        base["seed"] = random.getrandbits(63)
+
+    results, cameras, tiles = [], [], []
+    for settings in combinations(parameters):
+        settings_camera = {**base, **settings}
+        render_camera = _core.Camera(**settings_camera)
+        framebuffer = Framebuffer(render_camera.image_width, render_camera.image_height)
+        if stats:
+            framebuffer.stats = RenderStats()
+        results.append(SweepResult(settings, settings_camera, framebuffer))
+        cameras.append(render_camera)
+        tiles += [(len(results) - 1, tile) for tile in split_tiles(framebuffer.width, framebuffer.height, tile_size)]
+
+    def render_tile(index: int, tile) -> Tuple[float, Optional[Dict]]:
+        # Tiles never overlap, so threads write their windows of a framebuffer directly
+        x0, y0, x1, y1 = tile
+        framebuffer = results[index].framebuffer
+        color = np.empty((y1 - y0, x1 - x0, 3), dtype=np.float64)
+        samples = np.empty((y1 - y0, x1 - x0), dtype=np.uint32)
+        started = time.perf_counter()
+        counters = _core.render_tile(world, cameras[index], tile, color, samples, stats=stats)
+        seconds = time.perf_counter() - started
+        framebuffer.color[y0:y1, x0:x1] = color
+        framebuffer.samples[y0:y1, x0:x1] = samples
+        return seconds, counters
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {pool.submit(render_tile, index, tile): index for index, tile in tiles}
+        for done, future in enumerate(as_completed(futures), 1):
+            result = results[futures[future]]
+            seconds, counters = future.result()
+            result.seconds += seconds
+            if counters is not None:
+                result.framebuffer.stats.merge(RenderStats.from_dict(counters))
+            if progress is not None:
+                progress(done, len(tiles))
+    return results
+
+def contact_sheet(
+    results: Sequence[SweepResult],
+    columns: Optional[int] = None,
+    cell_width: Optional[int] = None,
+    tonemap: Optional[Tonemap] = None,
+    gap: int = 4
+) -> np.ndarray:
+    """
+    Lays sweep results out in a grid, row by row in the order given, as one uint8 RGB image.
+
+    Parameters:
+        results (Sequence[SweepResult]): Results of render_sweep().
+        columns (Optional[int]): Cells per row; by default the number of values of the
+            last swept parameter, so each row varies only that parameter.
+        cell_width (Optional[int]): Width every image is scaled to; by default the narrowest
+            image's, so images rendered at different widths compare at the same size.
+        tonemap (Optional[Tonemap]): Display settings for every image.
+        gap (int): Pixels between cells.
+
+    Returns:
+        np.ndarray: The (height, width, 3) sheet.
+    """
+    if columns is None:
+        last = list(results[0].settings)[-1] if results and results[0].settings else None
+        columns = len({str(result.settings[last]) for result in results}) if last else len(results)
+    columns = max(1, min(columns, len(results)))
+    rows = -(-len(results) // columns)
+    if cell_width is None:
+        cell_width = min(result.framebuffer.width for result in results)
+    cell_height = max(
+        round(cell_width * result.framebuffer.height / result.framebuffer.width) for result in results
+    )
+
+    sheet = np.full((rows * cell_height + (rows + 1) * gap, columns * cell_width + (columns + 1) * gap, 3),
+                    32, dtype=np.uint8)
+    for index, result in enumerate(results):
+        image = result.framebuffer.to_rgb8(tonemap=tonemap)
+        height = round(cell_width * image.shape[0] / image.shape[1])
+        # Nearest-neighbour resampling keeps the noise of each setting visible as rendered
+        ys = np.arange(height) * image.shape[0] // height
+        xs = np.arange(cell_width) * image.shape[1] // cell_width
+        row, column = divmod(index, columns)
+        top = gap + row * (cell_height + gap)
+        left = gap + column * (cell_width + gap)
+        sheet[top:top + height, left:left + cell_width] = image[ys[:, None], xs]
+    return sheet
@@ -0,0 +1,122 @@
+"""
+Display transform from the linear HDR framebuffer to 8-bit pixels: exposure,
+a tonemap operator, gamma and optional dithering.
+
+Everything works on the float accumulation buffer with NumPy, so changing the
+exposure or operator after a render only re-runs this transform, not the tracer.
+Frames are processed in row chunks to bound temporary memory, and the gamma
+curve is a lookup table instead of a per-pixel power.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+CLAMP = "clamp"
+REINHARD = "reinhard"
+ACES = "aces"
+OPERATORS = (CLAMP, REINHARD, ACES)
+
+# Tonemapped values are quantised to 16 bits before the gamma lookup, fine enough
+# that the steep start of the gamma curve does not band in the shadows
+LUT_SIZE = 1 << 16
+
+# 8x8 ordered-dither thresholds in [0, 1)
+BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+], dtype=np.float32) / 64.0
+
+@lru_cache(maxsize=8)
+def _lut(gamma: float, dither: bool) -> np.ndarray:
+    # Without dithering the table holds the final bytes, floor(256 * v^(1/gamma)) as
+    # in save_ppm; with dithering it holds the unquantised level for the threshold to round
+    levels = np.linspace(0.0, 1.0, LUT_SIZE) ** (1.0 / gamma)
+    if dither:
+        return (levels * 255.0).astype(np.float32)
+    return np.minimum(levels * 256.0, 255.0).astype(np.uint8)
+
+@dataclass
+class Tonemap:
+    """
+    Display settings for a framebuffer.
+
+    exposure is in stops. operator is one of OPERATORS: CLAMP clips at white like
+    the renderer's save_ppm, REINHARD is x * (1 + x / white^2) / (1 + x) per channel,
+    and ACES is Narkowicz's fit of the ACES filmic curve. gamma 2 matches save_ppm.
+    """
+    exposure: float = 0.0
+    operator: str = CLAMP
+    gamma: float = 2.0
+    white: float = 4.0
+    dither: bool = False
+    chunk_pixels: int = 1 << 18
+
+    def __post_init__(self) -> None:
+        if self.operator not in OPERATORS:
+            raise ValueError(f"operator must be one of {', '.join(OPERATORS)}")
+
+    def _curve(self, x: np.ndarray) -> np.ndarray:
+        # In place on a scratch chunk; the result is in [0, 1]
+        if self.operator == REINHARD:
+            x *= (1.0 + x / (self.white * self.white)) / (1.0 + x)
+        elif self.operator == ACES:
+            x *= (2.51 * x + 0.03) / (x * (2.43 * x + 0.59) + 0.14)
+        return np.clip(x, 0.0, 1.0, out=x)
+
+    def apply(
+        self,
+        hdr: np.ndarray,
+        out: Optional[np.ndarray] = None,
+        origin: Tuple[int, int] = (0, 0),
+        samples: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Converts a linear (height, width, 3) image to 8-bit.
+
+        Parameters:
+            hdr (np.ndarray): Linear colours, e.g. Framebuffer.mean(), or summed
+                colours when `samples` is given.
+            out (Optional[np.ndarray]): A (height, width, 3) uint8 array or view to write
+                into, e.g. part of a display buffer; allocated if omitted.
+            origin (Tuple[int, int]): (x, y) of hdr's first pixel in the full frame,
+                so the dither pattern lines up across separately converted tiles.
+            samples (Optional[np.ndarray]): (height, width) sample counts to average
+                `hdr` by, chunk by chunk, instead of building the whole mean image first.
+
+        Returns:
+            np.ndarray: out.
+        """
+        height, width = hdr.shape[:2]
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        lut = _lut(float(self.gamma), self.dither)
+        scale = np.float32(2.0 ** self.exposure)
+        rows = max(1, self.chunk_pixels // max(width, 1))
+
+        for y0 in range(0, height, rows):
+            y1 = min(y0 + rows, height)
+            # float32 scratch: halves the memory traffic and is ample for 16-bit quantisation
+            chunk = np.multiply(hdr[y0:y1], scale, dtype=np.float32)
+            if samples is not None:
+                weights = np.maximum(samples[y0:y1], 1).astype(np.float32)
+                chunk /= weights[..., None]
+            self._curve(chunk)
+            chunk *= LUT_SIZE - 1
+            index = chunk.astype(np.uint16)
+            if not self.dither:
+                np.take(lut, index, out=out[y0:y1])
+                continue
+
+            ys = (np.arange(y0, y1) + origin[1]) % 8
+            xs = (np.arange(width) + origin[0]) % 8
+            levels = lut[index] + BAYER[ys[:, None], xs][..., None]
+            out[y0:y1] = np.minimum(levels, 255.0).astype(np.uint8)
+        return out